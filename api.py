@@ -1,15 +1,25 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from contextlib import AsyncExitStack
+import asyncio
+import time
 import uvicorn
+import json
 import os
 
-from src.loader import LogLoader
-from src.vector_store import VectorStoreManager
-from src.model import BugAnalyzer
-from src.evaluator import RAGASEvaluator
+from src.evaluator import EvaluationWorker
 from src.history import HistoryManager
-from src.inspector import DatabaseInspector
+from src.concurrency import AnalysisPool, PoolSaturatedError
+from src.analysis_cache import AnalysisCache
+from src.reasoning import ReasoningSplitter
+from src.registry import registry, get_embeddings, get_feedback_prior
+from src.sync import IndexSyncManager
+from src.telemetry import metrics as telemetry, span, trace_request
+from src.config import MODEL_WARMUP, BATCH_LLM_CONCURRENCY, API_WORKERS, CHROMA_HOST, MODEL_SERVER_URL
+from src.batch import parse_failures, group_failures
 
 # Data Models
 class AnalysisRequest(BaseModel):
@@ -17,9 +27,15 @@ class AnalysisRequest(BaseModel):
 
 class AnalysisResponse(BaseModel):
     result: str
-    metrics: Dict[str, float]
+    metrics: Dict[str, Optional[float]] # None while the evaluation is pending
     context: List[str]
     analysis_id: Optional[int] = None
+    cached: bool = False
+
+class BatchRequest(BaseModel):
+    report: Optional[str] = None # JUnit XML, pytest JSON report or JSONL content
+    filename: str = ""
+    failures: Optional[List[str]] = None # Or plain error logs
 
 class FeedbackRequest(BaseModel):
     analysis_id: int
@@ -29,91 +45,450 @@ class FeedbackRequest(BaseModel):
 app = FastAPI(title="Smart Error Debugger API", version="1.0.0")
 
 class AppState:
-    analyzer: Optional[BugAnalyzer] = None
     history: Optional[HistoryManager] = None
-    evaluator: Optional[RAGASEvaluator] = None
-    inspector: Optional[DatabaseInspector] = None
+    evaluation: Optional[EvaluationWorker] = None
+    cache: Optional[AnalysisCache] = None
 
 state = AppState()
+pool = AnalysisPool()
+# Owns the served index generation (analyzer + retrievers) and swaps it atomically on /sync
+syncer = IndexSyncManager()
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request, exc: PoolSaturatedError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 def initialize_system():
     print("Initializing System Components...")
-    loader = LogLoader()
-    chunks = loader.load()
-    
-    vs_manager = VectorStoreManager()
-    vectorstore = vs_manager.get_vectorstore(chunks if chunks else None)
-    
-    state.analyzer = BugAnalyzer(vectorstore, chunks=chunks)
+    # Components that do not depend on the index are built once; the index itself is
+    # (re)built by the syncer, only new/changed sources are embedded
+    state.cache = AnalysisCache(embed_fn=get_embeddings().embed_query)
+    syncer.cache = state.cache
     state.history = HistoryManager()
-    state.evaluator = RAGASEvaluator()
-    state.inspector = DatabaseInspector()
+    # Quality scoring runs in the background, requests never wait for the judge model
+    state.evaluation = EvaluationWorker(state.history).start()
+    telemetry.register_collector(_collect_metrics)
+    _check_workers()
+    syncer.run()
+    # Other workers of the node may sync later: follow the generations they publish
+    syncer.watch()
     print("System Ready.")
 
+def _check_workers():
+    # Each process would open the local Chroma directory with its own client and cache,
+    # and never see the collections another worker builds
+    if API_WORKERS > 1 and not CHROMA_HOST:
+        raise RuntimeError("API_WORKERS > 1 requires a Chroma server: set CHROMA_HOST (and CHROMA_PORT).")
+
 @app.on_event("startup")
 async def startup_event():
+    if MODEL_WARMUP:
+        # Pay the model load before the first request instead of during it
+        registry.warm_up()
     initialize_system()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    pool.shutdown()
+    if state.evaluation:
+        state.evaluation.stop()
+    if state.history:
+        state.history.close()
+
+def _collect_metrics():
+    """Scrape-time values owned by other components, see /metrics."""
+    samples = []
+    pool_status = pool.status()
+    samples.append(("sed_pool_running", "gauge", "Analyses holding a pool slot", {}, pool_status["running"]))
+    samples.append(("sed_pool_queued", "gauge", "Analyses waiting for a pool slot", {}, pool_status["queued"]))
+    if state.cache:
+        cache_stats = state.cache.stats()
+        samples.append(("sed_analysis_cache_hits_total", "counter", "Analysis cache hits", {}, cache_stats["hits"]))
+        samples.append(("sed_analysis_cache_misses_total", "counter", "Analysis cache misses", {}, cache_stats["misses"]))
+        samples.append(("sed_analysis_cache_hit_ratio", "gauge", "Analysis cache hit rate", {}, cache_stats["hit_rate"]))
+    if registry.stats().get("embeddings", {}).get("loaded"):
+        embedding_stats = get_embeddings().stats()
+        samples.append(("sed_embedding_cache_hit_ratio", "gauge", "Embedding cache hit rate", {}, embedding_stats["cache_hit_rate"]))
+        samples.append(("sed_embedded_chunks_total", "counter", "Chunks embedded", {}, embedding_stats["embedded"]))
+    if state.evaluation:
+        samples.append(("sed_evaluations_pending", "gauge", "Analyses waiting for evaluation", {},
+                        state.history.count_pending_evaluations()))
+        samples.append(("sed_evaluations_total", "counter", "Evaluations by outcome", {"status": "evaluated"}, state.evaluation.evaluated))
+        samples.append(("sed_evaluations_total", "counter", "Evaluations by outcome", {"status": "failed"}, state.evaluation.failed))
+    generation = syncer.current
+    if generation:
+        factory = generation.analyzer.retriever_factory
+        samples.append(("sed_index_generation", "gauge", "Index generation being served", {}, generation.number))
+        samples.append(("sed_generation_active_requests", "gauge", "Requests pinned to the current generation", {}, generation.active))
+        samples.append(("sed_index_chunks", "gauge", "Indexed chunks", {"index": "vector"}, factory.vectorstore._collection.count()))
+        keyword_index = getattr(factory.keyword_retriever, "index", None)
+        if keyword_index is not None:
+            samples.append(("sed_index_chunks", "gauge", "Indexed chunks", {"index": "keyword"}, keyword_index.count()))
+        if factory.reranker:
+            rerank_stats = factory.reranker.stats()
+            samples.append(("sed_rerank_cache_hits_total", "counter", "Reranker score cache hits", {}, rerank_stats["cache_hits"]))
+            samples.append(("sed_rerank_cache_misses_total", "counter", "Reranker score cache misses", {}, rerank_stats["cache_misses"]))
+            samples.append(("sed_rerank_skipped_total", "counter", "Reranks skipped on a clear winner", {}, rerank_stats["skipped"]))
+    return samples
+
+def _current_generation():
+    """The index generation new requests run on."""
+    generation = syncer.current
+    if generation is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    return generation
+
+async def _remember(generation, error_log, result, context_text, metrics, chunk_ids=None):
+    """Caches an analysis, unless it was built on a generation that has been swapped out meanwhile."""
+    if generation is syncer.current:
+        await run_in_threadpool(state.cache.put, error_log, result, context_text, metrics, chunk_ids)
+
+def _chunk_ids(docs):
+    return [d.metadata.get("chunk_id") for d in docs if d.metadata.get("chunk_id")]
+
+# Metrics of an analysis whose evaluation is queued
+PENDING_METRICS = {"faithfulness": None, "relevancy": None}
+
+async def _save_history(error_log, result, metrics, context_text, started=None, cached=False, chunk_ids=None):
+    """
+    Saves an analysis to SQLite (through the batching writer) and returns its id.
+    Unscored analyses are picked up by the evaluation worker.
+    """
+    metrics = metrics or PENDING_METRICS
+    # A cache hit replays an answer that was already queued for evaluation when it was generated
+    evaluate = not cached
+    with span("history_write"):
+        analysis_id = await asyncio.wrap_future(state.history.enqueue_analysis(
+            error_log, 
+            result, 
+            metrics['faithfulness'], 
+            metrics['relevancy'], 
+            context_text,
+            latency_ms=(time.perf_counter() - started) * 1000 if started else None,
+            cached=cached,
+            evaluate=evaluate,
+            chunk_ids=chunk_ids
+        ))
+    if evaluate and metrics["faithfulness"] is None:
+        state.evaluation.notify()
+    return analysis_id
+
+async def _cache_lookup(error_log):
+    with span("cache_lookup"):
+        return await run_in_threadpool(state.cache.get, error_log)
+
 @app.post("/analyze", response_model=AnalysisResponse)
 async def analyze_error(request: AnalysisRequest):
-    if not state.analyzer:
-        raise HTTPException(status_code=503, detail="System not initialized")
-    
-    # 1. Retrieve
-    # We invoke the retriever created by AdvancedRetrieverFactory inside BugAnalyzer
-    docs = state.analyzer.qa_chain.retriever.invoke(request.error_log)
-    context_text = [d.page_content for d in docs]
-    
-    # 2. Generate (Optimized: using combine_documents_chain directly)
-    # This matches the optimization done in ui.py to avoid calling Reranker twice
-    raw_response = state.analyzer.qa_chain.combine_documents_chain.invoke({
-        "input_documents": docs,
-        "question": request.error_log
-    })
-    result = raw_response.get("output_text", raw_response) if isinstance(raw_response, dict) else raw_response
-    
-    # 3. Evaluate
-    metrics = state.evaluator.evaluate_response(request.error_log, result, context_text)
+    with trace_request("analyze"):
+        return await _analyze(request)
+
+async def _analyze(request):
+    started = time.perf_counter()
+    generation = _current_generation()
     
-    # 4. Save History
-    # We save to SQLite
-    state.history.save_analysis(
-        request.error_log, 
-        result, 
-        metrics['faithfulness'], 
-        metrics['relevancy'], 
-        context_text
-    )
+    # 0. Recurring errors skip retrieval and generation entirely
+    cached = await _cache_lookup(request.error_log)
+    if cached:
+        result, context_text, metrics = cached["result"], cached["context"], cached["metrics"] or PENDING_METRICS
+        chunk_ids = cached["chunk_ids"]
+    else:
+        # The request finishes on the generation it started on, even if /sync swaps it meanwhile
+        async with pool.admit():
+            with generation.use():
+                # 1. Retrieve
+                # We invoke the retriever created by AdvancedRetrieverFactory inside BugAnalyzer
+                docs = await pool.run("retrieval", generation.analyzer.retrieve, request.error_log)
+                context_text = [d.page_content for d in docs]
+                chunk_ids = _chunk_ids(docs)
+                
+                # 2. Generate (Optimized: reuses the retrieved docs instead of re-running the chain)
+                result = await pool.run("generation", generation.analyzer.generate, request.error_log, docs)
+        metrics = PENDING_METRICS
+        await _remember(generation, request.error_log, result, context_text, {}, chunk_ids)
     
-    # Get ID of inserted item (simple approach for MVP)
-    latest = state.history.get_history(limit=1)
-    analysis_id = latest[0]['id'] if latest else None
+    # 3. Save History (quality is evaluated in the background, see EvaluationWorker)
+    analysis_id = await _save_history(request.error_log, result, metrics, context_text, started, bool(cached), chunk_ids)
     
     return AnalysisResponse(
         result=result,
         metrics=metrics,
         context=context_text,
-        analysis_id=analysis_id
+        analysis_id=analysis_id,
+        cached=bool(cached)
     )
 
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Streams a body that holds an admission slot (and a pinned index generation). The slot is
+    released however the response ends, even if the client disconnects before the body starts.
+    """
+    def __init__(self, content, slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Runs the body's own cleanup first (a body that never started has none)
+            await self.body_iterator.aclose()
+            await self.slot.aclose()
+
+def _sse(event, data):
+    """Formats a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _cached_event_stream(error_log, cached, started):
+    """Replays a cached analysis with the same event types as a live one."""
+    with trace_request("analyze_stream"):
+        async for event in _replay_cached(error_log, cached, started):
+            yield event
+
+async def _replay_cached(error_log, cached, started):
+    yield _sse("context", [{"content": text, "source": None, "type": None} for text in cached["context"]])
+    splitter = ReasoningSplitter()
+    for event, text in splitter.feed(cached["result"]) + splitter.flush():
+        yield _sse(event, {"text": text})
+
+    metrics = cached["metrics"] or PENDING_METRICS
+    analysis_id = await _save_history(error_log, cached["result"], metrics, cached["context"], started, cached=True,
+                                      chunk_ids=cached["chunk_ids"])
+    yield _sse("done", {"metrics": metrics, "analysis_id": analysis_id, "cached": True})
+
+@app.post("/analyze/stream")
+async def analyze_error_stream(request: AnalysisRequest):
+    """
+    Same pipeline as /analyze, streamed over SSE:
+    `context` first, `prompt` (estimated prompt tokens and context packing stats), then
+    `reasoning` and `answer` tokens, and `done` with metrics and id.
+    """
+    started = time.perf_counter()
+    generation = _current_generation()
+
+    cached = await _cache_lookup(request.error_log)
+    if cached:
+        return StreamingResponse(_cached_event_stream(request.error_log, cached, started), media_type="text/event-stream")
+
+    # Admission happens before the response starts so saturation is still a proper 429/503
+    slot = AsyncExitStack()
+    await slot.enter_async_context(pool.admit())
+    slot.enter_context(generation.use())
+    analyzer = generation.analyzer
+
+    async def event_stream():
+        tokens = None
+        # The request is traced while its body streams
+        trace = trace_request("analyze_stream")
+        trace.__enter__()
+        try:
+            docs = await pool.run("retrieval", analyzer.retrieve, request.error_log)
+            context_text = [d.page_content for d in docs]
+            # The whole generation runs on one generation thread and hands events back as they come
+            tokens = pool.iterate("generation", analyzer.stream(request.error_log, docs))
+
+            parts = {"reasoning": [], "answer": []}
+            async for event, data in tokens:
+                if event == "context":
+                    yield _sse("context", [
+                        {"content": d.page_content, "source": d.metadata.get("source"), "type": d.metadata.get("type")}
+                        for d in data
+                    ])
+                elif event == "prompt":
+                    yield _sse("prompt", data)
+                else:
+                    parts[event].append(data)
+                    yield _sse(event, {"text": data})
+
+            result = analyzer.join_output("".join(parts["reasoning"]), "".join(parts["answer"]))
+            metrics = PENDING_METRICS
+            chunk_ids = _chunk_ids(docs)
+            await _remember(generation, request.error_log, result, context_text, {}, chunk_ids)
+            analysis_id = await _save_history(request.error_log, result, metrics, context_text, started,
+                                              chunk_ids=chunk_ids)
+            yield _sse("done", {"metrics": metrics, "analysis_id": analysis_id})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            if tokens is not None:
+                # Stops the generation thread, which closes the Ollama HTTP stream (client disconnects included)
+                await tokens.aclose()
+            trace.__exit__(None, None, None)
+
+    return AdmittedStreamingResponse(event_stream(), slot, media_type="text/event-stream")
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchRequest):
+    """
+    Analyzes a whole CI run. Failures are deduped by normalized signature, retrieved in one
+    batched pass and generated with bounded concurrency. Results are streamed as NDJSON,
+    one line per unique failure (with the names of every test that hit it), as they finish.
+    """
+    generation = _current_generation()
+    try:
+        failures = parse_failures(request.report, request.filename) if request.report else []
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse report: {e}")
+    failures += [{"name": f"failure-{i}", "error_log": e} for i, e in enumerate(request.failures or [])]
+    if not failures:
+        raise HTTPException(status_code=400, detail="No failures found")
+    groups = list(group_failures(failures).values())
+
+    slot = AsyncExitStack()
+    await slot.enter_async_context(pool.admit())
+    slot.enter_context(generation.use())
+    analyzer = generation.analyzer
+
+    def line(data):
+        return json.dumps(data, ensure_ascii=False) + "\n"
+
+    # The request's own slot covers one generation; each concurrent one takes another pool slot
+    own_slot = asyncio.Lock()
+
+    async def generate_one(group, docs, limit):
+        async with limit, AsyncExitStack() as held:
+            try:
+                if own_slot.locked():
+                    try:
+                        await held.enter_async_context(pool.admit())
+                    except PoolSaturatedError:
+                        await held.enter_async_context(own_slot)  # No spare slot: wait for the request's own
+                else:
+                    await held.enter_async_context(own_slot)
+                result = await pool.run("generation", analyzer.generate, group["error_log"], docs, "batch")
+                context_text = [d.page_content for d in docs]
+                return group, result, context_text, _chunk_ids(docs), None
+            except Exception as e:
+                return group, None, [], None, str(e)
+
+    async def results():
+        tasks = []
+        trace = trace_request("analyze_batch")
+        trace.__enter__()
+        try:
+            yield line({"event": "summary", "failures": len(failures), "unique": len(groups)})
+
+            pending = []
+            for group in groups:
+                cached = await _cache_lookup(group["error_log"])
+                if not cached:
+                    pending.append(group)
+                    continue
+                analysis_id = await _save_history(group["error_log"], cached["result"], cached["metrics"], cached["context"],
+                                                  cached=True, chunk_ids=cached["chunk_ids"])
+                yield line(dict(group, event="result", result=cached["result"], context=cached["context"],
+                                metrics=cached["metrics"], analysis_id=analysis_id, cached=True))
+
+            if pending:
+                all_docs = await pool.run("retrieval", analyzer.retriever_factory.retrieve_batch, [g["error_log"] for g in pending])
+                limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+                tasks = [asyncio.create_task(generate_one(g, docs, limit)) for g, docs in zip(pending, all_docs)]
+                for next_done in asyncio.as_completed(tasks):
+                    group, result, context_text, chunk_ids, error = await next_done
+                    if error:
+                        yield line(dict(group, event="error", detail=error))
+                        continue
+                    metrics = PENDING_METRICS
+                    await _remember(generation, group["error_log"], result, context_text, {}, chunk_ids)
+                    analysis_id = await _save_history(group["error_log"], result, metrics, context_text,
+                                                      chunk_ids=chunk_ids)
+                    yield line(dict(group, event="result", result=result, context=context_text,
+                                    metrics=metrics, analysis_id=analysis_id, cached=False))
+            yield line({"event": "done"})
+        finally:
+            for task in tasks:
+                task.cancel()
+            trace.__exit__(None, None, None)
+
+    return AdmittedStreamingResponse(results(), slot, media_type="application/x-ndjson")
+
+@app.post("/feedback")
+def submit_feedback(request: FeedbackRequest):
+    """
+    Rates an analysis. The rating is credited to the chunks it was built on, which then
+    rank higher (or lower) in the first-stage fusion of later retrievals.
+    """
+    if request.rating not in (1, -1):
+        raise HTTPException(status_code=400, detail="rating must be 1 or -1")
+    chunks = state.history.save_feedback(request.analysis_id, request.rating)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    get_feedback_prior().invalidate()
+    return {"analysis_id": request.analysis_id, "rating": request.rating, "chunks": chunks}
+
 @app.post("/sync")
-async def sync_data(background_tasks: BackgroundTasks):
-    """Triggers a full system reload to ingest new data."""
-    # Run in background to not block the request
-    background_tasks.add_task(initialize_system)
+async def sync_data():
+    """
+    Ingests new data in the background. Requests keep being served by the current index
+    generation until the new one is fully built and swapped in.
+    """
+    if not syncer.start():
+        return {"status": "Synchronization already running", "sync": syncer.status()}
     return {"status": "Synchronization started in background"}
 
+@app.get("/sync/status")
+async def sync_status():
+    """Progress of the running sync, and counts and timings of the last finished one."""
+    return syncer.status()
+
+# Plain `def` endpoints run on FastAPI's threadpool, so SQLite never blocks the event loop
 @app.get("/history")
-async def get_history(limit: int = 50):
-    return state.history.get_history(limit=limit)
+def get_history(limit: int = 50, before: Optional[int] = None, details: bool = False):
+    """Latest analyses; pass the last id received as `before` for the next page, `details` for answers and context."""
+    return state.history.get_history(limit=limit, before=before, include_details=details)
+
+@app.get("/history/{analysis_id}")
+def get_analysis(analysis_id: int):
+    item = state.history.get_analysis(analysis_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return item
+
+@app.get("/index/stats")
+def get_index_stats():
+    """Indexed chunks in total and per source/type (chunks and bytes), without loading the collection."""
+    inspector = _current_generation().inspector
+    return {"chunks": inspector.count(), "sources": inspector.source_stats()}
+
+@app.get("/index/chunks")
+def browse_index(offset: int = 0, limit: int = Query(20, le=500), source: Optional[str] = None,
+                 doc_type: Optional[str] = Query(None, alias="type")):
+    """One page of indexed chunks, optionally filtered by `source` and `type`."""
+    return _current_generation().inspector.browse(offset=offset, limit=limit, source=source, doc_type=doc_type)
 
 @app.get("/stats")
-async def get_stats():
+def get_stats():
     return state.history.get_stats()
 
+@app.get("/stats/timeseries")
+def get_stats_timeseries(bucket: str = "day", start: Optional[str] = None, end: Optional[str] = None):
+    """Pre-aggregated hourly/daily quality, latency and cache-hit trends (ISO `start`/`end`)."""
+    try:
+        return state.history.get_timeseries(bucket=bucket, start=start, end=end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/health")
 async def health_check():
-    return {"status": "active", "model": "DeepSeek-R1"}
+    reranker = syncer.current.analyzer.retriever_factory.reranker if syncer.current else None
+    return {
+        "status": "active", "model": "DeepSeek-R1", "worker": os.getpid(), "model_server": MODEL_SERVER_URL,
+        "pool": pool.status(), "models": registry.stats(),
+        "evaluation": await run_in_threadpool(state.evaluation.stats) if state.evaluation else None,
+        "generation": syncer.current.number if syncer.current else None,
+        "reranker": reranker.stats() if reranker else None,
+    }
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus exposition: per-stage and per-endpoint latency histograms, in-flight requests,
+    queue depth, cache hit rates, index sizes and LLM token counts."""
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    _check_workers()
+    # Workers share the on-disk indexes and, with MODEL_SERVER_URL, one copy of the models
+    uvicorn.run("api:app" if API_WORKERS > 1 else app, host="0.0.0.0", port=8000, workers=API_WORKERS)
@@ -1,36 +1,63 @@
 import sys
-from src.loader import LogLoader
-from src.vector_store import VectorStoreManager
-from src.model import BugAnalyzer
+import json
+import argparse
+from src.registry import get_embeddings
+from src.sync import IndexSyncManager
+from src.analysis_cache import AnalysisCache
+from src.batch import parse_failures, analyze_batch
 from src.config import DATA_PATH
 
+def run_batch(analyzer, report_path, output_path=None):
+    """Analyzes every failure of a JUnit/pytest report or JSONL file, one unique signature at a time."""
+    with open(report_path, "r", encoding="utf-8") as f:
+        failures = parse_failures(f.read(), report_path)
+    print(f"\n{len(failures)} failures found in {report_path}.")
+
+    output = open(output_path, "w", encoding="utf-8") if output_path else None
+    try:
+        for i, result in enumerate(analyze_batch(analyzer, failures), start=1):
+            print(f"\n--- [{i}] {result['names'][0]} (+{len(result['names']) - 1} similar)"
+                  + (" (cached)" if result.get("cached") else "") + " ---")
+            print(result["result"] if result.get("result") else f"Error during analysis: {result.get('error')}")
+            if output:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+    finally:
+        if output:
+            output.close()
+
 def main():
+    parser = argparse.ArgumentParser(description="Smart Error Debugger")
+    parser.add_argument("--batch", metavar="REPORT", help="JUnit XML, pytest JSON report or JSONL of failures to analyze")
+    parser.add_argument("--output", metavar="JSONL", help="Where to write the batch results")
+    args = parser.parse_args()
+
     print("--- Smart Error Debugger Initializing ---")
     
-    # 1. Load and process logs
-    loader = LogLoader()
-    chunks = loader.load()
-    
-    if not chunks:
-        print(f"No logs found in {DATA_PATH}. Please add .log or .json files.")
-        # If we have no logs and no DB, we can't proceed with RAG properly, 
-        # but for now let's just warn.
-    
-    # 2. Get Vector Store
-    vs_manager = VectorStoreManager()
+    # 1. Load, process and index logs (incremental: only new/changed sources), then
+    # 2. setup the analyzer on the resulting index generation (with the shared analysis
+    #    cache, invalidated when the index changed)
+    syncer = IndexSyncManager(cache=AnalysisCache(embed_fn=get_embeddings().embed_query))
     try:
-        vectorstore = vs_manager.get_vectorstore(chunks if chunks else None)
+        report = syncer.run()
+        
+        if not report["added"] and not report["updated"] and not report["unchanged"]:
+            print(f"No logs found in {DATA_PATH}. Please add .log or .json files.")
+            # If we have no logs and no DB, we can't proceed with RAG properly, 
+            # but for now let's just warn.
         
         # Show a quick summary of what's inside
-        from src.inspector import DatabaseInspector
-        inspector = DatabaseInspector()
-        inspector.inspect(limit=0) # limit=0 runs only the header/total
+        syncer.current.inspector.inspect(limit=0) # limit=0 runs only the header/total (a count, no chunks are read)
     except Exception as e:
         print(f"Error initializing Vector Store: {e}")
         return
+    # Follow the generations a running API or UI publishes meanwhile
+    syncer.watch()
 
-    # 3. Setup Analyzer
-    analyzer = BugAnalyzer(vectorstore)
+    if args.batch:
+        with syncer.current.use() as generation:
+            run_batch(generation.analyzer, args.batch, args.output)
+        return
     
     print("\n--- IA DEBUGGING SYSTEM READY ---")
     print("Type 'salir' to exit.")
@@ -44,8 +71,9 @@ def main():
         
         print("\nAnalyzing with AI...")
         try:
-            response = analyzer.analyze(query)
-            print("\n--- AI ANALYSIS REPORT ---")
+            with syncer.current.use() as generation:
+                response = generation.analyzer.analyze(query)
+            print("\n--- AI ANALYSIS REPORT ---" + (" (cached)" if response.get("cached") else ""))
             print(response["result"])
         except Exception as e:
             print(f"Error during analysis: {e}")
@@ -0,0 +1,156 @@
+import sqlite3
+import json
+import time
+import threading
+import numpy as np
+from src.fingerprint import normalize_error, fingerprint
+from src.config import HISTORY_DB_PATH, ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_TTL
+from src.config import ANALYSIS_CACHE_SIMILARITY
+
+class AnalysisCache:
+    """
+    Bounded LRU/TTL cache of finished analyses keyed by the error fingerprint.
+    Lives in its own table next to the history (same SQLite file), so it survives restarts.
+    Optionally, when `embed_fn` is given and `similarity` > 0, a miss falls back to a
+    near-duplicate lookup over the embeddings of the cached (normalized) errors.
+    """
+    def __init__(self, db_path=HISTORY_DB_PATH, embed_fn=None, max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+                 ttl=ANALYSIS_CACHE_TTL, similarity=ANALYSIS_CACHE_SIMILARITY):
+        self.db_path = db_path
+        self.embed_fn = embed_fn if similarity > 0 else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        # get/put run on several worker threads at once
+        self._stats_lock = threading.Lock()
+        # In-memory copy of the cached embeddings for the near-duplicate search
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._matrix_keys = []
+        self._init_db()
+
+    def _init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    fingerprint TEXT PRIMARY KEY,
+                    normalized TEXT,
+                    result TEXT,
+                    context TEXT,
+                    metrics TEXT,
+                    embedding BLOB,
+                    created_at REAL,
+                    last_hit REAL,
+                    hits INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_hit ON analysis_cache(last_hit)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(analysis_cache)")}
+            if "chunk_ids" not in columns:
+                conn.execute("ALTER TABLE analysis_cache ADD COLUMN chunk_ids TEXT")
+            conn.commit()
+
+    def _lookup(self, conn, key):
+        row = conn.execute("""
+            SELECT result, context, metrics, created_at, chunk_ids FROM analysis_cache WHERE fingerprint = ?
+        """, (key,)).fetchone()
+        if not row:
+            return None
+        result, context, metrics, created_at, chunk_ids = row
+        if self.ttl and time.time() - created_at > self.ttl:
+            conn.execute("DELETE FROM analysis_cache WHERE fingerprint = ?", (key,))
+            self._reset_matrix()
+            return None
+        conn.execute("UPDATE analysis_cache SET last_hit = ?, hits = hits + 1 WHERE fingerprint = ?",
+                     (time.time(), key))
+        return {"result": result, "context": json.loads(context), "metrics": json.loads(metrics), "fingerprint": key,
+                "chunk_ids": json.loads(chunk_ids) if chunk_ids else []}
+
+    def _nearest(self, conn, vector):
+        """Returns the fingerprint of the most similar cached error above the threshold."""
+        with self._lock:
+            if self._matrix is None:
+                rows = conn.execute(
+                    "SELECT fingerprint, embedding FROM analysis_cache WHERE embedding IS NOT NULL"
+                ).fetchall()
+                self._matrix_keys = [key for key, _ in rows]
+                self._matrix = (np.vstack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+                                if rows else np.zeros((0, 0), dtype=np.float32))
+            matrix, keys = self._matrix, self._matrix_keys
+        if not keys:
+            return None
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity else None
+
+    def _reset_matrix(self):
+        # Under the rebuild lock: a rebuild in progress finishes first, then is dropped
+        with self._lock:
+            self._matrix = None
+            self._matrix_keys = []
+
+    def _embed(self, normalized):
+        vector = np.asarray(self.embed_fn(normalized), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, error_log):
+        """Returns the cached analysis ({result, context, metrics, chunk_ids, fingerprint, match}) or None."""
+        normalized = normalize_error(error_log)
+        key = fingerprint(error_log)
+        with sqlite3.connect(self.db_path) as conn:
+            cached = self._lookup(conn, key)
+            if cached:
+                cached["match"] = "exact"
+            elif self.embed_fn:
+                near_key = self._nearest(conn, self._embed(normalized))
+                cached = self._lookup(conn, near_key) if near_key else None
+                if cached:
+                    cached["match"] = "similar"
+            conn.commit()
+
+        with self._stats_lock:
+            if cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached
+
+    def put(self, error_log, result, context, metrics, chunk_ids=None):
+        normalized = normalize_error(error_log)
+        embedding = self._embed(normalized).tobytes() if self.embed_fn else None
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO analysis_cache
+                (fingerprint, normalized, result, context, metrics, embedding, created_at, last_hit, hits, chunk_ids)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            """, (fingerprint(error_log), normalized, result, json.dumps(context), json.dumps(metrics),
+                  embedding, now, now, json.dumps(chunk_ids) if chunk_ids else None))
+            # Evict least recently used entries beyond the bound
+            conn.execute("""
+                DELETE FROM analysis_cache WHERE fingerprint IN (
+                    SELECT fingerprint FROM analysis_cache ORDER BY last_hit DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            conn.commit()
+        self._reset_matrix()
+
+    def refresh(self):
+        """Drops the in-memory copy of the cached embeddings (the table was changed by another process)."""
+        self._reset_matrix()
+
+    def invalidate(self):
+        """Drops every cached analysis (the index changed, answers may be stale)."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM analysis_cache")
+            conn.commit()
+        self._reset_matrix()
+        print("Analysis cache invalidated.")
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
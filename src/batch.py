@@ -0,0 +1,110 @@
+import json
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.fingerprint import fingerprint
+from src.config import BATCH_LLM_CONCURRENCY
+
+def _parse_junit(content):
+    """JUnit XML (also produced by `pytest --junitxml`): one failure per failed/errored testcase."""
+    failures = []
+    root = ET.fromstring(content)
+    for case in root.iter("testcase"):
+        for tag in ("failure", "error"):
+            node = case.find(tag)
+            if node is None:
+                continue
+            name = ".".join(filter(None, [case.get("classname"), case.get("name")]))
+            text = "\n".join(filter(None, [node.get("message"), (node.text or "").strip()]))
+            failures.append({"name": name, "error_log": text or tag})
+            break
+    return failures
+
+def _parse_pytest_json(data):
+    """pytest-json-report output: tests with a failed outcome and their longrepr."""
+    failures = []
+    for test in data.get("tests", []):
+        if test.get("outcome") not in ("failed", "error"):
+            continue
+        for stage in ("setup", "call", "teardown"):
+            report = test.get(stage) or {}
+            if report.get("outcome") == "failed":
+                crash = report.get("crash") or {}
+                text = report.get("longrepr") or crash.get("message") or ""
+                failures.append({"name": test.get("nodeid", ""), "error_log": text})
+                break
+    return failures
+
+def _failure_from_record(record, index):
+    """A JSONL record: either `error_log` or the error_message/stack_trace fields of our JSON data."""
+    if isinstance(record, str):
+        return {"name": f"failure-{index}", "error_log": record}
+    text = record.get("error_log") or "\n".join(
+        filter(None, [record.get("error_message"), record.get("stack_trace")])
+    )
+    return {"name": record.get("name") or record.get("test") or f"failure-{index}", "error_log": text}
+
+def parse_failures(content, filename=""):
+    """Parses a JUnit XML report, a pytest JSON report or a JSONL file of failures."""
+    content = content.strip()
+    if filename.endswith(".xml") or content.startswith("<"):
+        failures = _parse_junit(content)
+    elif filename.endswith(".jsonl"):
+        failures = [_failure_from_record(json.loads(line), i) for i, line in enumerate(content.splitlines()) if line.strip()]
+    else:
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            # Not a single JSON document: treat it as JSONL
+            return parse_failures(content, filename=".jsonl")
+        if isinstance(data, dict) and "tests" in data:
+            failures = _parse_pytest_json(data)
+        else:
+            records = data if isinstance(data, list) else [data]
+            failures = [_failure_from_record(r, i) for i, r in enumerate(records)]
+    return [f for f in failures if f["error_log"].strip()]
+
+def group_failures(failures):
+    """Dedupes failures by normalized signature. Returns {fingerprint: {error_log, names}}."""
+    groups = {}
+    for failure in failures:
+        key = fingerprint(failure["error_log"])
+        group = groups.setdefault(key, {"fingerprint": key, "error_log": failure["error_log"], "names": []})
+        group["names"].append(failure["name"])
+    return groups
+
+def analyze_batch(analyzer, failures, concurrency=BATCH_LLM_CONCURRENCY):
+    """
+    Analyzes a whole test-run report and yields one result per unique failure as it finishes:
+    1. dedupe by signature, 2. serve recurring errors from the analysis cache,
+    3. one batched retrieval for the rest, 4. LLM calls fanned out with bounded concurrency.
+    """
+    groups = list(group_failures(failures).values())
+    pending = []
+    for group in groups:
+        cached = analyzer.cache.get(group["error_log"]) if analyzer.cache else None
+        if cached:
+            yield dict(group, result=cached["result"], context=cached["context"], cached=True)
+        else:
+            pending.append(group)
+    if not pending:
+        return
+
+    all_docs = analyzer.retriever_factory.retrieve_batch([g["error_log"] for g in pending])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(analyzer.generate, group["error_log"], docs, "batch"): (group, docs)
+            for group, docs in zip(pending, all_docs)
+        }
+        for future in as_completed(futures):
+            group, docs = futures[future]
+            context = [d.page_content for d in docs]
+            try:
+                result = future.result()
+            except Exception as e:
+                yield dict(group, result=None, context=context, cached=False, error=str(e))
+                continue
+            if analyzer.cache:
+                analyzer.cache.put(group["error_log"], result, context, {},
+                                   [d.metadata["chunk_id"] for d in docs if d.metadata.get("chunk_id")])
+            yield dict(group, result=result, context=context, cached=False)
@@ -0,0 +1,304 @@
+"""
+Retrieval and end-to-end benchmark on the QA golden set (data/qa_test_errors.json).
+
+Indexes the golden fixes among a synthetic corpus of log chunks, replays the golden errors
+as new occurrences (volatile numbers changed) and reports recall@k / MRR and per-stage
+latency percentiles. Results are saved as JSON so runs can be compared:
+
+    python -m src.benchmark --chunks 10000 --output bench.json
+    python -m src.benchmark --chunks 100000 --embeddings hash --compare bench.json
+"""
+import os
+import re
+import json
+import time
+import random
+import shutil
+import hashlib
+import itertools
+import argparse
+import tempfile
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_chroma import Chroma
+from src.keyword_index import KeywordIndex
+from src.retriever import weighted_rrf_scored
+from src.signatures import extract_signatures, is_decisive
+from src.rerank import CrossEncoderStage, doc_key
+from src.prompts import PROMPT
+from src.context import ContextPacker, estimate_tokens
+from src.config import BASE_DIR, RETRIEVER_K, RERANK_TOP_N, RERANK_SKIP_MARGIN, RERANK_CANDIDATES, EMBEDDING_MODEL, RERANKER_MODEL
+
+GOLDEN_PATH = os.path.join(BASE_DIR, "data", "qa_test_errors.json")
+RECALL_AT = (1, 3, 5, 10)
+WEIGHTS = [0.4, 0.6]  # Same as AdvancedRetrieverFactory
+
+EXCEPTIONS = ["TimeoutException", "NoSuchElementException", "NullPointerException", "ConnectionRefusedError",
+              "StaleElementReferenceException", "AssertionError", "SQLException", "KeyError", "IOException",
+              "ElementClickInterceptedException", "OutOfMemoryError", "SSLHandshakeException"]
+SERVICES = ["auth-service", "payment-gateway", "checkout", "inventory", "search-api", "notifications",
+            "user-profile", "reporting", "scheduler", "webdriver"]
+MESSAGES = ["Timed out waiting for {svc} after {n} ms", "Unable to locate element #btn-{n}",
+            "Connection refused by {svc}:{n}", "Expected status 200 but was {n}", "Session {n} expired",
+            "Deadlock detected on table orders_{n}", "Retry {n}/5 failed for {svc}", "Heap usage at {n}%",
+            "Certificate for {svc} expired", "Element <div id=modal-{n}> would receive the click"]
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words hashing embeddings: no model, for index/latency tests at large scale."""
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(token.encode()).hexdigest()[:8], 16) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+class FakeLLM:
+    """Local stand-in for Ollama: returns a canned answer after `delay` seconds per call."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def generate(self, prompt, profile="interactive"):
+        time.sleep(self.delay)
+        return "<think>Comparing the error with the retrieved context.</think>\nRoot cause: ...\nFix: ..."
+
+def load_golden(path=GOLDEN_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    docs = []
+    for i, item in enumerate(items):
+        # Same layout as LogLoader._process_json_file
+        content = "\n".join(filter(None, [
+            f"Error: {item['error_message']}" if item.get("error_message") else None,
+            f"Stack Trace: {item['stack_trace']}" if item.get("stack_trace") else None,
+            f"Solution: {item['previous_fix']}" if item.get("previous_fix") else None,
+        ]))
+        docs.append(Document(page_content=content, metadata={"source": path, "type": "json", "chunk_id": f"golden-{i}"}))
+    return items, docs
+
+def make_queries(items, repeat, rng):
+    """New occurrences of each golden error: every number (line, port, session, timestamp) is changed."""
+    queries = []
+    for _ in range(repeat):
+        for i, item in enumerate(items):
+            text = f"{item.get('error_message', '')}\n{item.get('stack_trace', '')}".strip()
+            text = re.sub(r"\d+", lambda m: str(rng.randint(1, 10 ** len(m.group()))), text)
+            queries.append((text, f"golden-{i}"))
+    return queries
+
+def iter_synthetic_chunks(n, rng, batch_size=1000):
+    """Batches of synthetic log chunks, with near-miss distractors sharing exception names and services."""
+    batch = []
+    for i in range(n):
+        lines = []
+        for _ in range(rng.randint(3, 12)):
+            svc, exc = rng.choice(SERVICES), rng.choice(EXCEPTIONS)
+            message = rng.choice(MESSAGES).format(svc=svc, n=rng.randint(1, 99999))
+            lines.append(f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:"
+                         f"{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} ERROR [{svc}] {exc}: {message}")
+            if rng.random() < 0.3:
+                lines.append(f"    at com.acme.{svc.replace('-', '.')}.Handler.run(Handler.java:{rng.randint(1, 900)})")
+        batch.append(Document(page_content="\n".join(lines),
+                              metadata={"source": f"synthetic-{i // 100}.log", "type": "log", "chunk_id": f"syn-{i}"}))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def percentiles(samples):
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    return {"p50": round(float(np.percentile(values, 50)), 2), "p95": round(float(np.percentile(values, 95)), 2),
+            "p99": round(float(np.percentile(values, 99)), 2), "mean": round(float(values.mean()), 2), "n": len(samples)}
+
+def build_index(workdir, embeddings, golden_docs, n_chunks, seed):
+    """Indexes the golden docs plus `n_chunks` synthetic ones, reusing a matching index in `workdir`."""
+    marker = os.path.join(workdir, "corpus.json")
+    corpus = {"chunks": n_chunks, "seed": seed, "embeddings": type(embeddings).__name__, "golden": len(golden_docs)}
+    vectorstore = Chroma(collection_name="benchmark", embedding_function=embeddings,
+                         persist_directory=os.path.join(workdir, "chroma"))
+    keyword_index = KeywordIndex(os.path.join(workdir, "keyword_index.db"))
+    if os.path.exists(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            if json.load(f) == corpus:
+                print(f"Reusing the indexed corpus in {workdir}.")
+                return vectorstore, keyword_index, {"reused": True}
+        vectorstore.reset_collection()
+        keyword_index.clear()
+
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    indexed = 0
+    for batch in itertools.chain([golden_docs], iter_synthetic_chunks(n_chunks, rng)):
+        vectorstore.add_documents(batch, ids=[d.metadata["chunk_id"] for d in batch])
+        keyword_index.add_documents(batch)
+        indexed += len(batch)
+        if indexed % 10000 < len(batch):
+            print(f"  indexed {indexed}/{n_chunks + len(golden_docs)} chunks...")
+    seconds = time.perf_counter() - start
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(corpus, f)
+    return vectorstore, keyword_index, {"reused": False, "index_s": round(seconds, 2),
+                                         "chunks_per_s": round(indexed / seconds, 1) if seconds else None}
+
+def quality(ranked_lists, queries, cutoffs):
+    """recall@k and MRR of ranked document lists against the expected chunk of each query."""
+    hits = {k: 0 for k in cutoffs}
+    reciprocal = 0.0
+    for docs, (_, expected) in zip(ranked_lists, queries):
+        keys = [doc_key(d) for d in docs]
+        rank = keys.index(expected) + 1 if expected in keys else None
+        for k in cutoffs:
+            hits[k] += bool(rank and rank <= k)
+        reciprocal += 1 / rank if rank else 0.0
+    n = len(queries) or 1
+    return dict({f"recall@{k}": round(hits[k] / n, 4) for k in cutoffs}, mrr=round(reciprocal / n, 4))
+
+def run(args):
+    rng = random.Random(args.seed)
+    items, golden_docs = load_golden(args.golden)
+    queries = make_queries(items, args.repeat, rng)
+
+    reranker = None
+    if not args.no_rerank:
+        from src.registry import get_reranker
+        # Fresh stage: scores are not cached across runs, batching is per query
+        reranker = CrossEncoderStage(get_reranker(), top_n=args.top_n, skip_margin=args.skip_margin,
+                                     candidates=args.rerank_candidates, batching=False)
+    if args.llm == "ollama":
+        from src.generation import OllamaGenerator
+        llm = OllamaGenerator()
+    else:
+        llm = FakeLLM(args.fake_llm_delay)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-")
+    try:
+        if args.embeddings == "hash":
+            embeddings = HashEmbeddings()
+        else:
+            from src.embeddings import EmbeddingService
+            # Synthetic chunks must not land in the production embedding cache
+            embeddings = EmbeddingService(cache_path=os.path.join(workdir, "embedding_cache.db"))
+        vectorstore, keyword_index, corpus = build_index(workdir, embeddings, golden_docs, args.chunks, args.seed)
+
+        timings = {stage: [] for stage in ("signatures", "embed", "bm25", "chroma", "fusion", "rerank", "generation", "total")}
+        ranked = {"signatures": [], "bm25": [], "chroma": [], "fusion": [], "final": []}
+        decisive = 0
+        packer = ContextPacker()
+        prompt_tokens = {"naive": [], "packed": []}
+        for query, _ in queries:
+            # Exact-signature lookup, measured on its own (the pipeline below always runs for comparison)
+            ts = time.perf_counter()
+            signatures = extract_signatures(query)
+            hits, known = keyword_index.signature_search(signatures, k=args.top_n)
+            timings["signatures"].append(time.perf_counter() - ts)
+            ranked["signatures"].append([doc for doc, _, _ in hits])
+            decisive += bool(hits) and is_decisive(signatures, known, hits[0][2])
+
+            t0 = time.perf_counter()
+            sparse = [doc for doc, _ in keyword_index.search(query, k=args.k)]
+            t1 = time.perf_counter()
+            vector = embeddings.embed_query(query)
+            t2 = time.perf_counter()
+            dense = vectorstore.similarity_search_by_vector(vector, k=args.k)
+            t3 = time.perf_counter()
+            fused = weighted_rrf_scored([sparse, dense], WEIGHTS)
+            t4 = time.perf_counter()
+            final = reranker.rerank(query, fused) if reranker else [doc for doc, _ in fused[:args.top_n]]
+            t5 = time.perf_counter()
+            packed = packer.pack(final, estimate_tokens(PROMPT.format(context="", question=query)))
+            prompt = PROMPT.format(context=packed["context"], question=query)
+            llm.generate(prompt)
+            t6 = time.perf_counter()
+            # What the "stuff" chain used to send, for comparison
+            naive = PROMPT.format(context="\n\n".join(d.page_content for d in final), question=query)
+            prompt_tokens["naive"].append(estimate_tokens(naive))
+            prompt_tokens["packed"].append(estimate_tokens(prompt))
+
+            for stage, seconds in (("bm25", t1 - t0), ("embed", t2 - t1), ("chroma", t3 - t2), ("fusion", t4 - t3),
+                                   ("rerank", t5 - t4), ("generation", t6 - t5), ("total", t6 - t0)):
+                timings[stage].append(seconds)
+            for name, docs in (("bm25", sparse), ("chroma", dense), ("fusion", [d for d, _ in fused]), ("final", final)):
+                ranked[name].append(docs)
+
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {
+                "chunks": args.chunks, "queries": len(queries), "k": args.k, "top_n": args.top_n, "weights": WEIGHTS,
+                "embeddings": EMBEDDING_MODEL if args.embeddings == "model" else "hash",
+                "reranker": None if args.no_rerank else RERANKER_MODEL, "skip_margin": args.skip_margin,
+                "rerank_candidates": args.rerank_candidates,
+                "llm": args.llm, "seed": args.seed,
+            },
+            "corpus": corpus,
+            "quality": {name: quality(lists, queries, [c for c in RECALL_AT if c <= max(args.k, args.top_n)])
+                        for name, lists in ranked.items()},
+            "latency_ms": {stage: percentiles(samples) for stage, samples in timings.items()},
+            # Share of queries the signature fast path would answer without the hybrid pipeline
+            "signature_fast_path": round(decisive / (len(queries) or 1), 4),
+            # Estimated, like the context budget (generation includes the packing)
+            "prompt_tokens": {name: {"mean": round(float(np.mean(values)), 1), "max": int(max(values))}
+                              for name, values in prompt_tokens.items() if values},
+        }
+        if reranker:
+            results["rerank"] = reranker.stats()
+        return results
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(results, baseline):
+    """Prints quality and latency deltas against a previous run."""
+    print(f"\n--- Compared with {baseline.get('timestamp')} ---")
+    for name, metrics in results["quality"].items():
+        for metric, value in metrics.items():
+            before = baseline.get("quality", {}).get(name, {}).get(metric)
+            if before is not None and before != value:
+                print(f"  {name} {metric}: {before} -> {value} ({value - before:+.4f})")
+    for stage, stats in results["latency_ms"].items():
+        before = (baseline.get("latency_ms", {}).get(stage) or {}).get("p95")
+        if stats and before:
+            print(f"  {stage} p95: {before} -> {stats['p95']} ms ({(stats['p95'] - before) / before * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval / end-to-end benchmark on the QA golden set")
+    parser.add_argument("--chunks", type=int, default=10000, help="Synthetic chunks indexed next to the golden set")
+    parser.add_argument("--repeat", type=int, default=20, help="Occurrences replayed per golden error")
+    parser.add_argument("--k", type=int, default=RETRIEVER_K)
+    parser.add_argument("--top-n", type=int, default=RERANK_TOP_N)
+    parser.add_argument("--skip-margin", type=float, default=RERANK_SKIP_MARGIN)
+    parser.add_argument("--rerank-candidates", type=int, default=RERANK_CANDIDATES)
+    parser.add_argument("--no-rerank", action="store_true")
+    parser.add_argument("--embeddings", choices=["model", "hash"], default="model",
+                        help="'hash' skips the embedding model to test large corpora quickly")
+    parser.add_argument("--llm", choices=["fake", "ollama"], default="fake")
+    parser.add_argument("--fake-llm-delay", type=float, default=0.0, help="Seconds per fake generation")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--workdir", help="Keep the index here and reuse it across runs with the same corpus")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Where to save the results (JSON)")
+    parser.add_argument("--compare", metavar="JSON", help="Previous results to compare with")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
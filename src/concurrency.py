@@ -0,0 +1,134 @@
+import asyncio
+import functools
+import contextvars
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from src.config import RETRIEVAL_WORKERS, GENERATION_WORKERS
+from src.config import MAX_CONCURRENT_ANALYSES, MAX_QUEUED_ANALYSES, QUEUE_TIMEOUT
+
+class PoolSaturatedError(Exception):
+    """Raised when an analysis cannot be admitted. Carries an HTTP status and a retry hint."""
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AnalysisPool:
+    """
+    Runs the blocking pipeline stages off the event loop.
+    - Retrieval (BM25, Chroma, Cross-Encoder) and generation (Ollama) get their own
+      sized executors so a slow generation never starves retrieval for other requests.
+    - Admission is bounded: at most `max_concurrent` analyses run at once and at most
+      `max_queued` wait for a slot. Beyond that we reject immediately (429), and a request
+      that waited longer than `queue_timeout` is rejected too (503).
+    """
+    def __init__(self, retrieval_workers=RETRIEVAL_WORKERS, generation_workers=GENERATION_WORKERS,
+                 max_concurrent=MAX_CONCURRENT_ANALYSES, max_queued=MAX_QUEUED_ANALYSES,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.executors = {
+            "retrieval": ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="retrieval"),
+            "generation": ThreadPoolExecutor(max_workers=generation_workers, thread_name_prefix="generation"),
+        }
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._running = 0
+        self._waiting = 0
+        # Exponential moving average of a full analysis, used for the retry hint
+        self._avg_duration = 10.0
+
+    def _retry_after(self):
+        """Rough estimate of how long until a slot frees up for a new request."""
+        backlog = (self._waiting + 1) / max(self.max_concurrent, 1)
+        return max(1, int(self._avg_duration * backlog))
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserves an analysis slot or raises PoolSaturatedError."""
+        if self._slots.locked() and self._waiting >= self.max_queued:
+            raise PoolSaturatedError("Analysis queue is full", 429, self._retry_after())
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise PoolSaturatedError("Timed out waiting for an analysis slot", 503, self._retry_after())
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._slots.release()
+            elapsed = time.perf_counter() - start
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * elapsed
+
+    async def run(self, stage, fn, *args, **kwargs):
+        """Runs a blocking callable on the executor of the given stage (in the caller's context, so spans reach its trace)."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executors[stage], functools.partial(context.run, fn, *args, **kwargs))
+
+    async def iterate(self, stage, iterator):
+        """
+        Consumes a blocking iterator (e.g. an LLM token stream) on one thread of the stage's
+        executor and yields its items on the event loop: one executor hop for the whole
+        stream instead of one per item. Items are handed back through an asyncio.Queue.
+        Stopping early (client disconnect) stops the thread at the next item and closes the
+        iterator there, on the thread that runs it.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(items.put_nowait, (item, error))
+            except RuntimeError:
+                stop.set()  # The event loop is gone
+
+        def produce():
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    put(item)
+                put(end)
+            except Exception as e:
+                put(end, e)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+        context = contextvars.copy_context()
+        loop.run_in_executor(self.executors[stage], functools.partial(context.run, produce))
+        try:
+            while True:
+                item, error = await items.get()
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    def status(self):
+        return {
+            "running": self._running,
+            "queued": self._waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+        }
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
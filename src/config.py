@@ -8,6 +8,65 @@ load_dotenv()
 MODEL_NAME = "deepseek-r1:8b"
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
+# Load and warm up the models at API startup instead of on the first request
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+
+# Ollama Generation Settings
+# How long Ollama keeps the model loaded after a request ("30m", seconds, -1 = forever)
+_keep_alive = os.getenv("LLM_KEEP_ALIVE", "30m")
+LLM_KEEP_ALIVE = int(_keep_alive) if _keep_alive.lstrip("-").isdigit() else _keep_alive
+LLM_NUM_THREAD = int(os.getenv("LLM_NUM_THREAD", "0"))  # 0 = Ollama's default
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "180"))  # seconds per generation; the stream is closed, Ollama stops
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+# Generation profiles: reasoning (<think>) and answer token budgets per use
+LLM_PROFILES = {
+    "interactive": {
+        "max_reasoning_tokens": int(os.getenv("LLM_MAX_REASONING_TOKENS", "1024")),
+        "max_answer_tokens": int(os.getenv("LLM_MAX_ANSWER_TOKENS", "768")),
+        "timeout": LLM_TIMEOUT,
+    },
+    "batch": {
+        "max_reasoning_tokens": int(os.getenv("LLM_BATCH_MAX_REASONING_TOKENS", "512")),
+        "max_answer_tokens": int(os.getenv("LLM_BATCH_MAX_ANSWER_TOKENS", "768")),
+        "timeout": float(os.getenv("LLM_BATCH_TIMEOUT", str(LLM_TIMEOUT * 2))),
+    },
+}
+LLM_EVAL_MAX_TOKENS = int(os.getenv("LLM_EVAL_MAX_TOKENS", "2048"))  # Ragas judge calls
+# Raw chat template used to resume the model after an exhausted reasoning budget with a closed
+# </think>, so it goes straight to the answer (empty = the budget only stops generation)
+LLM_RAW_TEMPLATE = os.getenv("LLM_RAW_TEMPLATE", "<｜User｜>{prompt}<｜Assistant｜>")
+
+# Retrieval and Reranking Settings
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "10"))  # candidates per first-stage retriever
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))
+# Best fused candidates (feedback prior included) sent to the cross-encoder (0 = all of them)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))
+# User feedback prior in the fusion: a chunk's score is scaled by up to 1 ± FEEDBACK_WEIGHT (0 = off)
+FEEDBACK_WEIGHT = float(os.getenv("FEEDBACK_WEIGHT", "0.3"))
+FEEDBACK_REFRESH_S = float(os.getenv("FEEDBACK_REFRESH_S", "30"))  # re-read votes from other processes
+# Exact-signature fast path (error codes, exception classes, HTTP statuses, top stack frames):
+# off | seed (matches fused as a third list) | skip (a decisive match bypasses hybrid search and rerank)
+SIGNATURE_MODE = os.getenv("SIGNATURE_MODE", "skip")
+SIGNATURE_WEIGHT = float(os.getenv("SIGNATURE_WEIGHT", "0.5"))  # RRF weight of the seeded matches
+SIGNATURE_MAX_CHUNKS = int(os.getenv("SIGNATURE_MAX_CHUNKS", "50"))  # more frequent signatures are ignored
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "100000"))  # cached (query, chunk) scores
+# Characters kept per chunk / query before tokenizing (0 = derived from the model's max length)
+RERANK_MAX_CHARS = int(os.getenv("RERANK_MAX_CHARS", "0"))
+RERANK_MAX_QUERY_CHARS = int(os.getenv("RERANK_MAX_QUERY_CHARS", "1024"))
+# Skip reranking when the top fused score is this many times the runner-up (0 = always rerank)
+RERANK_SKIP_MARGIN = float(os.getenv("RERANK_SKIP_MARGIN", "1.5"))
+# Pairs from concurrent requests arriving within this window share one forward pass
+RERANK_BATCH_WINDOW_MS = float(os.getenv("RERANK_BATCH_WINDOW_MS", "5"))
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", "128"))
+
+# Embedding Engine Settings
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = torch default
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch | onnx | openvino
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "none")  # none | int8
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_NORMALIZE = os.getenv("EMBEDDING_NORMALIZE", "false").lower() == "true"
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,11 +74,49 @@ DATA_PATH = os.path.join(BASE_DIR, "data", "logs")
 DB_PATH = os.path.join(BASE_DIR, "db_chroma")
 CHROMA_HOST = os.getenv("CHROMA_HOST")
 CHROMA_PORT = os.getenv("CHROMA_PORT", "8000")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(BASE_DIR, "embedding_cache.db"))
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", os.path.join(BASE_DIR, "keyword_index.db"))
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", os.path.join(BASE_DIR, "ingest_manifest.json"))
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history.db")
+# Multi-process serving: the index generation signal (and its sync lock) shared by the API workers
+INDEX_SIGNAL_PATH = os.getenv("INDEX_SIGNAL_PATH", os.path.join(BASE_DIR, "index_generation.json"))
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "2"))  # seconds between checks of the signal
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+# Embedder and cross-encoder served once per node to every worker (e.g. http://localhost:8100, unset = in process)
+MODEL_SERVER_URL = os.getenv("MODEL_SERVER_URL")
+MODEL_SERVER_PORT = int(os.getenv("MODEL_SERVER_PORT", "8100"))
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "60"))
+# Max inserts the history writer group-commits in one transaction
+HISTORY_WRITE_BATCH = int(os.getenv("HISTORY_WRITE_BATCH", "256"))
 
 # Chunking Settings
 CHUNK_SIZE = 2500
 CHUNK_OVERLAP = 500
 
+# Context packing: the prompt context is trimmed to the model's context window (Ollama num_ctx)
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", "4096"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))  # 0 = window - answer reserve - rest of the prompt
+# Tokens left for reasoning + answer, by default the interactive profile's budgets
+CONTEXT_ANSWER_RESERVE = int(os.getenv("CONTEXT_ANSWER_RESERVE", str(
+    LLM_PROFILES["interactive"]["max_reasoning_tokens"] + LLM_PROFILES["interactive"]["max_answer_tokens"])))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # shared shingles to drop a block
+
+# Ingestion Pipeline: processes for CPU-bound parsing, threads for network sources
+INGEST_PROCESS_WORKERS = int(os.getenv("INGEST_PROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+INGEST_THREAD_WORKERS = int(os.getenv("INGEST_THREAD_WORKERS", "4"))
+
+# Background sync: how long (seconds) requests on the previous index generation may keep
+# running before its stale chunks are deleted anyway
+SYNC_DRAIN_TIMEOUT = float(os.getenv("SYNC_DRAIN_TIMEOUT", "300"))
+
+# Log Template Mining: collapse repetitive .log lines into templates before chunking
+LOG_TEMPLATE_MINING = os.getenv("LOG_TEMPLATE_MINING", "true").lower() == "true"
+LOG_TEMPLATE_SIMILARITY = float(os.getenv("LOG_TEMPLATE_SIMILARITY", "0.5"))
+# Templates seen at most this many times are also indexed verbatim as anomalies
+LOG_ANOMALY_MAX_COUNT = int(os.getenv("LOG_ANOMALY_MAX_COUNT", "3"))
+# Distinct stack traces (after masking volatile tokens) kept verbatim per anomalous template
+LOG_ANOMALY_MAX_EXAMPLES = int(os.getenv("LOG_ANOMALY_MAX_EXAMPLES", "5"))
+
 # Jira/Confluence Search Paths (Optional)
 JIRA_URL = os.getenv("JIRA_URL")
 JIRA_API_TOKEN = os.getenv("JIRA_API_TOKEN")
@@ -28,3 +125,33 @@ JIRA_USERNAME = os.getenv("JIRA_USERNAME")
 CONFLUENCE_URL = os.getenv("CONFLUENCE_URL")
 CONFLUENCE_API_TOKEN = os.getenv("CONFLUENCE_API_TOKEN")
 CONFLUENCE_USERNAME = os.getenv("CONFLUENCE_USERNAME")
+
+# API Concurrency Settings
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "2"))
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "16"))
+MAX_QUEUED_ANALYSES = int(os.getenv("MAX_QUEUED_ANALYSES", "64"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "30"))
+# LLM calls in flight per batch analysis (/analyze/batch, main.py --batch)
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+# Quality Evaluation (Ragas, off the request path)
+EVAL_SAMPLE_RATE = float(os.getenv("EVAL_SAMPLE_RATE", "1.0"))  # share of analyses queued for evaluation
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "8"))
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "2"))  # judge calls in flight
+EVAL_POLL_INTERVAL = float(os.getenv("EVAL_POLL_INTERVAL", "5"))  # seconds
+EVAL_TIMEOUT = int(os.getenv("EVAL_TIMEOUT", "180"))  # seconds per judge call
+
+# Observability: requests slower than this (ms) are logged with their per-stage breakdown (0 = off)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_LOG = os.getenv("SLOW_REQUEST_LOG")  # JSONL file, stdout when unset
+
+# Streamlit UI: per-session retrieval memo of the evidence column
+UI_RETRIEVAL_CACHE_SIZE = int(os.getenv("UI_RETRIEVAL_CACHE_SIZE", "32"))  # retrievals kept per session
+UI_RETRIEVAL_MIN_CHARS = int(os.getenv("UI_RETRIEVAL_MIN_CHARS", "12"))
+
+# Analysis Cache Settings
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))  # seconds, 0 = no expiry
+# Cosine similarity for near-duplicate hits (0 disables the embedding lookup)
+ANALYSIS_CACHE_SIMILARITY = float(os.getenv("ANALYSIS_CACHE_SIMILARITY", "0"))
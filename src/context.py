@@ -0,0 +1,159 @@
+import os
+import re
+from src.rerank import CHARS_PER_TOKEN
+from src.config import LLM_CONTEXT_WINDOW, CONTEXT_TOKEN_BUDGET, CONTEXT_ANSWER_RESERVE
+from src.config import CONTEXT_DEDUP_THRESHOLD, CHUNK_OVERLAP
+
+# Shortest shared text taken as a real chunk overlap (not a coincidental common line)
+MIN_OVERLAP_CHARS = 32
+# A block cut below this is dropped instead of included as a fragment
+MIN_PARTIAL_TOKENS = 64
+# Word n-grams compared by the near-duplicate check
+SHINGLE_SIZE = 5
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _overlap(a, b, max_overlap):
+    """Length of the longest suffix of `a` that is also a prefix of `b` (0 if none of at least MIN_OVERLAP_CHARS)."""
+    if len(a) < MIN_OVERLAP_CHARS or len(b) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = b[:MIN_OVERLAP_CHARS]
+    pos = a.find(probe, max(0, len(a) - min(len(b), max_overlap)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+def _merge(a, b, max_overlap):
+    """Joins two texts of the same source when one contains or overlaps the other, else returns None."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    overlap = _overlap(a, b, max_overlap)
+    if overlap:
+        return a + b[overlap:]
+    overlap = _overlap(b, a, max_overlap)
+    if overlap:
+        return b + a[overlap:]
+    return None
+
+def _shingles(text):
+    # Digits are masked so the same log line with another timestamp or id still matches
+    words = re.findall(r"\w+", re.sub(r"\d+", "0", text.lower()))
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+class ContextPacker:
+    """
+    Builds the prompt context from the ranked retrieved chunks, replacing the "stuff" chain's
+    plain concatenation:
+    1. overlapping or contained chunks of the same source are merged into one block,
+    2. blocks mostly contained in a better ranked one (near duplicates) are dropped,
+    3. blocks are added in rank order until the token budget is spent; the one that
+       overflows is cut at a line boundary.
+    The budget is the model's context window minus the rest of the prompt and the tokens
+    reserved for the answer, unless CONTEXT_TOKEN_BUDGET fixes it.
+    """
+    def __init__(self, context_window=LLM_CONTEXT_WINDOW, token_budget=CONTEXT_TOKEN_BUDGET,
+                 answer_reserve=CONTEXT_ANSWER_RESERVE, dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+                 max_overlap=CHUNK_OVERLAP * 2):
+        self.context_window = context_window
+        self.token_budget = token_budget
+        self.answer_reserve = answer_reserve
+        self.dedup_threshold = dedup_threshold
+        self.max_overlap = max_overlap
+
+    def budget(self, prompt_tokens):
+        """Context tokens available when the rest of the prompt takes `prompt_tokens`."""
+        if self.token_budget:
+            return self.token_budget
+        return max(self.context_window - self.answer_reserve - prompt_tokens, MIN_PARTIAL_TOKENS)
+
+    def _blocks(self, docs):
+        blocks = []  # {"source", "text"} in rank order
+        merged = 0
+        for doc in docs:
+            source = doc.metadata.get("source") or ""
+            text = doc.page_content.strip()
+            for block in blocks:
+                if block["source"] != source:
+                    continue
+                joined = _merge(block["text"], text, self.max_overlap)
+                if joined is not None:
+                    block["text"] = joined
+                    merged += 1
+                    break
+            else:
+                blocks.append({"source": source, "text": text})
+
+        # A merged block may now bridge two earlier blocks of its source
+        i = 0
+        while i < len(blocks):
+            for j in range(i + 1, len(blocks)):
+                if blocks[j]["source"] != blocks[i]["source"]:
+                    continue
+                joined = _merge(blocks[i]["text"], blocks[j]["text"], self.max_overlap)
+                if joined is not None:
+                    blocks[i]["text"] = joined
+                    del blocks[j]
+                    merged += 1
+                    break
+            else:
+                i += 1
+        return blocks, merged
+
+    def _dedupe(self, blocks):
+        kept = []
+        for block in blocks:
+            shingles = _shingles(block["text"])
+            if any(len(shingles & other) >= self.dedup_threshold * min(len(shingles), len(other))
+                   for other in (b["shingles"] for b in kept)):
+                continue
+            block["shingles"] = shingles
+            kept.append(block)
+        return kept, len(blocks) - len(kept)
+
+    def pack(self, docs, prompt_tokens=0):
+        """
+        Returns {"context", "sources", "context_tokens", "budget", "chunks", "merged",
+        "duplicates", "trimmed", "dropped"}; `prompt_tokens` is the size of the prompt without context.
+        """
+        blocks, merged = self._blocks(docs)
+        blocks, duplicates = self._dedupe(blocks)
+        budget = self.budget(prompt_tokens)
+
+        parts, sources, used, trimmed = [], [], 0, 0
+        for block in blocks:
+            header = f"[{os.path.basename(block['source']) or 'external'}]\n"
+            text = header + block["text"]
+            tokens = estimate_tokens(text)
+            if used + tokens > budget:
+                remaining = budget - used
+                if remaining < MIN_PARTIAL_TOKENS:
+                    break
+                cut = text[:remaining * CHARS_PER_TOKEN]
+                # Whole lines only, so a stack frame is never half quoted
+                cut = cut[:cut.rfind("\n")] if cut.rfind("\n") > len(header) else cut
+                text, tokens = cut + "\n[...]", estimate_tokens(cut + "\n[...]")
+                trimmed = 1
+            parts.append(text)
+            sources.append(block["source"])
+            used += tokens
+            if trimmed:
+                break
+
+        return {
+            "context": "\n\n".join(parts),
+            "sources": sources,
+            "context_tokens": used,
+            "budget": budget,
+            "chunks": len(docs),
+            "merged": merged,
+            "duplicates": duplicates,
+            "trimmed": trimmed,
+            "dropped": len(blocks) - len(parts),
+        }
@@ -0,0 +1,138 @@
+import sqlite3
+import hashlib
+import threading
+import time
+import numpy as np
+from src.telemetry import span
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+from src.config import EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS, EMBEDDING_BACKEND
+from src.config import EMBEDDING_QUANTIZE, EMBEDDING_ONNX_FILE, EMBEDDING_NORMALIZE, EMBEDDING_CACHE_PATH
+
+class EmbeddingCache:
+    """Persistent text-hash -> vector cache (SQLite), shared by every collection rebuild."""
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB) WITHOUT ROWID")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters, so look up in slices
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32).tolist()) for key, blob in rows)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            )
+            self._conn.commit()
+
+class EmbeddingService(Embeddings):
+    """
+    CPU-oriented embedding engine used by Chroma:
+    - embeds in fixed-size batches with a configurable number of torch threads,
+    - optional ONNX / OpenVINO backends and int8 quantization,
+    - persistent cache keyed by model + text hash, so unchanged text is never embedded twice,
+    - throughput counters (chunks/s) to size CPU-only nodes.
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS,
+                 backend=EMBEDDING_BACKEND, quantize=EMBEDDING_QUANTIZE, normalize=EMBEDDING_NORMALIZE,
+                 cache_path=EMBEDDING_CACHE_PATH):
+        self.batch_size = batch_size
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+
+        model_kwargs = {"device": "cpu"}
+        if backend != "torch":
+            # sentence-transformers >= 3.2 can run the same model on ONNX Runtime / OpenVINO
+            model_kwargs["backend"] = backend
+            if backend == "onnx" and quantize == "int8":
+                model_kwargs["model_kwargs"] = {"file_name": EMBEDDING_ONNX_FILE}
+        self.model = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs=model_kwargs,
+            encode_kwargs={"batch_size": batch_size, "normalize_embeddings": normalize}
+        )
+        if backend == "torch" and quantize == "int8":
+            import torch
+            self.model._client = torch.quantization.quantize_dynamic(
+                self.model._client, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+        # The cache key covers everything that changes the vectors
+        self.cache_namespace = f"{model_name}|{backend}|{quantize}|{normalize}"
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self._stats_lock = threading.Lock()
+        self.counters = {"embedded": 0, "cache_hits": 0, "seconds": 0.0, "queries": 0}
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.cache_namespace}\x00{text}".encode("utf-8", errors="ignore")).hexdigest()
+
+    def embed_documents(self, texts):
+        keys = [self._key(t) for t in texts] if self.cache else []
+        cached = self.cache.get_many(keys) if self.cache else {}
+        missing = [i for i, key in enumerate(keys or texts) if not self.cache or key not in cached]
+
+        start = time.perf_counter()
+        computed = {}
+        with span("embed"):
+            for i in range(0, len(missing), self.batch_size):
+                batch = missing[i:i + self.batch_size]
+                vectors = self.model.embed_documents([texts[j] for j in batch])
+                computed.update(zip(batch, vectors))
+        elapsed = time.perf_counter() - start
+
+        if self.cache and computed:
+            self.cache.put_many([(keys[j], vector) for j, vector in computed.items()])
+        with self._stats_lock:
+            self.counters["embedded"] += len(computed)
+            self.counters["cache_hits"] += len(texts) - len(computed)
+            self.counters["seconds"] += elapsed
+
+        return [computed[i] if i in computed else cached[keys[i]] for i in range(len(texts))]
+
+    def embed_query(self, text):
+        with self._stats_lock:
+            self.counters["queries"] += 1
+        with span("embed_query"):
+            return self.model.embed_query(text)
+
+    def embed_queries(self, texts):
+        """Batched embed_query: one model pass, and like single queries never stored in the cache."""
+        with self._stats_lock:
+            self.counters["queries"] += len(texts)
+        with span("embed_query"):
+            vectors = []
+            for i in range(0, len(texts), self.batch_size):
+                vectors.extend(self.model.embed_documents(texts[i:i + self.batch_size]))
+            return vectors
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self.counters)
+        counters["chunks_per_s"] = round(counters["embedded"] / counters["seconds"], 1) if counters["seconds"] else 0.0
+        total = counters["embedded"] + counters["cache_hits"]
+        counters["cache_hit_rate"] = round(counters["cache_hits"] / total, 3) if total else 0.0
+        return counters
+
+if __name__ == "__main__":
+    # Quick throughput check for sizing nodes: python -m src.embeddings [n_texts]
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    service = EmbeddingService(cache_path=None)
+    texts = [f"ERROR {i} TimeoutException: Timed out receiving message from renderer at line {i}" for i in range(n)]
+    service.embed_documents(texts)
+    print(service.stats())
@@ -1,41 +1,119 @@
+import math
+import threading
 from ragas import evaluate
-from ragas.metrics import faithfulness, answer_relevancy, context_precision, context_recall
+from ragas.metrics import faithfulness, answer_relevancy
 from langchain_ollama import OllamaLLM
-from src.config import MODEL_NAME
-import pandas as pd
+from src.config import MODEL_NAME, OLLAMA_BASE_URL, EVAL_BATCH_SIZE, EVAL_CONCURRENCY, EVAL_POLL_INTERVAL, EVAL_TIMEOUT
+from src.registry import get_llm, get_embeddings
+from src.reasoning import split_output
+from src.telemetry import span
 
 class RAGASEvaluator:
     def __init__(self, model_name=MODEL_NAME):
-        self.llm = OllamaLLM(model=model_name)
-        # In a real scenario, Ragas expects a wrapper or specifically configured LLM
-        # For this MVP, we will simulate the structure that Ragas needs
+        self.llm = get_llm() if model_name == MODEL_NAME else OllamaLLM(model=model_name, base_url=OLLAMA_BASE_URL)
 
-    def evaluate_response(self, question, answer, contexts):
+    def evaluate_batch(self, samples, concurrency=EVAL_CONCURRENCY):
         """
-        Evaluates the quality of a single RAG response.
-        Note: RAGAS normally runs on datasets. For real-time, we simplify.
+        Scores (question, answer, contexts) samples with Ragas faithfulness and answer relevancy,
+        using the local Ollama model as judge with at most `concurrency` calls in flight.
+        Returns one {"faithfulness", "relevancy"} dict per sample (None values if a metric failed).
         """
+        from datasets import Dataset
+        from ragas.llms import LangchainLLMWrapper
+        from ragas.embeddings import LangchainEmbeddingsWrapper
+        from ragas.run_config import RunConfig
+
         # Data format for Ragas
-        data = {
-            "question": [question],
-            "answer": [answer],
-            "contexts": [contexts]
-        }
-        
-        # This is a simplified version because Ragas usually requires OpenAI or a 
-        # specifically mapped local LLM. For a demo, we focus on the logic.
+        data = Dataset.from_dict({
+            "question": [q for q, _, _ in samples],
+            "answer": [a for _, a, _ in samples],
+            "contexts": [list(c) for _, _, c in samples]
+        })
+        result = evaluate(
+            data,
+            metrics=[faithfulness, answer_relevancy],
+            llm=LangchainLLMWrapper(self.llm),
+            embeddings=LangchainEmbeddingsWrapper(get_embeddings()),
+            run_config=RunConfig(max_workers=concurrency, timeout=EVAL_TIMEOUT),
+            show_progress=False
+        )
+        df = result.to_pandas()
+
+        def score(value):
+            return None if value is None or (isinstance(value, float) and math.isnan(value)) else round(float(value), 4)
+
+        return [
+            {"faithfulness": score(row.get("faithfulness")), "relevancy": score(row.get("answer_relevancy"))}
+            for row in df.to_dict("records")
+        ]
+
+    def evaluate_response(self, question, answer, contexts):
+        """
+        Evaluates the quality of a single RAG response (an LLM-as-judge pass: keep it off
+        the request path, see EvaluationWorker).
+        """
         try:
-            # We return some simulated metrics if Ragas local setup is complex,
-            # but here is how you would call it:
-            # result = evaluate(data, metrics=[faithfulness, answer_relevancy])
-            # return result
-            
-            # Simulated metrics for UI demo (in real world, Ragas would calculate these)
-            import random
-            return {
-                "faithfulness": round(random.uniform(0.7, 0.95), 2),
-                "relevancy": round(random.uniform(0.75, 0.98), 2)
-            }
+            return self.evaluate_batch([(question, answer, contexts)])[0]
         except Exception as e:
             print(f"Ragas evaluation error: {e}")
             return None
+
+class EvaluationWorker:
+    """
+    Scores analyses saved as pending in the background, in batches, and writes the scores
+    back to the history (rollups included). Requests never wait for the judge model.
+    Several processes (API, UI) can run a worker on the same history: rows are claimed atomically.
+    """
+    def __init__(self, history, evaluator=None, batch_size=EVAL_BATCH_SIZE, poll_interval=EVAL_POLL_INTERVAL):
+        self.history = history
+        self.evaluator = evaluator or RAGASEvaluator()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.evaluated = 0
+        self.failed = 0
+
+    def start(self):
+        # Rows claimed by a worker that died never get scored otherwise
+        self.history.requeue_running_evaluations()
+        self._thread = threading.Thread(target=self._run, name="evaluation-worker", daemon=True)
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """Wakes the worker up (new pending analyses) instead of waiting for the next poll."""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self.history.claim_pending_evaluations(self.batch_size)
+            if not batch:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            # The judge scores the answer, not the model's reasoning
+            samples = [(row["error_input"], split_output(row["analysis_result"])[1], row["context"])
+                       for row in batch]
+            try:
+                with span("evaluation"):
+                    scores = self.evaluator.evaluate_batch(samples)
+            except Exception as e:
+                print(f"Ragas evaluation error: {e}")
+                scores = [None] * len(batch)
+            for row, metrics in zip(batch, scores):
+                self.history.save_evaluation(row["id"], metrics)
+                if metrics:
+                    self.evaluated += 1
+                else:
+                    self.failed += 1
+
+    def stats(self):
+        return {"evaluated": self.evaluated, "failed": self.failed, "pending": self.history.count_pending_evaluations()}
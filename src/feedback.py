@@ -0,0 +1,55 @@
+import time
+import threading
+from src.config import FEEDBACK_WEIGHT, FEEDBACK_REFRESH_S
+
+class FeedbackPrior:
+    """
+    In-memory view of the per-chunk 👍/👎 counts stored next to the history, turned into
+    score multipliers for the first-stage fusion (see `weighted_rrf_scored`). Chunks that
+    proved useful climb before the reranker ever sees them. Only rated chunks are held,
+    and the table is re-read at most every `refresh` seconds (votes from other processes).
+    """
+    def __init__(self, history, weight=FEEDBACK_WEIGHT, refresh=FEEDBACK_REFRESH_S):
+        self.history = history
+        self.weight = weight
+        self.refresh = refresh
+        self._multipliers = {}
+        self._votes = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def multiplier(self, up, down):
+        # Laplace-smoothed usefulness in [0, 1] mapped to [1 - weight, 1 + weight]: one vote barely moves a chunk
+        usefulness = (up + 1) / (up + down + 2)
+        return 1.0 + self.weight * (2 * usefulness - 1)
+
+    def _load(self):
+        votes = self.history.get_chunk_feedback()
+        self._multipliers = {chunk_id: self.multiplier(up, down) for chunk_id, (up, down) in votes.items()}
+        self._votes = votes
+        self._loaded_at = time.monotonic()
+
+    def multipliers(self):
+        """chunk_id -> fusion score multiplier (unrated chunks are absent, i.e. 1.0)."""
+        if not self.weight:
+            return {}
+        if time.monotonic() - self._loaded_at > self.refresh:
+            # One thread reloads, the others keep using the previous snapshot
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._load()
+                except Exception as e:
+                    print(f"Could not load chunk feedback: {e}")
+                    self._loaded_at = time.monotonic()
+                finally:
+                    self._lock.release()
+        return self._multipliers
+
+    def votes(self, chunk_id):
+        """(up, down) votes of a chunk."""
+        self.multipliers()
+        return self._votes.get(chunk_id, (0, 0))
+
+    def invalidate(self):
+        """Forces a reload on next use (after a vote in this process)."""
+        self._loaded_at = 0.0
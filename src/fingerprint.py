@@ -0,0 +1,31 @@
+import re
+import hashlib
+
+# Volatile tokens that change between two occurrences of the same failure.
+# Order matters: timestamps before plain numbers, UUIDs before hex blobs.
+# Error codes (0x8004210B, ORA-00942, HTTP 500) are deliberately left untouched.
+VOLATILE_PATTERNS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<TS>"),
+    (re.compile(r"\b\d{4}[-/]\d{2}[-/]\d{2}\b"), "<DATE>"),
+    (re.compile(r"\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b"), "<TIME>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<UUID>"),
+    (re.compile(r"\b0x[0-9a-fA-F]{9,}\b"), "<ADDR>"),
+    (re.compile(r"@[0-9a-fA-F]{5,8}\b"), "@<ADDR>"),
+    (re.compile(r"\b[0-9a-fA-F]{16,}\b"), "<HEX>"),
+    (re.compile(r"(session(?:[ _-]?id)?\s*[=:]\s*)[\w-]+", re.IGNORECASE), r"\1<ID>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<IP>"),
+    (re.compile(r"(\bline\s+)\d+", re.IGNORECASE), r"\1<N>"),
+    (re.compile(r"(\.\w+):\d+\)"), r"\1:<N>)"),
+    (re.compile(r"(?<![\w-])\d{6,}\b"), "<NUM>"),
+]
+WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_error(text):
+    """Masks volatile tokens (timestamps, IDs, addresses, line numbers) and collapses whitespace."""
+    for pattern, replacement in VOLATILE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+def fingerprint(text):
+    """Stable signature of an error: identical for two runs of the same failure."""
+    return hashlib.sha256(normalize_error(text).encode("utf-8", errors="ignore")).hexdigest()[:32]
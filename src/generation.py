@@ -0,0 +1,92 @@
+import time
+from src.config import MODEL_NAME, LLM_KEEP_ALIVE, LLM_PROFILES, LLM_RAW_TEMPLATE
+from src.registry import get_ollama_client, ollama_options
+from src.telemetry import LLM_TOKENS
+
+# Closes an exhausted reasoning block before resuming the model on the answer
+CLOSE_REASONING = "\n</think>\n\n"
+
+class GenerationTimeout(TimeoutError):
+    pass
+
+class OllamaGenerator:
+    """
+    Streams completions from Ollama through the process-wide pooled client, bounded by a
+    generation profile (see LLM_PROFILES):
+    - reasoning budget: when the <think> block reaches `max_reasoning_tokens` the stream is
+      closed (Ollama stops generating) and the model is resumed in raw mode with the block
+      closed, so it answers from the reasoning it already did,
+    - answer budget: `max_answer_tokens` after the reasoning,
+    - deadline: `timeout` seconds for the whole generation.
+    Every stop closes the HTTP stream, which cancels the generation server-side.
+    """
+    def __init__(self, model=MODEL_NAME, client=None):
+        self.model = model
+        self.client = client or get_ollama_client()
+
+    def _request(self, prompt, num_predict, raw=False):
+        return self.client.generate(model=self.model, prompt=prompt, raw=raw, stream=True,
+                                    options=ollama_options(num_predict=num_predict), keep_alive=LLM_KEEP_ALIVE)
+
+    @staticmethod
+    def _count(chunk, streamed):
+        """Token counters: Ollama's own on completion, the streamed chunks when we stopped it."""
+        if chunk is not None and chunk.get("done"):
+            LLM_TOKENS.inc(chunk.get("prompt_eval_count") or 0, kind="prompt")
+            LLM_TOKENS.inc(chunk.get("eval_count") or streamed, kind="completion")
+        else:
+            LLM_TOKENS.inc(streamed, kind="completion")
+
+    def _tokens(self, response, deadline, limit_fn):
+        """Yields the text of each streamed chunk until done, `limit_fn(text)` returns True or the deadline passes."""
+        last, streamed = None, 0
+        try:
+            for chunk in response:
+                last = chunk
+                streamed += 1
+                if chunk["response"]:
+                    yield chunk["response"]
+                if time.monotonic() > deadline:
+                    raise GenerationTimeout("LLM generation exceeded its time budget")
+                if limit_fn(chunk["response"]):
+                    break
+        finally:
+            # Closing the stream closes the HTTP response: Ollama stops generating
+            close = getattr(response, "close", None)
+            if close:
+                close()
+            self._count(last, streamed)
+
+    def stream(self, prompt, profile="interactive"):
+        """Yields the raw output (reasoning tags included) as text tokens."""
+        settings = LLM_PROFILES[profile]
+        max_reasoning, max_answer = settings["max_reasoning_tokens"], settings["max_answer_tokens"]
+        deadline = time.monotonic() + settings["timeout"]
+        state = {"text": "", "mode": None, "reasoning": 0, "answer": 0}
+
+        def limit(token):
+            state["text"] += token
+            if state["mode"] is None and state["text"].strip():
+                state["mode"] = "reasoning" if state["text"].lstrip().startswith("<think>") else "answer"
+            if state["mode"] == "reasoning":
+                if "</think>" in state["text"][-(len(token) + 8):]:
+                    state["mode"] = "answer"
+                    return False
+                state["reasoning"] += 1
+                return state["reasoning"] >= max_reasoning
+            if state["mode"] == "answer":
+                state["answer"] += 1
+                return state["answer"] >= max_answer
+            return False
+
+        yield from self._tokens(self._request(prompt, max_reasoning + max_answer), deadline, limit)
+
+        if state["mode"] == "reasoning" and state["reasoning"] >= max_reasoning and LLM_RAW_TEMPLATE:
+            # Reasoning budget spent: resume after a closed </think> for the answer only
+            yield CLOSE_REASONING
+            state["mode"], state["answer"] = "answer", 0
+            raw_prompt = LLM_RAW_TEMPLATE.replace("{prompt}", prompt) + state["text"] + CLOSE_REASONING
+            yield from self._tokens(self._request(raw_prompt, max_answer, raw=True), deadline, limit)
+
+    def generate(self, prompt, profile="interactive"):
+        return "".join(self.stream(prompt, profile))
@@ -1,60 +1,413 @@
 import sqlite3
 import json
-from datetime import datetime
+import time
+import queue
+import random
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
 import os
+from src.telemetry import span
+from src.fingerprint import fingerprint
+from src.config import HISTORY_DB_PATH, HISTORY_WRITE_BATCH, EVAL_SAMPLE_RATE, EVAL_TIMEOUT
+
+# Columns of the history list; answers and retrieved context are only read when asked for
+SUMMARY_COLUMNS = "id, timestamp, substr(error_input, 1, 200) AS error_preview, faithfulness, relevancy, eval_status"
+DETAIL_COLUMNS = "id, timestamp, error_input, analysis_result, faithfulness, relevancy, context, latency_ms, cached, eval_status, feedback"
+
+# Rollup bucket -> SQL expression of its start, from the ISO timestamp ("total" is a single row)
+ROLLUP_BUCKETS = {"hour": "substr({ts}, 1, 13) || ':00'", "day": "substr({ts}, 1, 10)", "total": "''"}
+# Range shown by default per bucket
+DEFAULT_RANGES = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+ROLLUP_UPSERT = """
+    INSERT INTO history_rollups
+    (bucket, start, count, cached, faith_sum, faith_n, faith_min, faith_max,
+     rel_sum, rel_n, rel_min, rel_max, latency_sum, latency_n, latency_max)
+    VALUES (?, {start}, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(bucket, start) DO UPDATE SET
+        count = count + excluded.count,
+        cached = cached + excluded.cached,
+        faith_sum = faith_sum + excluded.faith_sum,
+        faith_n = faith_n + excluded.faith_n,
+        faith_min = coalesce(min(faith_min, excluded.faith_min), faith_min, excluded.faith_min),
+        faith_max = coalesce(max(faith_max, excluded.faith_max), faith_max, excluded.faith_max),
+        rel_sum = rel_sum + excluded.rel_sum,
+        rel_n = rel_n + excluded.rel_n,
+        rel_min = coalesce(min(rel_min, excluded.rel_min), rel_min, excluded.rel_min),
+        rel_max = coalesce(max(rel_max, excluded.rel_max), rel_max, excluded.rel_max),
+        latency_sum = latency_sum + excluded.latency_sum,
+        latency_n = latency_n + excluded.latency_n,
+        latency_max = coalesce(max(latency_max, excluded.latency_max), latency_max, excluded.latency_max)
+"""
 
 class HistoryManager:
-    def __init__(self, db_path="history.db"):
+    """
+    Analysis history in SQLite. Connections are reused per thread (WAL, so readers never
+    wait for the writer), lists are keyset-paginated on an indexed timestamp, and the API
+    writes through `enqueue_analysis`, which group-commits concurrent inserts on one thread.
+    Hourly/daily rollups are updated in the same transaction as each insert, so stats and
+    trend charts never scan the history.
+    """
+    def __init__(self, db_path=HISTORY_DB_PATH):
         self.db_path = db_path
+        self._local = threading.local()
+        self._queue = None
+        self._writer = None
+        self._writer_lock = threading.Lock()
         self._init_db()
 
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS analysis_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME,
-                    error_input TEXT,
-                    analysis_result TEXT,
-                    faithfulness REAL,
-                    relevancy REAL,
-                    context TEXT
-                )
-            """)
-            conn.commit()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS analysis_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME,
+                error_input TEXT,
+                analysis_result TEXT,
+                faithfulness REAL,
+                relevancy REAL,
+                context TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_timestamp ON analysis_history(timestamp, id);
+            CREATE TABLE IF NOT EXISTS history_rollups (
+                bucket TEXT,
+                start TEXT,
+                count INTEGER,
+                cached INTEGER,
+                faith_sum REAL, faith_n INTEGER, faith_min REAL, faith_max REAL,
+                rel_sum REAL, rel_n INTEGER, rel_min REAL, rel_max REAL,
+                latency_sum REAL, latency_n INTEGER, latency_max REAL,
+                PRIMARY KEY (bucket, start)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS chunk_feedback (
+                chunk_id TEXT PRIMARY KEY,
+                up INTEGER DEFAULT 0,
+                down INTEGER DEFAULT 0
+            ) WITHOUT ROWID;
+        """)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(analysis_history)")}
+        if "latency_ms" not in columns:
+            conn.execute("ALTER TABLE analysis_history ADD COLUMN latency_ms REAL")
+        if "cached" not in columns:
+            conn.execute("ALTER TABLE analysis_history ADD COLUMN cached INTEGER DEFAULT 0")
+        if "eval_status" not in columns:
+            # pending | running | done | failed | skipped (not sampled); NULL for rows scored inline
+            conn.execute("ALTER TABLE analysis_history ADD COLUMN eval_status TEXT")
+            conn.execute("ALTER TABLE analysis_history ADD COLUMN eval_claimed_at REAL")
+        if "chunk_ids" not in columns:
+            # IDs of the retrieved chunks (JSON) and the user's rating of the answer (1 / -1)
+            conn.execute("ALTER TABLE analysis_history ADD COLUMN chunk_ids TEXT")
+            conn.execute("ALTER TABLE analysis_history ADD COLUMN feedback INTEGER")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_history_eval ON analysis_history(eval_status)
+            WHERE eval_status IN ('pending', 'running')
+        """)
+        conn.commit()
+        if not conn.execute("SELECT 1 FROM history_rollups LIMIT 1").fetchone():
+            self._backfill_rollups(conn)
+
+    def _backfill_rollups(self, conn):
+        """One-time aggregation of a history that predates the rollups."""
+        # Processes starting together all see empty rollups: the write lock lets only the first aggregate
+        conn.execute("BEGIN IMMEDIATE")
+        with conn:
+            if conn.execute("SELECT 1 FROM history_rollups LIMIT 1").fetchone():
+                return
+            for bucket, start in ROLLUP_BUCKETS.items():
+                start = start.format(ts="timestamp")
+                conn.execute(f"""
+                    INSERT INTO history_rollups
+                    SELECT ?, {start}, COUNT(*), COALESCE(SUM(cached), 0),
+                           COALESCE(SUM(faithfulness), 0), COUNT(faithfulness), MIN(faithfulness), MAX(faithfulness),
+                           COALESCE(SUM(relevancy), 0), COUNT(relevancy), MIN(relevancy), MAX(relevancy),
+                           COALESCE(SUM(latency_ms), 0), COUNT(latency_ms), MAX(latency_ms)
+                    FROM analysis_history GROUP BY {start}
+                """, (bucket,))
+
+    def _rollup(self, conn, timestamp, count=1, cached=False, faithfulness=None, relevancy=None, latency_ms=None):
+        """Adds an analysis (or, with count=0, scores arriving later) to every bucket it falls in."""
+        values = (
+            count, int(bool(cached)),
+            faithfulness or 0.0, int(faithfulness is not None), faithfulness, faithfulness,
+            relevancy or 0.0, int(relevancy is not None), relevancy, relevancy,
+            latency_ms or 0.0, int(latency_ms is not None), latency_ms,
+        )
+        for bucket, start in ROLLUP_BUCKETS.items():
+            conn.execute(ROLLUP_UPSERT.format(start=start.format(ts="?")),
+                         (bucket,) + ((timestamp,) if bucket != "total" else ()) + values)
+
+    def _insert(self, conn, error_input, result, faithfulness, relevancy, context, latency_ms=None, cached=False,
+                evaluate=True, chunk_ids=None):
+        timestamp = datetime.now().isoformat()
+        # Unscored analyses are queued for the evaluation worker (a sample of them at peak load)
+        if faithfulness is not None or relevancy is not None:
+            eval_status = "done"
+        elif not evaluate:
+            eval_status = "skipped"
+        else:
+            eval_status = "pending" if random.random() < EVAL_SAMPLE_RATE else "skipped"
+        cursor = conn.execute("""
+            INSERT INTO analysis_history 
+            (timestamp, error_input, analysis_result, faithfulness, relevancy, context, latency_ms, cached, eval_status,
+             chunk_ids)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            timestamp,
+            error_input,
+            result,
+            faithfulness,
+            relevancy,
+            json.dumps(context),
+            latency_ms,
+            int(bool(cached)),
+            eval_status,
+            json.dumps(chunk_ids) if chunk_ids else None
+        ))
+        self._rollup(conn, timestamp, 1, cached, faithfulness, relevancy, latency_ms)
+        return cursor.lastrowid
+
+    def save_analysis(self, error_input, result, faithfulness, relevancy, context, latency_ms=None, cached=False,
+                      evaluate=True, chunk_ids=None):
+        """
+        Inserts an analysis and returns its id. Without scores it is queued for evaluation, unless `evaluate` is False.
+        `chunk_ids` (of the retrieved context) let a later rating reach the chunks, see `save_feedback`.
+        """
+        conn = self._conn()
+        with conn:
+            return self._insert(conn, error_input, result, faithfulness, relevancy, context, latency_ms, cached,
+                                evaluate, chunk_ids)
+
+    def enqueue_analysis(self, error_input, result, faithfulness, relevancy, context, latency_ms=None, cached=False,
+                         evaluate=True, chunk_ids=None):
+        """Queues an insert for the background writer. Returns a Future resolving to the new id."""
+        with self._writer_lock:
+            if self._writer is None:
+                self._queue = queue.Queue()
+                self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._writer.start()
+        future = Future()
+        self._queue.put(((error_input, result, faithfulness, relevancy, context, latency_ms, cached, evaluate,
+                          chunk_ids), future))
+        return future
+
+    def _write_loop(self):
+        conn = self._conn()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # Everything queued meanwhile goes into the same transaction (one fsync)
+            batch = [item]
+            while len(batch) < HISTORY_WRITE_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                with span("history_commit"), conn:
+                    ids = [self._insert(conn, *row) for row, _ in batch]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), row_id in zip(batch, ids):
+                future.set_result(row_id)
 
-    def save_analysis(self, error_input, result, faithfulness, relevancy, context):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO analysis_history 
-                (timestamp, error_input, analysis_result, faithfulness, relevancy, context)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                datetime.now().isoformat(),
-                error_input,
-                result,
-                faithfulness,
-                relevancy,
-                json.dumps(context)
-            ))
+    def close(self):
+        """Flushes the queued inserts and stops the writer."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def save_feedback(self, analysis_id, rating):
+        """
+        Rates an analysis (1 useful, -1 not useful) and credits its retrieved chunks.
+        Voting again replaces the previous rating. Returns the number of rated chunks,
+        or None if the analysis does not exist.
+        """
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT chunk_ids, feedback FROM analysis_history WHERE id = ?",
+                               (analysis_id,)).fetchone()
+            if row is None:
+                return None
+            chunk_ids = json.loads(row["chunk_ids"]) if row["chunk_ids"] else []
+            if row["feedback"] == rating:
+                return len(chunk_ids)
+            up, down = int(rating > 0), int(rating < 0)
+            if row["feedback"]:
+                # Undo the previous vote
+                up, down = up - int(row["feedback"] > 0), down - int(row["feedback"] < 0)
+            conn.executemany("""
+                INSERT INTO chunk_feedback (chunk_id, up, down) VALUES (?, MAX(?, 0), MAX(?, 0))
+                ON CONFLICT(chunk_id) DO UPDATE SET up = MAX(up + ?, 0), down = MAX(down + ?, 0)
+            """, [(chunk_id, up, down, up, down) for chunk_id in chunk_ids])
+            conn.execute("UPDATE analysis_history SET feedback = ? WHERE id = ?", (rating, analysis_id))
+        return len(chunk_ids)
+
+    def get_chunk_feedback(self):
+        """chunk_id -> (up, down) for every rated chunk."""
+        rows = self._conn().execute("SELECT chunk_id, up, down FROM chunk_feedback WHERE up > 0 OR down > 0")
+        return {row["chunk_id"]: (row["up"], row["down"]) for row in rows}
+
+    def claim_pending_evaluations(self, limit):
+        """Atomically marks up to `limit` pending analyses as running and returns them."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("""
+                SELECT id, error_input, analysis_result, context FROM analysis_history
+                WHERE eval_status = 'pending' ORDER BY id LIMIT ?
+            """, (limit,)).fetchall()
+            conn.executemany("UPDATE analysis_history SET eval_status = 'running', eval_claimed_at = ? WHERE id = ?",
+                             [(time.time(), row["id"]) for row in rows])
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return [dict(row, context=json.loads(row["context"]) if row["context"] else []) for row in rows]
 
-    def get_history(self, limit=50):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM analysis_history ORDER BY timestamp DESC LIMIT ?", (limit,))
-            return [dict(row) for row in cursor.fetchall()]
+    def save_evaluation(self, analysis_id, metrics):
+        """Writes the scores of an evaluated analysis back (and into its rollups), or marks it failed."""
+        conn = self._conn()
+        with conn:
+            if not metrics or (metrics.get("faithfulness") is None and metrics.get("relevancy") is None):
+                conn.execute("UPDATE analysis_history SET eval_status = 'failed' WHERE id = ?", (analysis_id,))
+                return
+            row = conn.execute("SELECT timestamp, error_input, analysis_result FROM analysis_history WHERE id = ?",
+                               (analysis_id,)).fetchone()
+            conn.execute("""
+                UPDATE analysis_history SET faithfulness = ?, relevancy = ?, eval_status = 'done' WHERE id = ?
+            """, (metrics["faithfulness"], metrics["relevancy"], analysis_id))
+            if row:
+                self._rollup(conn, row["timestamp"], 0, False, metrics["faithfulness"], metrics["relevancy"])
+                self._share_scores(conn, analysis_id, row, metrics)
+
+    def _share_scores(self, conn, analysis_id, row, metrics):
+        """
+        Scores of an evaluated answer also belong to its analysis-cache entry (later hits copy them)
+        and to the cache hits that replayed it before it was scored.
+        """
+        scores = {"faithfulness": metrics["faithfulness"], "relevancy": metrics["relevancy"]}
+        try:
+            conn.execute("UPDATE analysis_cache SET metrics = ? WHERE fingerprint = ? AND result = ?",
+                         (json.dumps(scores), fingerprint(row["error_input"]), row["analysis_result"]))
+        except sqlite3.OperationalError:
+            pass  # No analysis cache in this database
+        # Replays can only be newer than the answer they replay (rowid range, no full scan)
+        replays = conn.execute("""
+            SELECT id, timestamp FROM analysis_history
+            WHERE id > ? AND cached = 1 AND faithfulness IS NULL AND relevancy IS NULL AND analysis_result = ?
+        """, (analysis_id, row["analysis_result"])).fetchall()
+        for replay in replays:
+            conn.execute("""
+                UPDATE analysis_history SET faithfulness = ?, relevancy = ?, eval_status = 'done' WHERE id = ?
+            """, (scores["faithfulness"], scores["relevancy"], replay["id"]))
+            self._rollup(conn, replay["timestamp"], 0, False, scores["faithfulness"], scores["relevancy"])
+
+    def requeue_running_evaluations(self, stale_after=EVAL_TIMEOUT * 10):
+        """Puts back analyses claimed by a worker that stopped before scoring them."""
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                UPDATE analysis_history SET eval_status = 'pending'
+                WHERE eval_status = 'running' AND eval_claimed_at < ?
+            """, (time.time() - stale_after,))
+
+    def count_pending_evaluations(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM analysis_history WHERE eval_status IN ('pending', 'running')"
+        ).fetchone()[0]
+
+    def get_history(self, limit=50, before=None, include_details=False):
+        """
+        Latest analyses first. Pass the id of the last row received as `before` to get the
+        next page (keyset pagination: constant cost whatever the depth).
+        Without `include_details` only a preview of the error is returned.
+        """
+        columns = DETAIL_COLUMNS if include_details else SUMMARY_COLUMNS
+        if before is None:
+            rows = self._conn().execute(
+                f"SELECT {columns} FROM analysis_history ORDER BY timestamp DESC, id DESC LIMIT ?", (limit,)
+            )
+        else:
+            rows = self._conn().execute(f"""
+                SELECT {columns} FROM analysis_history
+                WHERE (timestamp, id) < (SELECT timestamp, id FROM analysis_history WHERE id = ?)
+                ORDER BY timestamp DESC, id DESC LIMIT ?
+            """, (before, limit))
+        return [dict(row) for row in rows.fetchall()]
+
+    def get_analysis(self, analysis_id):
+        """One analysis with its full answer and context, or None."""
+        row = self._conn().execute(
+            f"SELECT {DETAIL_COLUMNS} FROM analysis_history WHERE id = ?", (analysis_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _summarize(row):
+        def avg(total, n):
+            return total / n if n else None
+        return {
+            "start": row["start"],
+            "count": row["count"],
+            "cached": row["cached"],
+            "avg_faithfulness": avg(row["faith_sum"], row["faith_n"]),
+            "min_faithfulness": row["faith_min"],
+            "max_faithfulness": row["faith_max"],
+            "avg_relevancy": avg(row["rel_sum"], row["rel_n"]),
+            "min_relevancy": row["rel_min"],
+            "max_relevancy": row["rel_max"],
+            "avg_latency_ms": avg(row["latency_sum"], row["latency_n"]),
+            "max_latency_ms": row["latency_max"],
+        }
+
+    @staticmethod
+    def _bucket_start(bucket, timestamp):
+        return timestamp[:13] + ":00" if bucket == "hour" else timestamp[:10]
+
+    def get_timeseries(self, bucket="day", start=None, end=None):
+        """
+        Rollups of one bucket size ("hour" or "day") between `start` (inclusive) and `end`
+        (exclusive), as ISO date/datetime strings. Defaults to the last 48 hours / 30 days.
+        """
+        if bucket not in DEFAULT_RANGES:
+            raise ValueError(f"Unknown bucket '{bucket}', expected one of {sorted(DEFAULT_RANGES)}")
+        start = start or (datetime.now() - DEFAULT_RANGES[bucket]).isoformat()
+        # Bucket starts are ISO prefixes, so once both bounds are trimmed to the bucket
+        # a plain string comparison selects the range
+        query = "SELECT * FROM history_rollups WHERE bucket = ? AND start >= ?"
+        params = [bucket, self._bucket_start(bucket, start)]
+        if end:
+            query += " AND start < ?"
+            params.append(self._bucket_start(bucket, end))
+        rows = self._conn().execute(query + " ORDER BY start", params).fetchall()
+        return [self._summarize(row) for row in rows]
 
     def get_stats(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*), AVG(faithfulness), AVG(relevancy) FROM analysis_history")
-            count, avg_faith, avg_relevancy = cursor.fetchone()
-            return {
-                "total_analyses": count or 0,
-                "avg_faithfulness": avg_faith or 0.0,
-                "avg_relevancy": avg_relevancy or 0.0
-            }
+        row = self._conn().execute("SELECT * FROM history_rollups WHERE bucket = 'total'").fetchone()
+        summary = self._summarize(row) if row else {}
+        return {
+            "total_analyses": summary.get("count") or 0,
+            "avg_faithfulness": summary.get("avg_faithfulness") or 0.0,
+            "avg_relevancy": summary.get("avg_relevancy") or 0.0,
+            "cache_hits": summary.get("cached") or 0,
+            "avg_latency_ms": summary.get("avg_latency_ms")
+        }
@@ -0,0 +1,250 @@
+import os
+import json
+import hashlib
+import time
+from src.loader import LogLoader
+from src.keyword_index import KeywordIndex
+from src.telemetry import span, STAGE_SECONDS
+from src.config import MANIFEST_PATH
+
+# Chroma rejects very large upserts, so chunks are written in batches
+ADD_BATCH_SIZE = 1000
+# How often (seconds) the manifest is checkpointed during a long sync
+MANIFEST_CHECKPOINT_INTERVAL = 10
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+
+def iter_with_chunk_ids(source, chunks):
+    """
+    Gives every chunk a deterministic ID derived from its source and its text.
+    Unchanged chunks keep their ID when a file changes (e.g. a log that only grew),
+    so only the new or modified chunks need to be embedded again.
+    Works on a stream of chunks and yields (chunk_id, chunk).
+    """
+    seen = {}
+    for chunk in chunks:
+        base = hashlib.sha1(f"{source}\x00{chunk.page_content}".encode("utf-8", errors="ignore")).hexdigest()
+        # Identical chunks inside the same source get an occurrence suffix
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        chunk_id = base if occurrence == 0 else f"{base}-{occurrence}"
+        chunk.metadata["chunk_id"] = chunk_id
+        yield chunk_id, chunk
+
+def assign_chunk_ids(source, chunks):
+    return [chunk_id for chunk_id, _ in iter_with_chunk_ids(source, chunks)]
+
+class IngestManifest:
+    """Persisted map of source -> {hash, mtime, size, chunk_ids} of what is already indexed."""
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.exists = os.path.exists(path)
+        self.sources = {}
+        if self.exists:
+            with open(path, "r", encoding="utf-8") as f:
+                self.sources = json.load(f).get("sources", {})
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "sources": self.sources}, f)
+        os.replace(tmp_path, self.path)  # Atomic, a crash never leaves a half-written manifest
+        self.exists = True
+
+class IncrementalIndexer:
+    """
+    Keeps the vector store in sync with the data sources:
+    - new or changed sources are split and embedded (only their new chunks),
+    - deleted sources have their chunks removed,
+    - unchanged sources are skipped without even being read (mtime + size check).
+
+    With `fork`, the given index is never written: on the first change, `fork(copy)` returns
+    (vectorstore, keyword_index, manifest_path) of a new index generation, a copy of this
+    one (or an empty one when `copy` is False), and every write goes there. Requests served
+    by the current generation never see a half-ingested index; `forked` tells whether
+    anything changed. `progress`, when given, is a dict updated in place while the sync runs.
+    """
+    def __init__(self, vectorstore, loader=None, manifest_path=MANIFEST_PATH, keyword_index=None,
+                 fork=None, progress=None):
+        self.vectorstore = vectorstore
+        self.loader = loader or LogLoader()
+        self.keyword_index = keyword_index or KeywordIndex()
+        self.manifest = IngestManifest(manifest_path)
+        self.fork = fork
+        self.forked = False
+        self.progress = progress if progress is not None else {}
+
+    def _writable(self, copy=True):
+        """The index to write to (forking the new generation on first use)."""
+        if self.fork is not None and not self.forked:
+            self.vectorstore, self.keyword_index, self.manifest.path = self.fork(copy)
+            self.forked = True
+        return self.vectorstore, self.keyword_index
+
+    def _delete(self, ids):
+        vectorstore, keyword_index = self._writable()
+        for i in range(0, len(ids), ADD_BATCH_SIZE):
+            vectorstore.delete(ids=ids[i:i + ADD_BATCH_SIZE])
+            keyword_index.remove(ids[i:i + ADD_BATCH_SIZE])
+
+    def _apply(self, source, chunks, entry, report):
+        """Replaces the indexed chunks of a source with the given ones (an iterable, consumed lazily)."""
+        old_ids = set(entry.get("chunk_ids", [])) if entry else set()
+        new_ids = []
+        batch = []
+
+        def flush():
+            # Embedding happens inside add_documents (also timed as "embed")
+            vectorstore, keyword_index = self._writable()
+            with span("sync_index"):
+                vectorstore.add_documents([c for _, c in batch], ids=[cid for cid, _ in batch])
+                keyword_index.add_documents([c for _, c in batch])
+            report["chunks_added"] += len(batch)
+            batch.clear()
+
+        for chunk_id, chunk in iter_with_chunk_ids(source, chunks):
+            new_ids.append(chunk_id)
+            if chunk_id not in old_ids:
+                batch.append((chunk_id, chunk))
+                if len(batch) >= ADD_BATCH_SIZE:
+                    flush()
+        if batch:
+            flush()
+
+        to_remove = list(old_ids - set(new_ids))
+        if to_remove:
+            self._delete(to_remove)
+
+        report["chunks_removed"] += len(to_remove)
+        report["updated" if entry else "added"].append(source)
+        return new_ids
+
+    def _remove(self, source, report):
+        entry = self.manifest.sources.pop(source)
+        if entry.get("chunk_ids"):
+            self._delete(entry["chunk_ids"])
+        report["chunks_removed"] += len(entry.get("chunk_ids", []))
+        report["removed"].append(source)
+
+    def _check_consistency(self):
+        """Makes sure the manifest and the vector store describe the same index."""
+        has_chunks = bool(self.vectorstore.get(limit=1, include=[]).get("ids"))
+        if not self.manifest.exists and has_chunks:
+            # An index built before the manifest existed has random IDs: rebuild it once
+            print("Existing vector database has no ingest manifest. Rebuilding it once...")
+            if self.fork is not None:
+                self._writable(copy=False)
+            else:
+                self.vectorstore.reset_collection()
+                self.keyword_index.clear()
+        elif self.manifest.sources and not has_chunks:
+            print("Vector database is empty but the manifest is not. Re-indexing everything...")
+            self.manifest.sources = {}
+            if self.fork is not None:
+                self._writable(copy=False)
+            else:
+                self.keyword_index.clear()
+
+    def _apply_external(self, docs, report):
+        """Indexes the documents of a connector, grouped by source, skipping unchanged ones."""
+        sources = self.manifest.sources
+        by_source = {}
+        for doc in docs:
+            by_source.setdefault(doc.metadata.get("source", "external"), []).append(doc)
+
+        for source, source_docs in by_source.items():
+            entry = sources.get(source)
+            content_hash = hash_text("\n".join(d.page_content for d in source_docs))
+            if entry and entry["hash"] == content_hash:
+                report["unchanged"] += 1
+                continue
+            chunk_ids = self._apply(source, self.loader.split(source_docs), entry, report)
+            sources[source] = {"hash": content_hash, "mtime": None, "size": None,
+                               "chunk_ids": chunk_ids, "kind": "external"}
+
+    def sync(self):
+        """Brings the index up to date and returns a report of what changed."""
+        report = {"added": [], "updated": [], "removed": [], "unchanged": 0,
+                  "chunks_added": 0, "chunks_removed": 0, "failures": [], "timings": {}}
+        sync_start = time.perf_counter()
+        os.makedirs(self.loader.data_path, exist_ok=True)
+        self._check_consistency()
+        sources = self.manifest.sources
+        last_checkpoint = time.monotonic()
+
+        # 1. Cheap mtime + size check: only candidates are hashed and parsed
+        local_files = self.loader.list_local_files()
+        pending = {}
+        for file_path in local_files:
+            stat = os.stat(file_path)
+            entry = sources.get(file_path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                report["unchanged"] += 1
+            else:
+                pending[file_path] = stat
+        known_hashes = {f: sources[f]["hash"] for f in pending if f in sources}
+        self.progress.update(files_total=len(local_files), files_done=report["unchanged"],
+                             chunks_added=0, chunks_removed=0)
+
+        # 2. Parse concurrently and embed each source as soon as it is ready
+        for result in self.loader.iter_parsed(list(pending), known_hashes):
+            source = result["source"]
+            timing = report["timings"].setdefault(result["kind"], {"sources": 0, "parse_s": 0.0, "index_s": 0.0, "failures": 0})
+            timing["sources"] += 1
+            timing["parse_s"] += result["parse_s"]
+            STAGE_SECONDS.observe(result["parse_s"], stage="sync_parse")
+            if source in pending:
+                self.progress["files_done"] += 1
+            if result["error"]:
+                timing["failures"] += 1
+                report["failures"].append({"source": source, "error": result["error"]})
+                continue
+
+            start = time.perf_counter()
+            try:
+                if result["docs"] is not None:
+                    self._apply_external(result["docs"], report)
+                elif result["chunks"] is None:
+                    # Touched but identical content
+                    stat = pending[source]
+                    sources[source].update(mtime=stat.st_mtime, size=stat.st_size)
+                    report["unchanged"] += 1
+                else:
+                    # Streamed .log files are parsed lazily here, so their parsing counts as indexing time
+                    stat = pending[source]
+                    chunk_ids = self._apply(source, result["chunks"], sources.get(source), report)
+                    sources[source] = {"hash": result["hash"], "mtime": stat.st_mtime,
+                                       "size": stat.st_size, "chunk_ids": chunk_ids, "kind": "local"}
+            except Exception as e:
+                print(f"Error indexing {source}: {e}")
+                timing["failures"] += 1
+                report["failures"].append({"source": source, "error": f"{type(e).__name__}: {e}"})
+            timing["index_s"] += time.perf_counter() - start
+            self.progress.update(chunks_added=report["chunks_added"], chunks_removed=report["chunks_removed"])
+
+            if time.monotonic() - last_checkpoint > MANIFEST_CHECKPOINT_INTERVAL:
+                self.manifest.save()  # Progress survives an interrupted sync
+                last_checkpoint = time.monotonic()
+
+        # 3. Deleted files
+        local_set = set(local_files)
+        for source in [s for s, e in sources.items() if e.get("kind") == "local" and s not in local_set]:
+            self._remove(source, report)
+        self.progress.update(chunks_removed=report["chunks_removed"])
+
+        self.manifest.save()
+        report["total_s"] = round(time.perf_counter() - sync_start, 3)
+        embeddings = getattr(self.vectorstore, "embeddings", None)
+        if hasattr(embeddings, "stats"):
+            report["embedding"] = embeddings.stats()
+        print(f"Sync done in {report['total_s']}s: {len(report['added'])} new, {len(report['updated'])} changed, "
+              f"{len(report['removed'])} removed, {report['unchanged']} unchanged sources "
+              f"(+{report['chunks_added']} / -{report['chunks_removed']} chunks, {len(report['failures'])} failures).")
+        for kind, timing in sorted(report["timings"].items()):
+            print(f"  {kind}: {timing['sources']} sources, parse {timing['parse_s']:.2f}s, "
+                  f"index {timing['index_s']:.2f}s, {timing['failures']} failures")
+        if "embedding" in report:
+            print(f"  embedding: {report['embedding']['chunks_per_s']} chunks/s, "
+                  f"{report['embedding']['cache_hits']} cache hits")
+        return report
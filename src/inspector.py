@@ -1,36 +1,101 @@
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from src.config import DB_PATH, EMBEDDING_MODEL
+from src.config import DB_PATH
+from src.vector_store import VectorStoreManager
+from src.keyword_index import KeywordIndex
+
+# Chunks read per request when stats have to be aggregated from Chroma itself
+STATS_PAGE_SIZE = 5000
 
 class DatabaseInspector:
-    def __init__(self, db_path=DB_PATH, model_name=EMBEDDING_MODEL):
-        self.embeddings = HuggingFaceEmbeddings(model_name=model_name)
-        self.vectorstore = Chroma(persist_directory=db_path, embedding_function=self.embeddings)
+    """
+    Read-only views of the indexed chunks that never load the whole collection:
+    a count, offset/limit browsing filtered by source/type, and per-source stats.
+    """
+    def __init__(self, db_path=DB_PATH, keyword_index=None, vectorstore=None):
+        # Reuses the process-wide embedder and Chroma client instead of loading new ones
+        vs_manager = VectorStoreManager(db_path)
+        self.embeddings = vs_manager.embeddings
+        # An index generation passes its own collection and keyword index (see src/sync.py)
+        self.vectorstore = vectorstore if vectorstore is not None else vs_manager.open_vectorstore()
+        # The keyword index mirrors the default collection in SQLite, where stats are one query
+        self.keyword_index = keyword_index if keyword_index is not None else \
+            (KeywordIndex() if db_path == DB_PATH else None)
+
+    @property
+    def collection(self):
+        return self.vectorstore._collection
+
+    def count(self):
+        """Number of chunks (metadata only, nothing is read)."""
+        return self.collection.count()
+
+    @staticmethod
+    def _where(source=None, doc_type=None):
+        clauses = [{key: value} for key, value in (("source", source), ("type", doc_type)) if value]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
 
-    def inspect(self, limit=10):
-        """Displays stored document snippets and their metadata."""
-        data = self.vectorstore.get()
-        ids = data.get('ids', [])
-        documents = data.get('documents', [])
-        metadatas = data.get('metadatas', [])
+    def browse(self, offset=0, limit=20, source=None, doc_type=None):
+        """One page of chunks ({id, source, type, chars, content}), optionally filtered by source and/or type."""
+        page = self.collection.get(where=self._where(source, doc_type), limit=limit, offset=offset,
+                                   include=["documents", "metadatas"])
+        return [
+            {"id": chunk_id, "source": (metadata or {}).get("source"), "type": (metadata or {}).get("type"),
+             "chars": len(text or ""), "content": text}
+            for chunk_id, text, metadata in zip(page.get("ids", []), page.get("documents", []), page.get("metadatas", []))
+        ]
 
+    def source_stats(self):
+        """Chunks and bytes per (source, type), largest sources first."""
+        if self.keyword_index is not None and self.keyword_index.count() == self.count():
+            return self.keyword_index.source_stats()
+
+        # Remote or out-of-sync collection: aggregated page by page, memory stays bounded
+        totals = {}
+        offset = 0
+        while True:
+            page = self.collection.get(limit=STATS_PAGE_SIZE, offset=offset, include=["documents", "metadatas"])
+            ids = page.get("ids", [])
+            if not ids:
+                break
+            for text, metadata in zip(page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                entry = totals.setdefault((metadata.get("source"), metadata.get("type")), [0, 0])
+                entry[0] += 1
+                entry[1] += len((text or "").encode("utf-8"))
+            offset += len(ids)
+        stats = [{"source": source, "type": doc_type, "chunks": chunks, "bytes": size}
+                 for (source, doc_type), (chunks, size) in totals.items()]
+        return sorted(stats, key=lambda s: s["chunks"], reverse=True)
+
+    def inspect(self, limit=10, stats=False):
+        """Displays the total, the chunks per source (with `stats`) and the first `limit` chunk snippets."""
+        total = self.count()
         print("\n" + "="*50)
-        print(f"📊 CHROMADB INSPECTOR - Total Chunks: {len(ids)}")
+        print(f"📊 CHROMADB INSPECTOR - Total Chunks: {total}")
         print("="*50)
 
-        if not ids:
+        if not total:
             print("La base de datos está vacía.")
             return
 
-        for i in range(min(limit, len(ids))):
-            content_snippet = documents[i][:150].replace('\n', ' ')
-            print(f"\n🔹 Chnk ID: {ids[i]}")
-            print(f"   Fuente: {metadatas[i].get('source', 'N/A')}")
-            print(f"   Tipo: {metadatas[i].get('type', 'log')}")
+        if stats:
+            for entry in self.source_stats():
+                print(f"   {entry['chunks']:>8} chunks  {entry['bytes'] / 2**20:>8.1f} MB  "
+                      f"[{entry['type'] or 'log'}] {entry['source'] or 'N/A'}")
+
+        for chunk in self.browse(limit=limit) if limit else []:
+            content_snippet = chunk["content"][:150].replace('\n', ' ')
+            print(f"\n🔹 Chnk ID: {chunk['id']}")
+            print(f"   Fuente: {chunk['source'] or 'N/A'}")
+            print(f"   Tipo: {chunk['type'] or 'log'}")
             print(f"   Contenido: {content_snippet}...")
         
         print("\n" + "="*50)
 
 if __name__ == "__main__":
-    inspector = DatabaseInspector()
-    inspector.inspect()
+    # The generation currently published by the syncs (API, UI or CLI)
+    from src.sync import GenerationSignal, IndexFiles
+    files = IndexFiles(GenerationSignal().read()["artifacts"])
+    inspector = DatabaseInspector(vectorstore=files.vectorstore, keyword_index=files.keyword_index)
+    inspector.inspect(stats=True)
@@ -0,0 +1,289 @@
+import re
+import math
+import json
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.signatures import extract_signatures
+from src.config import KEYWORD_INDEX_PATH, SIGNATURE_MAX_CHUNKS
+
+# Keeps identifiers such as "0x8004210B", "ORA-00942" or "org.openqa.selenium" as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[-.:][a-z0-9_]+)*")
+PART_RE = re.compile(r"[-.:]")
+
+# BM25 parameters (same defaults as rank_bm25)
+K1 = 1.5
+B = 0.75
+# Terms present in more than this share of chunks barely change the ranking, skip their postings
+MAX_DF_RATIO = 0.5
+
+def tokenize(text):
+    """Lowercased tokens; compound identifiers are indexed whole and by parts."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if PART_RE.search(token):
+            tokens.extend(part for part in PART_RE.split(token) if part)
+    return tokens
+
+class KeywordIndex:
+    """
+    On-disk BM25 inverted index stored in SQLite (postings, doc lengths, document frequencies).
+    Nothing is loaded at startup: queries read only the postings of their own terms
+    (memory-mapped by SQLite), and chunks can be added or removed incrementally.
+    Next to the postings it keeps the exact signatures of each chunk (error codes, exception
+    classes, HTTP statuses, top stack frames, see src/signatures.py) for the fast path.
+    """
+    def __init__(self, path=KEYWORD_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._init_db()
+
+    def _conn(self):
+        # One connection per thread: retrieval runs on a thread pool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=268435456")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        had_signatures = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'signatures'"
+        ).fetchone()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                chunk_id TEXT PRIMARY KEY,
+                length INTEGER,
+                content TEXT,
+                metadata TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT,
+                chunk_id TEXT,
+                tf INTEGER,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS signatures (
+                signature TEXT,
+                chunk_id TEXT,
+                PRIMARY KEY (signature, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_signatures_chunk ON signatures(chunk_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value REAL
+            );
+            INSERT OR IGNORE INTO stats VALUES ('doc_count', 0), ('total_length', 0);
+        """)
+        conn.commit()
+        if not had_signatures and self.count():
+            self._backfill_signatures(conn)
+
+    def _backfill_signatures(self, conn, page_size=5000):
+        """Index created before the signatures: extracted once from the stored chunks."""
+        print("Building the signature index from the keyword index...")
+        with self._write_lock:
+            last = ""
+            while True:
+                rows = conn.execute("SELECT chunk_id, content FROM docs WHERE chunk_id > ? ORDER BY chunk_id LIMIT ?",
+                                    (last, page_size)).fetchall()
+                if not rows:
+                    break
+                conn.executemany("INSERT OR IGNORE INTO signatures VALUES (?, ?)",
+                                 [(s, chunk_id) for chunk_id, content in rows for s in extract_signatures(content)])
+                last = rows[-1][0]
+            conn.commit()
+
+    def _stats(self, conn):
+        rows = dict(conn.execute("SELECT key, value FROM stats").fetchall())
+        return int(rows["doc_count"]), rows["total_length"]
+
+    def count(self):
+        return self._stats(self._conn())[0]
+
+    def source_stats(self):
+        """Chunks and bytes per (source, type), aggregated by SQLite without loading the chunks."""
+        rows = self._conn().execute("""
+            SELECT json_extract(metadata, '$.source'), json_extract(metadata, '$.type'),
+                   COUNT(*), SUM(LENGTH(CAST(content AS BLOB)))
+            FROM docs GROUP BY 1, 2 ORDER BY 3 DESC
+        """)
+        return [{"source": source, "type": doc_type, "chunks": chunks, "bytes": size or 0}
+                for source, doc_type, chunks, size in rows]
+
+    def add_documents(self, docs):
+        """Indexes chunks (they must carry a `chunk_id` in their metadata). Existing IDs are replaced."""
+        with self._write_lock:
+            conn = self._conn()
+            ids = [d.metadata["chunk_id"] for d in docs]
+            self._remove(conn, ids)
+            doc_count, total_length = self._stats(conn)
+            df_delta = Counter()
+            for doc, chunk_id in zip(docs, ids):
+                tfs = Counter(tokenize(doc.page_content))
+                length = sum(tfs.values())
+                conn.execute("INSERT INTO docs VALUES (?, ?, ?, ?)",
+                             (chunk_id, length, doc.page_content, json.dumps(doc.metadata)))
+                conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                 [(term, chunk_id, tf) for term, tf in tfs.items()])
+                conn.executemany("INSERT OR IGNORE INTO signatures VALUES (?, ?)",
+                                 [(s, chunk_id) for s in extract_signatures(doc.page_content)])
+                df_delta.update(tfs.keys())
+                doc_count += 1
+                total_length += length
+            conn.executemany("""
+                INSERT INTO terms VALUES (?, ?)
+                ON CONFLICT(term) DO UPDATE SET df = df + excluded.df
+            """, df_delta.items())
+            self._set_stats(conn, doc_count, total_length)
+            conn.commit()
+
+    def remove(self, chunk_ids):
+        with self._write_lock:
+            conn = self._conn()
+            self._remove(conn, chunk_ids)
+            conn.commit()
+
+    def _remove(self, conn, chunk_ids):
+        doc_count, total_length = self._stats(conn)
+        for chunk_id in chunk_ids:
+            row = conn.execute("SELECT length FROM docs WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if not row:
+                continue
+            terms = [t for (t,) in conn.execute("SELECT term FROM postings WHERE chunk_id = ?", (chunk_id,))]
+            conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(t,) for t in terms])
+            conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            conn.execute("DELETE FROM signatures WHERE chunk_id = ?", (chunk_id,))
+            conn.execute("DELETE FROM docs WHERE chunk_id = ?", (chunk_id,))
+            doc_count -= 1
+            total_length -= row[0]
+        conn.execute("DELETE FROM terms WHERE df <= 0")
+        self._set_stats(conn, doc_count, total_length)
+
+    def _set_stats(self, conn, doc_count, total_length):
+        conn.executemany("UPDATE stats SET value = ? WHERE key = ?",
+                         [(doc_count, "doc_count"), (total_length, "total_length")])
+
+    def copy_to(self, path):
+        """Consistent copy of the whole index into the file `path` (SQLite backup)."""
+        with self._write_lock:
+            target = sqlite3.connect(path)
+            try:
+                self._conn().backup(target)
+            finally:
+                target.close()
+
+    def clear(self):
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript("""
+                DELETE FROM postings; DELETE FROM docs; DELETE FROM terms; DELETE FROM signatures;
+                UPDATE stats SET value = 0;
+            """)
+            conn.commit()
+
+    def rebuild_from_vectorstore(self, vectorstore, page_size=5000):
+        """Rebuilds the whole index from the chunks stored in Chroma."""
+        print("Rebuilding keyword index from the vector database...")
+        self.clear()
+        offset = 0
+        while True:
+            page = vectorstore.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            ids = page.get("ids", [])
+            if not ids:
+                break
+            docs = []
+            for chunk_id, text, metadata in zip(ids, page["documents"], page["metadatas"]):
+                metadata = dict(metadata or {})
+                metadata["chunk_id"] = chunk_id
+                docs.append(Document(page_content=text, metadata=metadata))
+            self.add_documents(docs)
+            offset += len(ids)
+        print(f"Keyword index ready: {self.count()} chunks.")
+
+    def search(self, query, k=10):
+        """Returns the top-k (Document, score) pairs by BM25."""
+        conn = self._conn()
+        doc_count, total_length = self._stats(conn)
+        terms = set(tokenize(query))
+        if not doc_count or not terms:
+            return []
+        avg_length = total_length / doc_count
+
+        placeholders = ",".join("?" * len(terms))
+        dfs = dict(conn.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", list(terms)).fetchall())
+        selective = {t: df for t, df in dfs.items() if df / doc_count <= MAX_DF_RATIO}
+        dfs = selective or dfs
+
+        scores = Counter()
+        for term, df in dfs.items():
+            idf = math.log((doc_count - df + 0.5) / (df + 0.5) + 1)
+            rows = conn.execute("""
+                SELECT p.chunk_id, p.tf, d.length FROM postings p
+                JOIN docs d ON d.chunk_id = p.chunk_id
+                WHERE p.term = ?
+            """, (term,))
+            for chunk_id, tf, length in rows:
+                scores[chunk_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+        return [(self._document(conn, chunk_id), score) for chunk_id, score in scores.most_common(k)]
+
+    def _document(self, conn, chunk_id):
+        content, metadata = conn.execute(
+            "SELECT content, metadata FROM docs WHERE chunk_id = ?", (chunk_id,)
+        ).fetchone()
+        return Document(page_content=content, metadata=json.loads(metadata), id=chunk_id)
+
+    def signature_search(self, signatures, k=10, max_chunks=SIGNATURE_MAX_CHUNKS):
+        """
+        Exact lookup of signatures (primary-key probes, no scoring pass over postings).
+        Signatures found in more than `max_chunks` chunks (a bare NullPointerException, HTTP 500)
+        say nothing about the cause and are ignored. Returns ([(Document, score, matched signatures)],
+        known) where `known` are the selective signatures present in the index; chunks are
+        ranked by the summed rarity of the signatures they share with the query.
+        """
+        conn = self._conn()
+        doc_count = self._stats(conn)[0]
+        if not signatures or not doc_count:
+            return [], set()
+        dfs = {}
+        for signature in signatures:
+            # Counting stops past max_chunks: a frequent signature costs no more than a rare one
+            (df,) = conn.execute("SELECT COUNT(*) FROM (SELECT 1 FROM signatures WHERE signature = ? LIMIT ?)",
+                                 (signature, max_chunks + 1)).fetchone()
+            if 0 < df <= max_chunks:
+                dfs[signature] = df
+        if not dfs:
+            return [], set()
+
+        scores, matched = Counter(), {}
+        placeholders = ",".join("?" * len(dfs))
+        for signature, chunk_id in conn.execute(
+            f"SELECT signature, chunk_id FROM signatures WHERE signature IN ({placeholders})", list(dfs)
+        ):
+            scores[chunk_id] += math.log(1 + doc_count / dfs[signature])
+            matched.setdefault(chunk_id, set()).add(signature)
+        return ([(self._document(conn, chunk_id), score, matched[chunk_id]) for chunk_id, score in scores.most_common(k)],
+                set(dfs))
+
+class KeywordRetriever(BaseRetriever):
+    """LangChain retriever over the persistent KeywordIndex (drop-in for BM25Retriever)."""
+    index: Any
+    k: int = 10
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        return [doc for doc, _ in self.index.search(query, k=self.k)]
@@ -1,16 +1,56 @@
 import os
 import json
+import time
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from langchain_core.documents import Document
+from src.telemetry import span
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader, UnstructuredMarkdownLoader
+from langchain_community.document_loaders import PyPDFLoader, UnstructuredMarkdownLoader
 from langchain_community.document_loaders import ConfluenceLoader
-from src.config import DATA_PATH, CHUNK_SIZE, CHUNK_OVERLAP
+from src.config import DATA_PATH, CHUNK_SIZE, CHUNK_OVERLAP, LOG_TEMPLATE_MINING
+from src.config import INGEST_PROCESS_WORKERS, INGEST_THREAD_WORKERS
 from src.config import JIRA_URL, JIRA_API_TOKEN, JIRA_USERNAME
 from src.config import CONFLUENCE_URL, CONFLUENCE_API_TOKEN, CONFLUENCE_USERNAME
+from src.log_templates import mine_log_file
+from src.log_reader import iter_log_chunks
+
+LOCAL_EXTENSIONS = (".log", ".pdf", ".md", ".json")
+
+def hash_file(file_path):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def source_kind(source):
+    """Short label used to group timings: file extension, or the external connector."""
+    if source in ("jira", "confluence"):
+        return source
+    return os.path.splitext(source)[1].lstrip(".") or "other"
+
+def _parse_local_file(file_path, known_hash, mine_templates):
+    """
+    Worker (runs in a child process): hashes a file and, if it changed, parses and splits it.
+    Returns (hash, chunks, seconds). `chunks` is None when the content did not change, and
+    "stream" for raw .log files, which are streamed by the caller instead of pickled back.
+    """
+    start = time.perf_counter()
+    content_hash = hash_file(file_path)
+    if content_hash == known_hash:
+        chunks = None
+    elif file_path.endswith(".log") and not mine_templates:
+        chunks = "stream"
+    else:
+        chunks = list(LogLoader(mine_templates=mine_templates).iter_file_chunks(file_path))
+    return content_hash, chunks, time.perf_counter() - start
 
 class LogLoader:
-    def __init__(self, data_path=DATA_PATH):
+    def __init__(self, data_path=DATA_PATH, mine_templates=LOG_TEMPLATE_MINING):
         self.data_path = data_path
+        self.mine_templates = mine_templates
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE, 
             chunk_overlap=CHUNK_OVERLAP
@@ -79,6 +119,7 @@ class LogLoader:
                 return documents
             except Exception as e:
                 print(f"Jira loading failed: {e}")
+                raise
         return []
 
     def _load_confluence(self):
@@ -93,39 +134,109 @@ class LogLoader:
                 return loader.load()
             except Exception as e:
                 print(f"Confluence loading failed: {e}")
+                raise
+        return []
+
+    def list_local_files(self):
+        """Returns the local files that the loader knows how to ingest."""
+        if not os.path.exists(self.data_path):
+            return []
+        return sorted(
+            os.path.join(self.data_path, filename)
+            for filename in os.listdir(self.data_path)
+            if filename.endswith(LOCAL_EXTENSIONS)
+        )
+
+    def load_file(self, file_path):
+        """Loads a single local file into (unsplit) Documents."""
+        if file_path.endswith(".json"):
+            doc = self._process_json_file(file_path)
+            return [doc] if doc else []
+        if file_path.endswith(".log"):
+            # Repetitive lines are collapsed into templates + distinct anomalies
+            if self.mine_templates:
+                return mine_log_file(file_path)
+            return list(iter_log_chunks(file_path))
+        if file_path.endswith(".pdf"):
+            return PyPDFLoader(file_path).load()
+        if file_path.endswith(".md"):
+            return UnstructuredMarkdownLoader(file_path).load()
         return []
 
+    def iter_file_chunks(self, file_path):
+        """
+        Yields the chunks of a single local file. Raw .log files are streamed record by
+        record (constant memory, never cutting a stack trace); the rest is loaded and split.
+        """
+        if file_path.endswith(".log") and not self.mine_templates:
+            yield from iter_log_chunks(file_path, CHUNK_SIZE)
+        else:
+            yield from self.split(self.load_file(file_path))
+
+    def iter_parsed(self, files, known_hashes=None, process_workers=INGEST_PROCESS_WORKERS,
+                    thread_workers=INGEST_THREAD_WORKERS):
+        """
+        Concurrent parsing pipeline. Local files are hashed, parsed and split on a process
+        pool (CPU bound: PDF, Markdown, JSON, template mining) while Jira and Confluence are
+        fetched on threads. Results are yielded as soon as each source finishes, so the
+        caller can start embedding while the rest is still being parsed.
+
+        Yields dicts: {source, kind, hash, chunks | docs, parse_s, error}
+        - local files: `chunks` (None = unchanged, or a lazy iterator for streamed .log files)
+        - external connectors: `docs` (unsplit, one connector may return many sources)
+        """
+        known_hashes = known_hashes or {}
+        # "spawn" avoids forking a process that already holds model threads (torch, tokenizers)
+        processes = ProcessPoolExecutor(max_workers=process_workers,
+                                        mp_context=multiprocessing.get_context("spawn")) \
+            if process_workers > 0 and len(files) > 1 else ThreadPoolExecutor(max_workers=thread_workers)
+        threads = ThreadPoolExecutor(max_workers=thread_workers)
+
+        def timed(load_source):
+            start = time.perf_counter()
+            return load_source(), time.perf_counter() - start
+
+        futures = {}
+        with processes, threads:
+            for file_path in files:
+                future = processes.submit(_parse_local_file, file_path, known_hashes.get(file_path), self.mine_templates)
+                futures[future] = file_path
+            futures[threads.submit(timed, self._load_jira)] = "jira"
+            futures[threads.submit(timed, self._load_confluence)] = "confluence"
+
+            for future in as_completed(futures):
+                source = futures[future]
+                result = {"source": source, "kind": source_kind(source), "hash": None,
+                          "chunks": None, "docs": None, "parse_s": 0.0, "error": None}
+                try:
+                    if source in ("jira", "confluence"):
+                        result["docs"], result["parse_s"] = future.result()
+                    else:
+                        result["hash"], chunks, result["parse_s"] = future.result()
+                        result["chunks"] = self.iter_file_chunks(source) if chunks == "stream" else chunks
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                yield result
+
+    def split(self, docs):
+        return self.text_splitter.split_documents(docs)
+
     def load(self):
         """Loads logs and error reports from multiple sources."""
         if not os.path.exists(self.data_path):
             os.makedirs(self.data_path)
             return []
 
-        all_docs = []
-
-        # 1. Load Local Files
-        log_loader = DirectoryLoader(self.data_path, glob="./*.log", loader_cls=TextLoader)
-        all_docs.extend(log_loader.load())
-        
-        pdf_loader = DirectoryLoader(self.data_path, glob="./*.pdf", loader_cls=PyPDFLoader)
-        all_docs.extend(pdf_loader.load())
-
-        md_loader = DirectoryLoader(self.data_path, glob="./*.md", loader_cls=UnstructuredMarkdownLoader)
-        all_docs.extend(md_loader.load())
-
-        # 2. Process JSONs manually
-        for filename in os.listdir(self.data_path):
-            if filename.endswith(".json"):
-                file_path = os.path.join(self.data_path, filename)
-                doc = self._process_json_file(file_path)
-                if doc:
-                    all_docs.append(doc)
-        
-        # 3. Load External Sources
-        all_docs.extend(self._load_jira())
-        all_docs.extend(self._load_confluence())
-
-        if not all_docs:
-            return []
+        all_chunks = []
+
+        # Local files and external sources are parsed concurrently
+        with span("load"):
+            for result in self.iter_parsed(self.list_local_files()):
+                if result["error"]:
+                    print(f"Error loading {result['source']}: {result['error']}")
+                elif result["docs"]:
+                    all_chunks.extend(self.split(result["docs"]))
+                elif result["chunks"]:
+                    all_chunks.extend(result["chunks"])
 
-        return self.text_splitter.split_documents(all_docs)
+        return all_chunks
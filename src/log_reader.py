@@ -0,0 +1,113 @@
+import re
+from langchain_core.documents import Document
+from src.config import CHUNK_SIZE
+
+# A line starting a new record: timestamp prefix (ISO, bracketed, syslog, time only) or level prefix
+HEADER_RE = re.compile(
+    r"^\[?("
+    r"\d{4}[-/]\d{2}[-/]\d{2}[T ]\d{2}:\d{2}"               # 2024-01-02 10:11 / 2024-01-02T10:11
+    r"|\d{2}[-/]\d{2}[-/]\d{4} \d{2}:\d{2}"                  # 02/01/2024 10:11
+    r"|[A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2}"            # Jan  2 10:11:12 (syslog)
+    r"|\d{2}:\d{2}:\d{2}"                                    # 10:11:12
+    r"|(TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL|SEVERE|CRITICAL)\b"
+    r")"
+)
+# Lines that always belong to the current record: Java/Python tracebacks and Selenium reports
+CONTINUATION_RE = re.compile(
+    r"^(\s+"                                                 # indented: '\tat ...', '  File "x.py"'
+    r"|at |Caused by|Suppressed:|\.\.\. \d+ more"            # Java
+    r"|Traceback \(most recent call last\)"                 # Python
+    r"|During handling of the above exception|The above exception was the direct cause"
+    r"|[\w.$]+(?:Exception|Error)(?::|$)"                    # exception line after the header
+    r"|\(Session info:|Build info:|System info:|Driver info:|Capabilities|Session ID:"  # Selenium
+    r"|Stacktrace:|Backtrace:|#\d+ 0x[0-9a-f]+"                  # chromedriver native frames
+    r")"
+)
+# Hard cap so one pathological record (e.g. a log without any header) cannot grow unbounded
+MAX_RECORD_CHARS = CHUNK_SIZE * 8
+
+def iter_log_records(lines):
+    """
+    Groups a stream of log lines into records (header line + continuation lines).
+    Yields (line_start, line_end, text). Works on any iterable of lines (e.g. an open
+    file), so memory stays bounded by the largest record, not by the file.
+    """
+    record, start, size = [], 0, 0
+    seen_header = False
+    for line_no, line in enumerate(lines, start=1):
+        line = line.rstrip("\r\n")
+        is_header = bool(HEADER_RE.match(line))
+        seen_header = seen_header or is_header
+
+        if record and not is_header and size < MAX_RECORD_CHARS:
+            # In timestamped logs every non-header line belongs to the previous record
+            if seen_header or CONTINUATION_RE.match(line):
+                record.append(line)
+                size += len(line) + 1
+                continue
+
+        if record:
+            yield start, line_no - 1, "\n".join(record)
+        if line.strip():
+            record, start, size = [line], line_no, len(line) + 1
+        else:
+            record, start, size = [], line_no, 0
+
+    if record:
+        yield start, start + len(record) - 1, "\n".join(record)
+
+def _split_record(line_start, text, chunk_size):
+    """Splits an oversized record at line boundaries (lines longer than a chunk are cut)."""
+    part, part_start, size = [], line_start, 0
+    for offset, line in enumerate(text.split("\n")):
+        while len(line) > chunk_size:
+            if part:
+                yield part_start, line_start + offset - 1, "\n".join(part)
+                part, size = [], 0
+            yield line_start + offset, line_start + offset, line[:chunk_size]
+            line = line[chunk_size:]
+        if part and size + len(line) + 1 > chunk_size:
+            yield part_start, line_start + offset - 1, "\n".join(part)
+            part, size = [], 0
+        if not part:
+            part_start = line_start + offset
+        part.append(line)
+        size += len(line) + 1
+    if part:
+        yield part_start, line_start + len(text.split("\n")) - 1, "\n".join(part)
+
+def iter_log_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Streams a .log file as chunk Documents aligned to record boundaries:
+    consecutive records are packed up to `chunk_size` and a stack trace is never cut
+    in the middle unless it is bigger than a chunk on its own.
+    Each chunk carries its `line_start` / `line_end` in the metadata.
+    """
+    def make_doc(start, end, parts):
+        return Document(
+            page_content="\n".join(parts),
+            metadata={"source": file_path, "type": "log", "rating": 0, "line_start": start, "line_end": end}
+        )
+
+    parts, chunk_start, chunk_end, size = [], 0, 0, 0
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for start, end, text in iter_log_records(f):
+            if len(text) > chunk_size:
+                if parts:
+                    yield make_doc(chunk_start, chunk_end, parts)
+                    parts, size = [], 0
+                for part_start, part_end, part in _split_record(start, text, chunk_size):
+                    yield make_doc(part_start, part_end, [part])
+                continue
+
+            if parts and size + len(text) + 1 > chunk_size:
+                yield make_doc(chunk_start, chunk_end, parts)
+                parts, size = [], 0
+            if not parts:
+                chunk_start = start
+            parts.append(text)
+            chunk_end = end
+            size += len(text) + 1
+
+    if parts:
+        yield make_doc(chunk_start, chunk_end, parts)
@@ -0,0 +1,138 @@
+import re
+from langchain_core.documents import Document
+from src.config import LOG_TEMPLATE_SIMILARITY, LOG_ANOMALY_MAX_COUNT, LOG_ANOMALY_MAX_EXAMPLES
+from src.fingerprint import fingerprint
+from src.log_reader import iter_log_records
+
+WILDCARD = "<*>"
+HAS_DIGIT_RE = re.compile(r"\d")
+# Records at these levels (or naming an exception class) are always kept verbatim next to the summary
+ANOMALY_RE = re.compile(r"\b(ERROR|FATAL|SEVERE|CRITICAL|Traceback|\w*(?:Exception|Error))\b")
+
+class LogCluster:
+    """
+    A log template: the shared tokens of a group of lines, with wildcards where they differ.
+    `examples` keeps the first record of each distinct (masked) stack trace, up to a limit.
+    """
+    __slots__ = ("template", "count", "first_line", "last_line", "examples", "anomalous", "params")
+
+    def __init__(self, tokens, record, line_no):
+        self.template = list(tokens)
+        self.count = 0
+        self.first_line = line_no
+        self.last_line = line_no
+        self.examples = {}
+        self.anomalous = False
+        self.params = []
+
+    def add_example(self, record, line_no, max_examples):
+        if len(self.examples) >= max_examples:
+            return
+        # The header is covered by the template; what tells two failures apart is their trace
+        trace = record.split("\n", 1)[1] if "\n" in record else ""
+        self.examples.setdefault(fingerprint(trace) if trace else "", (line_no, record))
+
+    def text(self):
+        return " ".join(self.template)
+
+class TemplateMiner:
+    """
+    Drain-style online template miner (He et al., ICWS 2017).
+    Lines are routed through a fixed-depth parse tree (token count, then the first tokens)
+    to a small set of candidate clusters, and joined to the most similar one.
+    Each record is processed once, so memory depends on the number of templates, not lines.
+    """
+    def __init__(self, similarity=LOG_TEMPLATE_SIMILARITY, depth=4, max_children=100,
+                 max_examples=LOG_ANOMALY_MAX_EXAMPLES):
+        self.similarity = similarity
+        self.max_examples = max_examples
+        self.depth = depth
+        self.max_children = max_children
+        self.root = {}
+        self.clusters = []
+
+    def _leaf(self, tokens):
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth - 2]:
+            key = WILDCARD if HAS_DIGIT_RE.search(token) else token
+            if key not in node and len(node) >= self.max_children:
+                key = WILDCARD
+            node = node.setdefault(key, {})
+        # Clusters are stored under the None key of the deepest node
+        return node.setdefault(None, [])
+
+    @staticmethod
+    def _score(template, tokens):
+        same = sum(1 for t, tok in zip(template, tokens) if t == tok and t != WILDCARD)
+        return same / len(tokens)
+
+    def add_record(self, record, line_no=0):
+        """Adds a log record (first line is its header, the rest continuation) to its template."""
+        header = record.split("\n", 1)[0]
+        tokens = header.split()
+        if not tokens:
+            return None
+
+        leaf = self._leaf(tokens)
+        best, best_score = None, -1.0
+        for cluster in leaf:
+            score = self._score(cluster.template, tokens)
+            if score > best_score:
+                best, best_score = cluster, score
+
+        if best is None or best_score < self.similarity:
+            best = LogCluster(tokens, record, line_no)
+            leaf.append(best)
+            self.clusters.append(best)
+        else:
+            best.template = [t if t == tok else WILDCARD for t, tok in zip(best.template, tokens)]
+
+        best.count += 1
+        best.last_line = line_no
+        best.add_example(record, line_no, self.max_examples)
+        if not best.anomalous and ANOMALY_RE.search(record):
+            best.anomalous = True
+        if len(best.params) < 3:
+            params = [tok for t, tok in zip(best.template, tokens) if t == WILDCARD]
+            if params:
+                best.params.append(params)
+        return best
+
+    def to_documents(self, source, anomaly_max_count=LOG_ANOMALY_MAX_COUNT):
+        """
+        Summarizes the mined log as Documents:
+        - one `log_templates` document listing every template with its count, line range and params,
+        - one `log_anomalies` document with the verbatim records of rare or error-level templates
+          (one per distinct stack trace).
+        """
+        clusters = sorted(self.clusters, key=lambda c: c.first_line)
+        summary, anomalies = [], []
+        for cluster in clusters:
+            block = f"[x{cluster.count}] lines {cluster.first_line}-{cluster.last_line} | {cluster.text()}"
+            if cluster.params:
+                block += "\n  params: " + " | ".join(", ".join(p) for p in cluster.params)
+            summary.append(block)
+            if cluster.count <= anomaly_max_count or cluster.anomalous:
+                for line_no, record in cluster.examples.values():
+                    anomalies.append(f"[line {line_no}, x{cluster.count}]\n{record}")
+
+        docs = []
+        if summary:
+            docs.append(Document(
+                page_content=f"Log templates of {source}:\n" + "\n".join(summary),
+                metadata={"source": source, "type": "log_templates", "rating": 0}
+            ))
+        if anomalies:
+            docs.append(Document(
+                page_content="\n\n".join(anomalies),
+                metadata={"source": source, "type": "log_anomalies", "rating": 0}
+            ))
+        return docs
+
+def mine_log_file(file_path):
+    """Mines the templates of a .log file and returns the summary Documents."""
+    miner = TemplateMiner()
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for line_start, _, record in iter_log_records(f):
+            miner.add_record(record, line_start)
+    return miner.to_documents(file_path)
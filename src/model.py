@@ -1,25 +1,84 @@
-from langchain_ollama import OllamaLLM
-from langchain_classic.chains import RetrievalQA
-from src.config import MODEL_NAME, OLLAMA_BASE_URL
+from src.config import MODEL_NAME
 from src.prompts import PROMPT
+from src.context import ContextPacker, estimate_tokens
 
 from src.retriever import AdvancedRetrieverFactory
+from src.generation import OllamaGenerator
+from src.telemetry import span, PROMPT_TOKENS, CONTEXT_CHUNKS
+from src.reasoning import ReasoningSplitter, join_output, split_output
 
 class BugAnalyzer:
-    def __init__(self, vectorstore, chunks=None, model_name=MODEL_NAME):
-        self.llm = OllamaLLM(model=model_name, base_url=OLLAMA_BASE_URL)
+    def __init__(self, vectorstore, chunks=None, model_name=MODEL_NAME, keyword_index=None, cache=None):
+        # Bounded generations over the shared, pooled Ollama client of the registry
+        self.generator = OllamaGenerator(model_name)
+        self.cache = cache
         
         # Configure Advanced Retriever (Hybrid + Rerank)
-        retriever_factory = AdvancedRetrieverFactory(vectorstore, chunks)
-        my_retriever = retriever_factory.get_retriever()
-        
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=my_retriever,
-            chain_type_kwargs={"prompt": PROMPT}
-        )
+        self.retriever_factory = AdvancedRetrieverFactory(vectorstore, chunks, keyword_index)
+        self.retriever = self.retriever_factory.get_retriever()
+        # Replaces the "stuff" chain: merged, deduplicated and trimmed to the context window
+        self.packer = ContextPacker()
+
+    def retrieve(self, error_log):
+        """Runs only the retrieval stage (Hybrid + Rerank)."""
+        with span("retrieval"):
+            return self.retriever.invoke(error_log)
+
+    def generate(self, error_log, docs, profile="interactive"):
+        """Runs only the generation stage over already retrieved documents (`profile`: see LLM_PROFILES)."""
+        with span("generation"):
+            return self.generator.generate(self.build_prompt(error_log, docs), profile)
+
+    def pack(self, error_log, docs):
+        """Packs the retrieved docs into the prompt context (see ContextPacker) and reports the prompt size."""
+        with span("context_packing"):
+            packed = self.packer.pack(docs, estimate_tokens(PROMPT.format(context="", question=error_log)))
+            packed["prompt"] = PROMPT.format(context=packed["context"], question=error_log)
+            packed["prompt_tokens"] = estimate_tokens(packed["prompt"])
+        PROMPT_TOKENS.observe(packed["prompt_tokens"])
+        for outcome in ("merged", "duplicates", "dropped", "trimmed"):
+            if packed[outcome]:
+                CONTEXT_CHUNKS.inc(packed[outcome], outcome=outcome)
+        return packed
+
+    def build_prompt(self, error_log, docs):
+        return self.pack(error_log, docs)["prompt"]
+
+    def stream(self, error_log, docs=None, profile="interactive"):
+        """
+        Streams an analysis as (event, data) pairs:
+        - ("context", docs) once retrieval is done,
+        - ("prompt", stats) with the estimated prompt tokens and what the packing merged or cut,
+        - ("reasoning", text) / ("answer", text) as Ollama produces tokens.
+        """
+        if docs is None:
+            docs = self.retrieve(error_log)
+        yield "context", docs
+
+        packed = self.pack(error_log, docs)
+        yield "prompt", {key: packed[key] for key in ("prompt_tokens", "context_tokens", "budget", "chunks",
+                                                      "merged", "duplicates", "trimmed", "dropped")}
+
+        splitter = ReasoningSplitter()
+        with span("generation"):
+            for token in self.generator.stream(packed["prompt"], profile):
+                yield from splitter.feed(token)
+        yield from splitter.flush()
+
+    # Kept on the analyzer for its callers; the helpers live in src/reasoning.py (no model stack)
+    join_output = staticmethod(join_output)
+    split_output = staticmethod(split_output)
 
     def analyze(self, error_log):
-        """Analyzes an error log using the RAG chain."""
-        return self.qa_chain.invoke(error_log)
+        """Analyzes an error log using the RAG chain (recurring errors are served from the cache)."""
+        if self.cache:
+            cached = self.cache.get(error_log)
+            if cached:
+                return {"query": error_log, "result": cached["result"], "cached": True}
+
+        docs = self.retrieve(error_log)
+        result = self.generate(error_log, docs)
+        if self.cache:
+            self.cache.put(error_log, result, [d.page_content for d in docs], {},
+                           [d.metadata["chunk_id"] for d in docs if d.metadata.get("chunk_id")])
+        return {"query": error_log, "result": result, "cached": False}
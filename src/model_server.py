@@ -0,0 +1,94 @@
+import argparse
+from typing import List
+from langchain_core.embeddings import Embeddings
+from src.config import MODEL_SERVER_URL, MODEL_SERVER_PORT, MODEL_SERVER_TIMEOUT
+
+class _ModelServerClient:
+    def __init__(self, url=MODEL_SERVER_URL, timeout=MODEL_SERVER_TIMEOUT):
+        import httpx
+        self.url = url.rstrip("/")
+        # Thread-safe, keeps its connections to the model server alive between calls
+        self._http = httpx.Client(base_url=self.url, timeout=timeout)
+
+    def _post(self, path, payload):
+        response = self._http.post(path, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+class RemoteEmbeddings(_ModelServerClient, Embeddings):
+    """Embedder served by the model server process (same interface and stats as EmbeddingService)."""
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._post("/embed", {"texts": list(texts)})["vectors"]
+
+    def embed_query(self, text):
+        return self._post("/embed_query", {"text": text})["vector"]
+
+    def stats(self):
+        return self._http.get("/health").json()["embeddings"]
+
+class RemoteCrossEncoder(_ModelServerClient):
+    """Cross-encoder served by the model server process; pairs of every worker share its batches."""
+    def score(self, pairs):
+        if not pairs:
+            return []
+        return self._post("/score", {"pairs": [list(pair) for pair in pairs]})["scores"]
+
+def create_app():
+    """
+    One process holding the embedder and the cross-encoder for every API worker of the node
+    (MODEL_SERVER_URL), instead of one copy per worker. Concurrent /score calls from different
+    workers are coalesced into shared forward passes.
+    """
+    from fastapi import FastAPI
+    from pydantic import BaseModel
+    from src.registry import registry, load_local_embeddings, load_local_reranker, get_embeddings, get_reranker
+    from src.rerank import PairBatcher
+
+    # This process is the model server: its models are always the local ones
+    registry.register("embeddings", load_local_embeddings, warm=lambda m: m.embed_query("warm up"))
+    registry.register("reranker", load_local_reranker, warm=lambda m: m.score([("warm up", "warm up")]))
+    registry.warm_up(["embeddings", "reranker"])
+    batcher = PairBatcher(get_reranker())
+
+    class EmbedRequest(BaseModel):
+        texts: List[str]
+
+    class EmbedQueryRequest(BaseModel):
+        text: str
+
+    class ScoreRequest(BaseModel):
+        pairs: List[List[str]]
+
+    app = FastAPI(title="Smart Error Debugger Model Server")
+
+    # Plain `def` endpoints run on the threadpool: several workers are served concurrently
+    @app.post("/embed")
+    def embed(request: EmbedRequest):
+        return {"vectors": [[float(x) for x in vector] for vector in get_embeddings().embed_documents(request.texts)]}
+
+    @app.post("/embed_query")
+    def embed_query(request: EmbedQueryRequest):
+        return {"vector": [float(x) for x in get_embeddings().embed_query(request.text)]}
+
+    @app.post("/score")
+    def score(request: ScoreRequest):
+        return {"scores": [float(s) for s in batcher.score([tuple(pair) for pair in request.pairs])]}
+
+    @app.get("/health")
+    def health():
+        return {"status": "active", "models": registry.stats(), "embeddings": get_embeddings().stats()}
+
+    return app
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Serves the embedding and rerank models to the API workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=MODEL_SERVER_PORT)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
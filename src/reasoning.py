@@ -0,0 +1,70 @@
+# DeepSeek-R1 wraps its chain of thought in <think> tags (some templates use <thought>)
+REASONING_TAGS = [("<think>", "</think>"), ("<thought>", "</thought>")]
+
+class ReasoningSplitter:
+    """
+    Incrementally separates reasoning from answer tokens in a streamed response.
+    Tags may arrive split across several tokens, so a small tail is held back until
+    we know it is not the beginning of a tag.
+    """
+    def __init__(self):
+        self.mode = None  # None (undecided), "reasoning" or "answer"
+        self.close_tag = None
+        self.buffer = ""
+
+    def feed(self, text):
+        """Consumes a token and returns a list of (event, text) pairs ready to emit."""
+        self.buffer += text
+        events = []
+
+        if self.mode is None:
+            stripped = self.buffer.lstrip()
+            for open_tag, close_tag in REASONING_TAGS:
+                if stripped.startswith(open_tag):
+                    self.mode, self.close_tag = "reasoning", close_tag
+                    self.buffer = stripped[len(open_tag):]
+                    break
+            else:
+                if any(open_tag.startswith(stripped) for open_tag, _ in REASONING_TAGS):
+                    return events  # Could still be an opening tag, wait for more
+                self.mode = "answer"
+
+        if self.mode == "reasoning":
+            idx = self.buffer.find(self.close_tag)
+            if idx == -1:
+                safe = len(self.buffer) - (len(self.close_tag) - 1)
+                if safe > 0:
+                    events.append(("reasoning", self.buffer[:safe]))
+                    self.buffer = self.buffer[safe:]
+                return events
+            if idx:
+                events.append(("reasoning", self.buffer[:idx]))
+            self.buffer = self.buffer[idx + len(self.close_tag):].lstrip()
+            self.mode = "answer"
+
+        if self.buffer:
+            events.append(("answer", self.buffer))
+            self.buffer = ""
+        return events
+
+    def flush(self):
+        """Emits whatever is still buffered once the stream is over."""
+        if not self.buffer:
+            return []
+        event = "reasoning" if self.mode == "reasoning" else "answer"
+        text, self.buffer = self.buffer, ""
+        return [(event, text)]
+
+def join_output(reasoning, answer):
+    """Rebuilds the raw model output from the streamed parts (as stored in history)."""
+    if not reasoning:
+        return answer
+    return f"<think>{reasoning}</think>\n\n{answer}"
+
+def split_output(text):
+    """Splits a raw model output into (reasoning, answer)."""
+    parts = {"reasoning": "", "answer": ""}
+    splitter = ReasoningSplitter()
+    for event, chunk in splitter.feed(text) + splitter.flush():
+        parts[event] += chunk
+    return parts["reasoning"].strip(), parts["answer"].strip()
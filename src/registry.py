@@ -0,0 +1,177 @@
+import os
+import gc
+import time
+import threading
+from src.config import MODEL_NAME, OLLAMA_BASE_URL, RERANKER_MODEL
+from src.config import LLM_CONTEXT_WINDOW, LLM_KEEP_ALIVE, LLM_NUM_THREAD, LLM_TIMEOUT, LLM_CONNECT_TIMEOUT
+from src.config import LLM_EVAL_MAX_TOKENS, MODEL_SERVER_URL
+
+def _rss_bytes():
+    """Current resident memory of the process (Linux), or None when unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+class ModelRegistry:
+    """
+    Process-wide registry of heavy models (embedder, cross-encoder, LLM client, Chroma client).
+    Each model is loaded once, on first use, and shared by every component that asks for it.
+    Load time and the resident memory it added are recorded per model.
+    """
+    def __init__(self):
+        self._factories = {}
+        self._warmers = {}
+        self._models = {}
+        self._info = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, warm=None):
+        """Declares how to build a model (`factory()`) and optionally how to warm it up (`warm(model)`)."""
+        self._factories[name] = factory
+        if warm:
+            self._warmers[name] = warm
+        self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        # Per-model lock: two threads never load the same model twice, other models are not blocked
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                print(f"Loading model '{name}'...")
+                rss_before = _rss_bytes()
+                start = time.perf_counter()
+                model = self._factories[name]()
+                rss_after = _rss_bytes()
+                self._info[name] = {
+                    "load_s": round(time.perf_counter() - start, 3),
+                    "rss_mb": round((rss_after - rss_before) / 2**20, 1) if rss_before and rss_after else None,
+                    "loaded_at": time.time(),
+                }
+                self._models[name] = model
+        return model
+
+    def warm_up(self, names=None):
+        """Loads the given models (all by default) and runs a tiny inference on each."""
+        for name in names or list(self._factories):
+            try:
+                model = self.get(name)
+                if name in self._warmers:
+                    start = time.perf_counter()
+                    self._warmers[name](model)
+                    self._info[name]["warmup_s"] = round(time.perf_counter() - start, 3)
+            except Exception as e:
+                print(f"Warm-up of '{name}' failed: {e}")
+
+    def unload(self, name):
+        """Drops the registry reference; memory is freed once no component holds the model."""
+        with self._locks[name]:
+            model = self._models.pop(name, None)
+            self._info.pop(name, None)
+        del model
+        gc.collect()
+
+    def stats(self):
+        return {
+            name: dict(self._info.get(name, {}), loaded=name in self._models)
+            for name in self._factories
+        }
+
+def load_local_embeddings():
+    from src.embeddings import EmbeddingService
+    return EmbeddingService()
+
+def load_local_reranker():
+    from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+    return HuggingFaceCrossEncoder(model_name=RERANKER_MODEL)
+
+def _load_embeddings():
+    if MODEL_SERVER_URL:
+        # Thin HTTP client: the model itself lives once in the model server (src/model_server.py)
+        from src.model_server import RemoteEmbeddings
+        return RemoteEmbeddings(MODEL_SERVER_URL)
+    return load_local_embeddings()
+
+def _load_reranker():
+    if MODEL_SERVER_URL:
+        from src.model_server import RemoteCrossEncoder
+        return RemoteCrossEncoder(MODEL_SERVER_URL)
+    return load_local_reranker()
+
+def _load_rerank_stage():
+    # Scores are keyed by content-derived chunk IDs, so the cache and batcher outlive index generations
+    from src.rerank import CrossEncoderStage
+    return CrossEncoderStage(get_reranker())
+
+def _load_feedback_prior():
+    # Votes live in the history database; one cached snapshot per process
+    from src.history import HistoryManager
+    from src.feedback import FeedbackPrior
+    return FeedbackPrior(HistoryManager())
+
+def ollama_options(**extra):
+    """
+    Load-time options of every Ollama request. A request with a different num_ctx/num_thread
+    makes Ollama reload the model, so generations and the warm-up must send the same ones.
+    """
+    options = {"num_ctx": LLM_CONTEXT_WINDOW}
+    if LLM_NUM_THREAD:
+        options["num_thread"] = LLM_NUM_THREAD
+    options.update(extra)
+    return options
+
+def _load_llm():
+    # LangChain wrapper, for the Ragas judge; analyses go through `ollama_client` (src/generation.py)
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=MODEL_NAME, base_url=OLLAMA_BASE_URL, num_ctx=LLM_CONTEXT_WINDOW,
+                     num_predict=LLM_EVAL_MAX_TOKENS, num_thread=LLM_NUM_THREAD or None,
+                     keep_alive=LLM_KEEP_ALIVE, client_kwargs={"timeout": LLM_TIMEOUT})
+
+def _load_ollama_client():
+    # One client per process: its HTTP connection pool is reused by every generation
+    import httpx
+    from ollama import Client
+    return Client(host=OLLAMA_BASE_URL, timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT))
+
+def _warm_ollama(client):
+    # An empty prompt only loads the model into Ollama's memory (kept for LLM_KEEP_ALIVE)
+    client.generate(model=MODEL_NAME, prompt="", options=ollama_options(), keep_alive=LLM_KEEP_ALIVE)
+
+def _load_vectorstore():
+    from src.vector_store import VectorStoreManager
+    return VectorStoreManager().create_vectorstore()
+
+registry = ModelRegistry()
+registry.register("embeddings", _load_embeddings, warm=lambda m: m.embed_query("warm up"))
+registry.register("reranker", _load_reranker, warm=lambda m: m.score([("warm up", "warm up")]))
+registry.register("rerank_stage", _load_rerank_stage)
+registry.register("feedback_prior", _load_feedback_prior)
+registry.register("llm", _load_llm)
+registry.register("ollama_client", _load_ollama_client, warm=_warm_ollama)
+registry.register("vectorstore", _load_vectorstore)
+
+def get_embeddings():
+    return registry.get("embeddings")
+
+def get_reranker():
+    return registry.get("reranker")
+
+def get_rerank_stage():
+    return registry.get("rerank_stage")
+
+def get_feedback_prior():
+    return registry.get("feedback_prior")
+
+def get_llm():
+    return registry.get("llm")
+
+def get_ollama_client():
+    return registry.get("ollama_client")
+
+def get_vectorstore():
+    return registry.get("vectorstore")
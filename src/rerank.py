@@ -0,0 +1,183 @@
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from src.fingerprint import fingerprint
+from src.config import RERANK_TOP_N, RERANK_CANDIDATES, RERANK_CACHE_SIZE, RERANK_MAX_CHARS, RERANK_MAX_QUERY_CHARS
+from src.config import RERANK_SKIP_MARGIN, RERANK_BATCH_WINDOW_MS, RERANK_MAX_BATCH
+
+CHARS_PER_TOKEN = 4
+
+def doc_key(doc):
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+def model_max_chars(model, default_tokens=512):
+    """Character budget of one (query, text) pair, from the cross-encoder's max sequence length."""
+    client = getattr(model, "client", None)
+    max_length = getattr(client, "max_length", None) or getattr(getattr(client, "tokenizer", None), "model_max_length", None)
+    if not max_length or max_length > 8192:  # tokenizers without a limit report a huge sentinel
+        max_length = default_tokens
+    return max_length * CHARS_PER_TOKEN
+
+class ScoreCache:
+    """Thread-safe LRU of cross-encoder scores keyed by (query fingerprint, chunk id)."""
+    def __init__(self, max_size=RERANK_CACHE_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            score = self._data.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key, score):
+        with self._lock:
+            self._data[key] = score
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class PairBatcher:
+    """
+    Coalesces (query, text) pairs coming from concurrent requests into a single
+    `model.score` call. The first request opens a short window (`window_ms`); every
+    pair submitted meanwhile rides in the same forward pass, up to `max_batch` pairs.
+    """
+    def __init__(self, model, window_ms=RERANK_BATCH_WINDOW_MS, max_batch=RERANK_MAX_BATCH):
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="rerank-batcher", daemon=True).start()
+
+    def score(self, pairs):
+        future = Future()
+        self._queue.put((pairs, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            size = len(requests[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            pairs = [pair for request_pairs, _ in requests for pair in request_pairs]
+            try:
+                scores = list(self.model.score(pairs))
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for request_pairs, future in requests:
+                future.set_result(scores[offset:offset + len(request_pairs)])
+                offset += len(request_pairs)
+
+class CrossEncoderStage:
+    """
+    Second-stage reranking over fused first-stage candidates:
+    - only the `candidates` best fused ones are scored, so the first-stage ranking (and the
+      feedback prior in it) decides which chunks can reach the final top_n,
+    - scores are cached per (query fingerprint, chunk id), so recurring errors cost nothing,
+    - uncached pairs from concurrent requests are batched into one forward pass,
+    - texts are truncated to what the model can read before they are tokenized,
+    - when the first stage already has a clear winner (fused score of the top candidate
+      at least `skip_margin` times the runner-up), reranking is skipped altogether.
+    """
+    def __init__(self, model, top_n=RERANK_TOP_N, skip_margin=RERANK_SKIP_MARGIN, candidates=RERANK_CANDIDATES,
+                 max_chars=RERANK_MAX_CHARS, max_query_chars=RERANK_MAX_QUERY_CHARS, batching=True):
+        self.model = model
+        self.top_n = top_n
+        self.candidates = candidates
+        self.skip_margin = skip_margin
+        # Query and chunk share the model's sequence: whatever the query leaves is the chunk budget
+        self.max_query_chars = max_query_chars
+        self.max_chars = max_chars or max(model_max_chars(model) - max_query_chars, 256)
+        self.cache = ScoreCache()
+        self.batcher = PairBatcher(model) if batching else None
+        self.skipped = 0
+
+    def _clear_winner(self, scored):
+        if not self.skip_margin or len(scored) < 2:
+            return False
+        return scored[0][1] >= self.skip_margin * scored[1][1]
+
+    def _score_pairs(self, pairs, batched=True):
+        if not pairs:
+            return []
+        if self.batcher and batched:
+            return self.batcher.score(pairs)
+        return list(self.model.score(pairs))
+
+    def rerank_many(self, queries, scored_lists, top_n=None, batched=True):
+        """
+        Reranks the (doc, fused_score) candidates of several queries with one scoring call.
+        Returns the top_n documents of each query.
+        """
+        top_n = top_n or self.top_n
+        if self.candidates:
+            scored_lists = [scored[:max(self.candidates, top_n)] for scored in scored_lists]
+        plans, missing = [], []
+        for query, scored in zip(queries, scored_lists):
+            if self._clear_winner(scored):
+                self.skipped += 1
+                plans.append(None)
+                continue
+            query_key = fingerprint(query)
+            short_query = query[:self.max_query_chars]
+            entries = []
+            for doc, _ in scored:
+                key = (query_key, doc_key(doc))
+                score = self.cache.get(key)
+                if score is None:
+                    missing.append((key, (short_query, doc.page_content[:self.max_chars])))
+                entries.append((key, doc, score))
+            plans.append(entries)
+
+        new_scores = dict(zip(
+            [key for key, _ in missing],
+            self._score_pairs([pair for _, pair in missing], batched=batched)
+        ))
+        for key, score in new_scores.items():
+            self.cache.put(key, score)
+
+        results = []
+        for plan, scored in zip(plans, scored_lists):
+            if plan is None:
+                results.append([doc for doc, _ in scored[:top_n]])
+                continue
+            ranked = sorted(
+                ((score if score is not None else new_scores[key], doc) for key, doc, score in plan),
+                key=lambda x: x[0], reverse=True
+            )
+            results.append([doc for _, doc in ranked[:top_n]])
+        return results
+
+    def rerank(self, query, scored, top_n=None):
+        return self.rerank_many([query], [scored], top_n=top_n)[0]
+
+    def stats(self):
+        return {"cache_hits": self.cache.hits, "cache_misses": self.cache.misses, "skipped": self.skipped}
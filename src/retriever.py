@@ -1,58 +1,223 @@
-from langchain_classic.retrievers import EnsembleRetriever, ContextualCompressionRetriever
+from typing import Any, List
+from langchain_core.retrievers import BaseRetriever
 from langchain_community.retrievers import BM25Retriever
-from langchain_classic.retrievers.document_compressors import CrossEncoderReranker
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+from src.keyword_index import KeywordIndex, KeywordRetriever
+from src.signatures import extract_signatures, is_decisive
+from src.rerank import doc_key
+from src.registry import get_rerank_stage, get_feedback_prior
+from src.telemetry import span, SIGNATURE_LOOKUPS
+from src.config import RETRIEVER_K, RERANK_TOP_N, SIGNATURE_MODE, SIGNATURE_WEIGHT
 import warnings
 
 # Suppress warnings for cleaner logs
 warnings.filterwarnings("ignore")
 
+def weighted_rrf_scored(result_lists, weights, c=60, prior=None):
+    """
+    Weighted Reciprocal Rank Fusion, same formula as EnsembleRetriever. Returns (doc, fused_score).
+    `prior` optionally maps chunk keys to a score multiplier (user feedback, see src/feedback.py).
+    """
+    scores, docs = {}, {}
+    for results, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(results, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rank + c)
+            docs.setdefault(key, doc)
+    if prior:
+        for key in scores:
+            scores[key] *= prior.get(key, 1.0)
+    return [(docs[key], scores[key]) for key in sorted(scores, key=scores.get, reverse=True)]
+
+def weighted_rrf(result_lists, weights, c=60):
+    return [doc for doc, _ in weighted_rrf_scored(result_lists, weights, c)]
+
+def signature_fast_path(index, query, k, mode=SIGNATURE_MODE, prior=None):
+    """
+    Exact-signature lookup ahead of the hybrid search. Returns (answer, seed):
+    - answer: the final documents when the match is decisive and `mode` is "skip"
+      (BM25, embedding, Chroma, fusion and rerank are all skipped), else None,
+    - seed: the matched documents in rank order, fused as a third list otherwise.
+    """
+    if index is None or mode == "off":
+        return None, []
+    with span("signatures"):
+        signatures = extract_signatures(query)
+        hits, known = index.signature_search(signatures, k=k) if signatures else ([], set())
+    if not hits:
+        SIGNATURE_LOOKUPS.inc(outcome="miss")
+        return None, []
+    if mode == "skip" and is_decisive(signatures, known, hits[0][2]):
+        SIGNATURE_LOOKUPS.inc(outcome="skip")
+        ranked = sorted(hits, key=lambda hit: hit[1] * (prior or {}).get(doc_key(hit[0]), 1.0), reverse=True)
+        return [doc for doc, _, _ in ranked], []
+    SIGNATURE_LOOKUPS.inc(outcome="seed")
+    return None, [doc for doc, _, _ in hits]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Keyword + semantic retrieval fused with weighted RRF, followed by the cross-encoder stage.
+    Unlike EnsembleRetriever it keeps the fused scores, which the reranker uses to skip
+    queries whose first stage already has a clear winner. Exact signature matches from
+    `signature_index` either answer the query alone or are fused as a third list.
+    """
+    retrievers: List[Any]
+    weights: List[float]
+    reranker: Any = None
+    feedback: Any = None
+    signature_index: Any = None
+    signature_mode: str = SIGNATURE_MODE
+    signature_weight: float = SIGNATURE_WEIGHT
+    top_n: int = RERANK_TOP_N
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        prior = self.feedback.multipliers() if self.feedback else None
+        answer, seed = signature_fast_path(self.signature_index, query, self.top_n, self.signature_mode, prior)
+        if answer is not None:
+            return answer
+        results = []
+        for stage, retriever in zip(("bm25", "vector_search"), self.retrievers):
+            with span(stage):
+                results.append(retriever.invoke(query))
+        weights = self.weights
+        if seed:
+            results, weights = results + [seed], weights + [self.signature_weight]
+        with span("fusion"):
+            scored = weighted_rrf_scored(results, weights, prior=prior)
+        if self.reranker is None:
+            return [doc for doc, _ in scored]
+        with span("rerank"):
+            return self.reranker.rerank(query, scored, top_n=self.top_n)
+
 class AdvancedRetrieverFactory:
-    def __init__(self, vectorstore, chunks):
+    def __init__(self, vectorstore, chunks=None, keyword_index=None):
         self.vectorstore = vectorstore
         self.chunks = chunks
+        self.keyword_index = keyword_index
+        # Pipeline settings and components, kept for batched retrieval
+        self.k = RETRIEVER_K
+        self.top_n = RERANK_TOP_N
+        self.weights = [0.4, 0.6]
+        self.keyword_retriever = None
+        self.reranker = None
+        self.feedback = None
+        self.signature_index = None
+
+    def _get_keyword_retriever(self):
+        """
+        Persistent keyword index by default (kept up to date by the ingestion).
+        If it is missing or out of sync with Chroma it is rebuilt from the collection,
+        so keyword search never silently disappears on a warm start.
+        """
+        if self.chunks and self.keyword_index is None:
+            # Explicit in-memory chunks (legacy path)
+            retriever = BM25Retriever.from_documents(self.chunks)
+            retriever.k = self.k
+            return retriever
+
+        index = self.keyword_index or KeywordIndex()
+        stored = self.vectorstore._collection.count()
+        if index.count() != stored:
+            index.rebuild_from_vectorstore(self.vectorstore)
+        if not index.count():
+            return None
+        return KeywordRetriever(index=index, k=self.k)
 
     def get_retriever(self):
         """
         Creates an advanced retriever pipeline with:
         1. Hybrid Search (Vector + BM25)
-        2. Re-ranking (BGE-Reranker)
+        2. Re-ranking (BGE-Reranker, cached, batched and skipped on clear winners)
         """
         # 1. Base Semantic Retriever (Chroma)
-        # Fetch more candidates to re-rank (k=10)
+        # Fetch more candidates to re-rank (RETRIEVER_K)
         semantic_retriever = self.vectorstore.as_retriever(
-            search_kwargs={"k": 10}
+            search_kwargs={"k": self.k}
         )
 
-        if not self.chunks:
-            print("Warning: No chunks provided for BM25. Falling back to simple vector retrieval.")
-            return semantic_retriever
-
         # 2. Keyword Retriever (BM25)
         # Critical for specific error codes like "0x8004210B"
-        bm25_retriever = BM25Retriever.from_documents(self.chunks)
-        bm25_retriever.k = 10
-
-        # 3. Hybrid Retriever (Ensemble)
-        # Combining sparse (keyword) and dense (semantic) retrieval
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[bm25_retriever, semantic_retriever],
-            weights=[0.4, 0.6]
-        )
+        bm25_retriever = self._get_keyword_retriever()
+        self.keyword_retriever = bm25_retriever
+        if bm25_retriever is None:
+            print("Warning: Keyword index is empty. Falling back to simple vector retrieval.")
+            return semantic_retriever
 
-        # 4. Re-ranking (Cross-Encoder)
+        # 3. Re-ranking (Cross-Encoder)
         # Using BGE-Reranker to reorder based on relevance
         try:
-            print("Initializing BGE-Reranker (this may take a moment)...")
-            # Using base model for balance between speed and performance
-            model = HuggingFaceCrossEncoder(model_name="BAAI/bge-reranker-base")
-            compressor = CrossEncoderReranker(model=model, top_n=5)
-            
-            compression_retriever = ContextualCompressionRetriever(
-                base_compressor=compressor, 
-                base_retriever=ensemble_retriever
-            )
-            return compression_retriever
+            # Using base model for balance between speed and performance (shared, loaded once)
+            self.reranker = get_rerank_stage()
         except Exception as e:
             print(f"Reranker initialization failed (using Hybrid only): {e}")
-            return ensemble_retriever
+            self.reranker = None
+
+        # Ratings of past answers boost (or sink) their chunks in the fusion
+        try:
+            self.feedback = get_feedback_prior()
+        except Exception as e:
+            print(f"Feedback prior unavailable (ranking without it): {e}")
+            self.feedback = None
+
+        # Error codes, exception classes and stack frames looked up exactly, before any scoring
+        self.signature_index = getattr(bm25_retriever, "index", None)
+
+        # 4. Hybrid Retriever
+        # Combining sparse (keyword) and dense (semantic) retrieval
+        return HybridRetriever(
+            retrievers=[bm25_retriever, semantic_retriever],
+            weights=self.weights,
+            reranker=self.reranker,
+            feedback=self.feedback,
+            signature_index=self.signature_index,
+            top_n=self.top_n
+        )
+
+    def retrieve_batch(self, queries):
+        """
+        Same pipeline as get_retriever() for many queries at once:
+        one batched embedding pass for all queries and one cross-encoder pass for all pairs.
+        Returns a list of document lists, in the order of `queries`.
+        """
+        if not queries:
+            return []
+        prior = self.feedback.multipliers() if self.feedback else None
+        # Queries answered by their signatures are left out of the embedding and rerank passes
+        results, seeds = [None] * len(queries), [[] for _ in queries]
+        for i, query in enumerate(queries):
+            results[i], seeds[i] = signature_fast_path(self.signature_index, query, self.top_n, prior=prior)
+        pending = [i for i, answer in enumerate(results) if answer is None]
+        if not pending:
+            return results
+        # Query vectors are one-off: batched, but kept out of the persistent embedding cache
+        embeddings = self.vectorstore.embeddings
+        if hasattr(embeddings, "embed_queries"):
+            vectors = embeddings.embed_queries([queries[i] for i in pending])
+        else:
+            vectors = [embeddings.embed_query(queries[i]) for i in pending]
+
+        candidates = []
+        for i, vector in zip(pending, vectors):
+            with span("vector_search"):
+                dense = self.vectorstore.similarity_search_by_vector(vector, k=self.k)
+            if self.keyword_retriever is None:
+                candidates.append(dense)
+                continue
+            with span("bm25"):
+                sparse = self.keyword_retriever.invoke(queries[i])
+            lists, weights = [sparse, dense], self.weights
+            if seeds[i]:
+                lists, weights = lists + [seeds[i]], weights + [SIGNATURE_WEIGHT]
+            candidates.append(weighted_rrf_scored(lists, weights, prior=prior))
+
+        if self.keyword_retriever is None:
+            ranked = candidates
+        elif self.reranker is None:
+            ranked = [[doc for doc, _ in scored] for scored in candidates]
+        else:
+            # Already one batch: score directly instead of going through the cross-request batcher
+            with span("rerank"):
+                ranked = self.reranker.rerank_many([queries[i] for i in pending], candidates,
+                                                   top_n=self.top_n, batched=False)
+        for i, docs in zip(pending, ranked):
+            results[i] = docs
+        return results
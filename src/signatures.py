@@ -0,0 +1,72 @@
+import os
+import re
+
+# Exact identifiers of a failure, indexed as "<kind>:<value>" (lowercased):
+# - code: 0x8004210B, ORA-00942, [Errno 111]
+# - exception: StaleElementReferenceException, TimeoutError (class name without its package)
+# - http: 4xx/5xx statuses
+# - frame: top stack frame of each trace (Java/JS "at ..." or Python "File ..., in ...")
+HEX_CODE_RE = re.compile(r"\b0x[0-9a-fA-F]{4,8}\b")  # longer hex numbers are addresses (see fingerprint.py)
+PREFIXED_CODE_RE = re.compile(r"\b([A-Z][A-Z0-9]{1,7}-\d{3,6})\b")
+ERRNO_RE = re.compile(r"\[Errno (\d+)\]")
+EXCEPTION_RE = re.compile(r"\b([A-Z][A-Za-z0-9_]*(?:Exception|Error|Fault))\b")
+HTTP_STATUS_RE = re.compile(
+    r"\b(?:HTTP(?:/[\d.]+)?\s+|status(?:[ _]?code)?\s*[:=]?\s*|response code\s*[:=]?\s*)([45]\d{2})\b"
+    r"|\b([45]\d{2})\s+(?:Bad Request|Unauthorized|Forbidden|Not Found|Method Not Allowed|Request Timeout"
+    r"|Conflict|Too Many Requests|Internal Server Error|Bad Gateway|Service Unavailable|Gateway Timeout)\b",
+    re.IGNORECASE,
+)
+JAVA_FRAME_RE = re.compile(r"^\s*at\s+([\w$.<>]+?)\s?\(([\w$.-]+?)(?::\d+)*\)")
+PYTHON_FRAME_RE = re.compile(r"""^\s*File\s+["']([^"']+)["'],\s+line\s+\d+,\s+in\s+([\w<>]+)""")
+
+# Prefixed numbers that are standards, not error codes
+NOT_CODES = {"SHA", "ISO", "RFC", "UTF", "UCS", "X", "AES", "RSA", "TLS"}
+GENERIC_EXCEPTIONS = {"exception", "error", "fault"}
+# Kinds specific enough to answer a query on their own
+DECISIVE_KINDS = ("code", "frame")
+
+def _top_frames(text):
+    """Top frame of each stack trace: the first "at" line of a Java/JS block, the last frame of a Python traceback."""
+    frames = []
+    python_frame = None
+    in_java_block = False
+    for line in text.splitlines():
+        match = PYTHON_FRAME_RE.match(line)
+        if match:
+            python_frame = f"frame:{os.path.basename(match.group(1))}:{match.group(2)}".lower()
+            continue
+        if python_frame:
+            if line[:1].isspace() and line.strip():
+                continue  # Source line of the frame
+            frames.append(python_frame)  # Python prints the innermost (top) frame last
+            python_frame = None
+        match = JAVA_FRAME_RE.match(line)
+        if match and not in_java_block:
+            frames.append(f"frame:{match.group(1)}".lower())
+        in_java_block = bool(match)
+    if python_frame:
+        frames.append(python_frame)
+    return frames
+
+def extract_signatures(text):
+    """Set of "<kind>:<value>" signatures found in a chunk or a query."""
+    signatures = {f"code:{code.lower()}" for code in HEX_CODE_RE.findall(text)}
+    signatures.update(f"code:{code.lower()}" for code in PREFIXED_CODE_RE.findall(text)
+                      if code.split("-")[0] not in NOT_CODES)
+    signatures.update(f"code:errno-{errno}" for errno in ERRNO_RE.findall(text))
+    signatures.update(f"exception:{name.lower()}" for name in EXCEPTION_RE.findall(text)
+                      if name.lower() not in GENERIC_EXCEPTIONS)
+    signatures.update(f"http:{a or b}" for a, b in HTTP_STATUS_RE.findall(text))
+    signatures.update(_top_frames(text))
+    return signatures
+
+def is_decisive(signatures, known, matched):
+    """
+    Whether the best signature match can answer a query without the hybrid search:
+    every code/frame of the query is indexed, there is at least one, and the top chunk
+    (`matched`, its signatures) carries all the selective query signatures in `known`.
+    """
+    decisive = [s for s in signatures if s.split(":", 1)[0] in DECISIVE_KINDS]
+    if not decisive or any(s not in known for s in decisive):
+        return False
+    return all(s in matched for s in known)
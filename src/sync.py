@@ -0,0 +1,405 @@
+import os
+import glob
+import json
+import time
+import threading
+from contextlib import contextmanager
+from src.loader import LogLoader
+from src.ingest import IncrementalIndexer
+from src.keyword_index import KeywordIndex
+from src.vector_store import VectorStoreManager
+from src.inspector import DatabaseInspector
+from src.model import BugAnalyzer
+from src.telemetry import STAGE_SECONDS
+from src.config import SYNC_DRAIN_TIMEOUT, INDEX_SIGNAL_PATH, INDEX_WATCH_INTERVAL
+from src.config import KEYWORD_INDEX_PATH, MANIFEST_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process serving only
+    fcntl = None
+
+# How often a publisher re-reads the acknowledgements of the other processes
+ACK_POLL_INTERVAL = 0.5
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def generation_artifacts(number):
+    """
+    Where an index generation lives: its own Chroma collection, keyword index and manifest.
+    Generation 0 is the historical default collection and files (indexes built before generations).
+    """
+    if not number:
+        return {"collection": None, "keyword_index": KEYWORD_INDEX_PATH, "manifest": MANIFEST_PATH}
+
+    def suffixed(path):
+        root, ext = os.path.splitext(path)
+        return f"{root}.g{number}{ext}"
+
+    return {"collection": f"error_logs_g{number}", "keyword_index": suffixed(KEYWORD_INDEX_PATH),
+            "manifest": suffixed(MANIFEST_PATH)}
+
+class IndexFiles:
+    """The opened indexes of one generation (`artifacts`, see generation_artifacts)."""
+    def __init__(self, artifacts):
+        self.artifacts = artifacts
+        self.vectorstore = VectorStoreManager().open_collection(artifacts["collection"])
+        self.keyword_index = KeywordIndex(artifacts["keyword_index"])
+
+    @staticmethod
+    def _remove_files(artifacts):
+        for path in (artifacts["keyword_index"], artifacts["keyword_index"] + "-wal",
+                     artifacts["keyword_index"] + "-shm", artifacts["manifest"]):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @classmethod
+    def create(cls, artifacts, source=None):
+        """A new generation: a copy of `source` (IndexFiles) or empty. Leftovers of a crashed sync are dropped first."""
+        cls._remove_files(artifacts)
+        if source is not None:
+            source.keyword_index.copy_to(artifacts["keyword_index"])
+        files = cls(artifacts)
+        files.vectorstore.reset_collection()
+        if source is not None:
+            VectorStoreManager.copy_collection(source.vectorstore, files.vectorstore)
+        return files
+
+    def drop(self):
+        """Deletes the collection and files of the generation (once nothing reads them anymore)."""
+        try:
+            self.vectorstore.delete_collection()
+            self._remove_files(self.artifacts)
+        except Exception as e:
+            print(f"Could not drop index generation {self.artifacts}: {e}")
+
+class Generation:
+    """
+    A fully built, immutable view of the index: its own collection and keyword index
+    (`files`) and the analyzer (retrievers, reranker, chain) built on them. Requests pin
+    the generation they started on with `use()`.
+    """
+    def __init__(self, number, files, analyzer, report):
+        self.number = number
+        self.files = files
+        self.analyzer = analyzer
+        self.inspector = DatabaseInspector(vectorstore=files.vectorstore, keyword_index=files.keyword_index)
+        self.report = report
+        self.built_at = time.time()
+        self.active = 0
+        self._idle = threading.Condition()
+
+    def acquire(self):
+        with self._idle:
+            self.active += 1
+
+    def release(self):
+        with self._idle:
+            self.active -= 1
+            if not self.active:
+                self._idle.notify_all()
+
+    @contextmanager
+    def use(self):
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def wait_idle(self, timeout):
+        """Waits for the requests still running on this generation. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self.active, timeout=timeout)
+
+class GenerationSignal:
+    """
+    Index generation shared by the processes of a node (API workers): a small JSON file holding
+    the latest generation number and where its indexes are, and a file lock so only one
+    process syncs at a time. Workers watch the file and switch to the published generation.
+    Every process also acknowledges, in its own `<path>.<pid>.ack` file, the oldest generation
+    it may still read; a generation is dropped only once no live process reads it anymore.
+    """
+    def __init__(self, path=INDEX_SIGNAL_PATH):
+        self.path = path
+        self.lock_path = path + ".lock"
+
+    def read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {"number": 0}
+        if "artifacts" not in data:
+            # Published before generations had their own indexes: they were the default ones
+            data["artifacts"] = generation_artifacts(0)
+        return data
+
+    def publish(self, number, artifacts):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"number": number, "artifacts": artifacts, "pid": os.getpid(), "published_at": time.time()}, f)
+        os.replace(tmp_path, self.path)  # Atomic, readers never see a half-written file
+
+    def ack(self, oldest):
+        """Records that this process no longer reads generations older than `oldest`."""
+        path = f"{self.path}.{os.getpid()}.ack"
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "oldest": oldest, "acked_at": time.time()}, f)
+        os.replace(path + ".tmp", path)
+
+    def readers(self, number):
+        """PIDs of the other live processes that may still read generation `number`."""
+        pids = []
+        for path in glob.glob(f"{glob.escape(self.path)}.*.ack"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data["pid"] == os.getpid():
+                continue
+            if not _alive(data["pid"]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if data["oldest"] <= number:
+                pids.append(data["pid"])
+        return pids
+
+    def wait_released(self, number, timeout):
+        """Waits until no other process reads generation `number`. Returns the PIDs still reading it (on timeout)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            pids = self.readers(number)
+            if not pids or time.monotonic() > deadline:
+                return pids
+            time.sleep(ACK_POLL_INTERVAL)
+
+    @contextmanager
+    def lock(self, blocking=True):
+        """Exclusive across processes; yields False if `blocking` is False and another process holds it."""
+        if fcntl is None:
+            yield True
+            return
+        with open(self.lock_path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class IndexSyncManager:
+    """
+    Runs syncs in the background without disturbing the requests being served:
+    1. on the first change, the served indexes are copied into a new generation (its own
+       collection and keyword index file) and new, changed and deleted sources are applied
+       there; the served generation is never written,
+    2. a new analyzer is built on the new generation,
+    3. it is swapped in with a single assignment (new requests use it from then on),
+    4. once the previous generation has drained, here and in every other process of the
+       node (see GenerationSignal.ack), its collection and files are dropped.
+    Only one sync runs at a time, across processes too (see GenerationSignal): the other
+    workers of the node follow with `reload()`, which opens the published generation
+    without indexing anything, drains their previous one and acknowledges it.
+    Models come from the shared registry and are never reloaded.
+    """
+    def __init__(self, cache=None, drain_timeout=SYNC_DRAIN_TIMEOUT, signal=None):
+        self.cache = cache
+        self.drain_timeout = drain_timeout
+        self.signal = signal or GenerationSignal()
+        self.current = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._status = {"state": "idle", "phase": None, "started_at": None, "progress": {},
+                        "last": None, "error": None}
+
+    def start(self):
+        """Starts a sync on a background thread. Returns False if one is already running."""
+        if self._lock.locked():
+            return False
+        threading.Thread(target=self.run, name="index-sync", daemon=True).start()
+        return True
+
+    def _phase(self, phase, timings, started):
+        if self._status["phase"]:
+            seconds = time.perf_counter() - started
+            timings[f"{self._status['phase']}_s"] = round(seconds, 3)
+            STAGE_SECONDS.observe(seconds, stage=f"sync_{self._status['phase']}")
+        self._status["phase"] = phase
+        return time.perf_counter()
+
+    def _swap(self, number, files, report, changed, timings, started):
+        """Builds the analyzer of a new generation and serves it. Returns the previous generation."""
+        previous = self.current
+        started = self._phase("building", timings, started)
+        analyzer = BugAnalyzer(files.vectorstore, keyword_index=files.keyword_index, cache=self.cache)
+        generation = Generation(number, files, analyzer, report)
+
+        started = self._phase("swapping", timings, started)
+        self.current = generation
+        if changed and self.cache:
+            # Cached answers were built on the previous index
+            self.cache.invalidate()
+        return previous, started
+
+    def _drain(self, previous, timings, started):
+        if previous is not None:
+            started = self._phase("draining", timings, started)
+            if not previous.wait_idle(self.drain_timeout):
+                print(f"Generation {previous.number} still has {previous.active} requests after "
+                      f"{self.drain_timeout}s; dropping it anyway.")
+        return started
+
+    def run(self):
+        if not self._lock.acquire(blocking=False):
+            return None
+        timings = {}
+        progress = {}
+        self._status.update(state="running", phase=None, started_at=time.time(), progress=progress, error=None)
+        sync_start = started = time.perf_counter()
+        try:
+            # At startup wait for a sync running in another worker (then ours finds nothing to do);
+            # later, a /sync while another worker syncs is simply refused
+            with self.signal.lock(blocking=self.current is None) as locked:
+                if not locked:
+                    self._status["error"] = "A sync is already running in another worker"
+                    return None
+                started = self._phase("indexing", timings, started)
+                published = self.signal.read()
+                current = self.current
+                base = current.files if current and current.number == published["number"] else \
+                    IndexFiles(published["artifacts"])
+                number = published["number"] + 1
+                forked = []
+
+                def fork(copy):
+                    files = IndexFiles.create(generation_artifacts(number), base if copy else None)
+                    forked.append(files)
+                    return files.vectorstore, files.keyword_index, files.artifacts["manifest"]
+
+                indexer = IncrementalIndexer(base.vectorstore, loader=LogLoader(), manifest_path=base.artifacts["manifest"],
+                                             keyword_index=base.keyword_index, fork=fork, progress=progress)
+                report = indexer.sync()
+                changed = indexer.forked
+
+                previous = None
+                if changed:
+                    previous, started = self._swap(number, forked[0], report, True, timings, started)
+                    self._ack(previous)
+                    # The other workers switch while this one drains
+                    self.signal.publish(number, forked[0].artifacts)
+                elif current is None or published["number"] > current.number:
+                    # Nothing new to index, but this process has not served the latest generation yet
+                    previous, started = self._swap(published["number"], base, report, False, timings, started)
+                    self._ack(previous)
+
+            # Published generations are immutable: draining and dropping need no lock
+            started = self._drain(previous, timings, started)
+            self._ack(None)
+            if changed:
+                started = self._phase("cleanup", timings, started)
+                readers = self.signal.wait_released(published["number"], self.drain_timeout)
+                if readers:
+                    print(f"Workers {readers} still read generation {published['number']} after "
+                          f"{self.drain_timeout}s; dropping it anyway.")
+                base.drop()
+
+            self._phase(None, timings, started)
+            timings["total_s"] = round(time.perf_counter() - sync_start, 3)
+            self._status["last"] = {
+                "generation": self.current.number,
+                "changed": changed,
+                "finished_at": time.time(),
+                "added": len(report["added"]),
+                "updated": len(report["updated"]),
+                "removed": len(report["removed"]),
+                "unchanged": report["unchanged"],
+                "chunks_added": report["chunks_added"],
+                "chunks_removed": report["chunks_removed"],
+                "failures": report["failures"],
+                "timings": timings,
+            }
+            print(f"Index generation {self.current.number} ready ({timings['total_s']}s).")
+            return report
+        except Exception as e:
+            # The current generation keeps serving; the next sync retries
+            print(f"Sync failed: {e}")
+            self._status["error"] = f"{type(e).__name__}: {e}"
+            if self.current is None:
+                raise
+            return None
+        finally:
+            self._status.update(state="idle", phase=None)
+            self._lock.release()
+
+    def _ack(self, previous):
+        """Acknowledges the oldest generation this process still reads (`previous` while it drains)."""
+        oldest = previous if previous is not None else self.current
+        if oldest is not None:
+            self.signal.ack(oldest.number)
+
+    def reload(self):
+        """Serves the generation another process published (nothing is indexed)."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            # A published generation is complete and never written again: no lock needed to open it.
+            # The generation we serve is still acknowledged, so its publisher's successor cannot drop
+            # the one we open before we acknowledge it.
+            published = self.signal.read()
+            if self.current is not None and published["number"] <= self.current.number:
+                return False
+            timings = {}
+            started = self._phase("reloading", timings, time.perf_counter())
+            files = IndexFiles(published["artifacts"])
+            if self.cache:
+                # The publisher already cleared the shared cache table; drop our in-memory view of it
+                self.cache.refresh()
+            previous, started = self._swap(published["number"], files, None, False, timings, started)
+            self._ack(previous)
+            # The publisher drops the previous generation once every worker has drained it
+            started = self._drain(previous, timings, started)
+            self._ack(None)
+            self._phase(None, timings, started)
+            print(f"Index generation {published['number']} published by another worker; now serving it.")
+            return True
+        except Exception as e:
+            print(f"Reload of generation failed: {e}")
+            self._status["error"] = f"{type(e).__name__}: {e}"
+            return False
+        finally:
+            self._status.update(phase=None)
+            self._lock.release()
+
+    def watch(self, interval=INDEX_WATCH_INTERVAL):
+        """Follows the generations published by other workers (background thread)."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                current = self.current
+                if current is not None and self.signal.read()["number"] > current.number:
+                    self.reload()
+
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=loop, name="index-watcher", daemon=True)
+            self._watcher.start()
+        return self
+
+    def status(self):
+        return dict(self._status, generation=self.current.number if self.current else None,
+                    published_generation=self.signal.read()["number"],
+                    active_requests=self.current.active if self.current else 0)
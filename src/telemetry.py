@@ -0,0 +1,196 @@
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from src.config import SLOW_REQUEST_MS, SLOW_REQUEST_LOG
+
+# Seconds; spans from a cached lookup (ms) up to a long generation (minutes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (256, 512, 1024, 1536, 2048, 3072, 4096, 6144, 8192, 16384, 32768)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+class _Metric:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, n) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    out.append((f"{self.name}_bucket", key + (bound,), count))
+                out.append((f"{self.name}_bucket", key + ("+Inf",), n))
+                out.append((f"{self.name}_sum", key, total))
+                out.append((f"{self.name}_count", key, n))
+        return out
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus text-format registry: counters, gauges and histograms updated in
+    process, plus collectors called at scrape time for values owned by other components
+    (queue depth, cache hit rates, index sizes).
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def register_collector(self, fn):
+        """`fn()` returns a list of (name, type, help, labels dict, value); failures are skipped."""
+        self._collectors.append(fn)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                names = metric.labels + (("le",) if name.endswith("_bucket") else ())
+                lines.append(f"{name}{_labels_text(names, key)} {value}")
+        described = set()
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if value is None:
+                    continue
+                if name not in described:
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    described.add(name)
+                lines.append(f"{name}{_labels_text(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram("sed_stage_seconds", "Latency of a pipeline stage", ["stage"])
+REQUEST_SECONDS = metrics.histogram("sed_request_seconds", "Latency of an API request", ["endpoint"])
+REQUESTS = metrics.counter("sed_requests_total", "API requests by outcome", ["endpoint", "status"])
+IN_FLIGHT = metrics.gauge("sed_requests_in_flight", "API requests being served", ["endpoint"])
+LLM_TOKENS = metrics.counter("sed_llm_tokens_total", "Tokens processed by the LLM", ["kind"])
+PROMPT_TOKENS = metrics.histogram("sed_prompt_tokens", "Estimated prompt size after context packing", buckets=TOKEN_BUCKETS)
+CONTEXT_CHUNKS = metrics.counter("sed_context_chunks_total", "Retrieved chunks by context packing outcome", ["outcome"])
+SIGNATURE_LOOKUPS = metrics.counter("sed_signature_lookups_total", "Signature fast path lookups by outcome", ["outcome"])
+
+# Per-request list of (stage, seconds), shared with the worker threads of the request
+_trace = contextvars.ContextVar("trace", default=None)
+
+@contextmanager
+def span(stage):
+    """Times a pipeline stage: observed in the stage histogram and added to the current request trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, seconds))
+
+@contextmanager
+def trace_request(endpoint):
+    """
+    Wraps an API request: in-flight gauge, latency histogram, outcome counter and, when it
+    is slower than SLOW_REQUEST_MS, a slow-request log line with the per-stage breakdown.
+    """
+    trace = []
+    token = _trace.set(trace)
+    IN_FLIGHT.inc(endpoint=endpoint)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield trace
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        try:
+            _trace.reset(token)
+        except ValueError:
+            pass  # Streaming responses may be finalized from another context
+        IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=status)
+        if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+            log_slow_request(endpoint, seconds, trace, status)
+
+def log_slow_request(endpoint, seconds, trace, status="ok"):
+    stages = {}
+    for stage, stage_seconds in trace:
+        stages[stage] = round(stages.get(stage, 0.0) + stage_seconds * 1000, 1)
+    line = json.dumps({"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "endpoint": endpoint, "status": status,
+                       "total_ms": round(seconds * 1000, 1), "stages_ms": stages})
+    if SLOW_REQUEST_LOG:
+        with open(SLOW_REQUEST_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    else:
+        print(f"SLOW REQUEST {line}")
@@ -1,60 +1,81 @@
 import os
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from src.config import DB_PATH, EMBEDDING_MODEL
+from src.config import DB_PATH
+from src.registry import get_embeddings, get_vectorstore
 
 class VectorStoreManager:
     def __init__(self, db_path=DB_PATH):
         self.db_path = db_path
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        # Shared with every other component of the process (see src/registry.py)
+        self.embeddings = get_embeddings()
 
-    def get_vectorstore(self, chunks=None):
-        """Returns a Chroma vectorstore, creating it if it doesn't exist."""
+    def open_vectorstore(self):
+        """Returns the process-wide Chroma client for the default DB, or a new one for another path."""
+        if self.db_path == DB_PATH:
+            return get_vectorstore()
+        return self.create_vectorstore()
+
+    def create_vectorstore(self, collection_name=None):
+        """
+        Opens a Chroma collection (local or remote), creating it empty if needed.
+        Without `collection_name`, the historical default collection of each mode.
+        """
         from src.config import CHROMA_HOST, CHROMA_PORT
-        
+
         if CHROMA_HOST:
             print(f"Connecting to remote vector database at {CHROMA_HOST}:{CHROMA_PORT}...")
             import chromadb
             client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
-            if chunks:
-                return Chroma.from_documents(
-                    documents=chunks,
-                    embedding=self.embeddings,
-                    client=client,
-                    collection_name="error_logs"
-                )
-            else:
-                return Chroma(
-                    client=client,
-                    embedding_function=self.embeddings,
-                    collection_name="error_logs"
-                )
-
-        if os.path.exists(self.db_path) and not (chunks):
-            print("Loading existing vector database...")
-            return Chroma(persist_directory=self.db_path, embedding_function=self.embeddings)
-        
+            return Chroma(
+                client=client,
+                embedding_function=self.embeddings,
+                collection_name=collection_name or "error_logs"
+            )
+
+        print("Loading vector database...")
+        if collection_name:
+            return Chroma(collection_name=collection_name, persist_directory=self.db_path,
+                          embedding_function=self.embeddings)
+        return Chroma(persist_directory=self.db_path, embedding_function=self.embeddings)
+
+    def open_collection(self, collection_name=None):
+        """The collection of an index generation, or the default one (shared client) when None."""
+        if collection_name is None:
+            return self.open_vectorstore()
+        return self.create_vectorstore(collection_name)
+
+    @staticmethod
+    def copy_collection(source, target, page_size=1000):
+        """Copies every chunk with its stored embedding (nothing is embedded again). Returns the count."""
+        offset = 0
+        while True:
+            page = source._collection.get(limit=page_size, offset=offset,
+                                          include=["embeddings", "documents", "metadatas"])
+            ids = page.get("ids", [])
+            if not ids:
+                return offset
+            target._collection.add(ids=ids, embeddings=page["embeddings"], documents=page["documents"],
+                                   metadatas=page["metadatas"])
+            offset += len(ids)
+
+    def get_vectorstore(self, chunks=None):
+        """Returns a Chroma vectorstore, creating it if it doesn't exist."""
+        from src.config import CHROMA_HOST
+
+        if not CHROMA_HOST and not os.path.exists(self.db_path) and not chunks:
+            raise ValueError("No existing DB found and no chunks provided to create one.")
+
+        vectorstore = self.open_vectorstore()
         if chunks:
             print("Creating/Updating vector database...")
-            return Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
-                persist_directory=self.db_path
-            )
-        
-        raise ValueError("No existing DB found and no chunks provided to create one.")
-    def update_feedback(self, doc_id, rating):
-        """Updates the rating of a specific document in ChromaDB."""
-        # Note: ChromaDB update requires the full document or just metadata
-        # For simplicity in this MVP, we find the doc and update its 'rating' metadata
-        try:
-            # Get existing metadata
-            res = self.vectorstore.get(ids=[doc_id])
-            if res['metadatas']:
-                new_metadata = res['metadatas'][0]
-                new_metadata['rating'] = new_metadata.get('rating', 0) + rating
-                self.vectorstore.update_metadata(ids=[doc_id], metadatas=[new_metadata])
-                return True
-        except Exception as e:
-            print(f"Error updating feedback: {e}")
-        return False
+            from src.ingest import assign_chunk_ids, ADD_BATCH_SIZE
+            # Deterministic IDs turn repeated calls into upserts instead of duplicates
+            by_source = {}
+            for chunk in chunks:
+                by_source.setdefault(chunk.metadata.get("source", ""), []).append(chunk)
+            for source, group in by_source.items():
+                ids = assign_chunk_ids(source, group)
+                for i in range(0, len(group), ADD_BATCH_SIZE):
+                    vectorstore.add_documents(group[i:i + ADD_BATCH_SIZE], ids=ids[i:i + ADD_BATCH_SIZE])
+        return vectorstore
+
@@ -0,0 +1,62 @@
+from src.loader import LogLoader
+
+
+class FakeCollection:
+    """In-memory stand-in for a Chroma collection: id -> (document, metadata)."""
+    def __init__(self):
+        self.rows = {}
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, limit=None, offset=0, include=None):
+        ids = sorted(self.rows)[offset:offset + limit if limit else None]
+        return {"ids": ids, "embeddings": [None] * len(ids), "documents": [self.rows[i][0] for i in ids],
+                "metadatas": [self.rows[i][1] for i in ids]}
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.rows.update(zip(ids, zip(documents, metadatas)))
+
+
+class FakeVectorStore:
+    """The part of the langchain Chroma interface the indexers use, without embeddings."""
+    def __init__(self, on_delete=None):
+        self._collection = FakeCollection()
+        self.embeddings = None
+        self.written = 0
+        self.on_delete = on_delete
+
+    def add_documents(self, docs, ids):
+        self._collection.add(ids, None, [d.page_content for d in docs], [dict(d.metadata) for d in docs])
+        self.written += len(ids)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self._collection.rows.pop(chunk_id, None)
+        self.written += len(ids)
+
+    def get(self, limit=None, include=None):
+        return self._collection.get(limit=limit, include=include)
+
+    def reset_collection(self):
+        self._collection.rows.clear()
+
+    def delete_collection(self):
+        self._collection.rows.clear()
+        if self.on_delete:
+            self.on_delete(self)
+
+
+class ThreadedLoader(LogLoader):
+    """Raw .log chunks (no template mining), parsed on threads instead of a process pool."""
+    def __init__(self, data_path):
+        super().__init__(data_path=str(data_path), mine_templates=False)
+
+    def iter_parsed(self, files, known_hashes=None, **kwargs):
+        return super().iter_parsed(files, known_hashes, process_workers=0)
+
+
+def write_log(log_dir, name, lines):
+    path = log_dir / name
+    path.write_text("".join(f"2024-05-01 10:{i // 60:02d}:{i % 60:02d} ERROR {line}\n" for i, line in enumerate(lines)))
+    return str(path)
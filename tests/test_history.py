@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+
+from src.history import HistoryManager
+
+
+def add_rollups(history, *timestamps):
+    conn = history._conn()
+    with conn:
+        for timestamp in timestamps:
+            history._rollup(conn, timestamp)
+
+
+def starts(rows):
+    return [row["start"] for row in rows]
+
+
+def test_timeseries_end_is_exclusive_for_days(history):
+    add_rollups(history, "2024-05-01T10:00:00", "2024-05-02T00:10:00", "2024-05-03T09:00:00")
+
+    rows = history.get_timeseries("day", start="2024-05-01T12:00", end="2024-05-02T00:00")
+
+    assert starts(rows) == ["2024-05-01"]
+
+
+def test_timeseries_end_is_exclusive_for_hours(history):
+    add_rollups(history, "2024-05-01T10:05:00", "2024-05-01T11:20:00", "2024-05-01T12:40:00")
+
+    rows = history.get_timeseries("hour", start="2024-05-01T10:30", end="2024-05-01T12:45")
+
+    assert starts(rows) == ["2024-05-01T10:00", "2024-05-01T11:00"]
+
+
+def test_group_commit_writer_returns_ids_in_order(history):
+    futures = [history.enqueue_analysis(f"error {i}", "answer", None, None, [], evaluate=False) for i in range(50)]
+
+    ids = [future.result(timeout=5) for future in futures]
+
+    assert ids == sorted(ids) and len(set(ids)) == 50
+    assert history.get_stats()["total_analyses"] == 50
+
+
+def test_pagination_is_stable_while_rows_are_inserted(history):
+    original = [history.save_analysis(f"error {i}", "answer", None, None, [], evaluate=False) for i in range(100)]
+    stop = threading.Event()
+
+    def insert():
+        while not stop.is_set():
+            history.enqueue_analysis("new error", "answer", None, None, [], evaluate=False).result(timeout=5)
+
+    writer = threading.Thread(target=insert)
+    writer.start()
+    try:
+        # The first page is read once rows are arriving; every later page follows the cursor
+        seen, before = [], None
+        page = history.get_history(limit=7)
+        while page:
+            seen += [row["id"] for row in page]
+            before = page[-1]["id"]
+            page = history.get_history(limit=7, before=before)
+    finally:
+        stop.set()
+        writer.join()
+
+    assert len(seen) == len(set(seen))
+    assert set(original) <= set(seen)
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_backfill_while_other_writers_are_active(tmp_path):
+    path = str(tmp_path / "history.db")
+    HistoryManager(path).close()
+    conn = sqlite3.connect(path)
+    with conn:
+        # A history written before rollups existed
+        conn.executemany(
+            "INSERT INTO analysis_history (timestamp, error_input, analysis_result, faithfulness) VALUES (?, ?, ?, ?)",
+            [(f"2024-05-0{1 + i % 3}T10:00:00", f"old error {i}", "answer", 0.5) for i in range(300)],
+        )
+        conn.execute("DELETE FROM history_rollups")
+    errors = []
+
+    def open_and_write():
+        try:
+            manager = HistoryManager(path)
+            for future in [manager.enqueue_analysis("new error", "answer", 1.0, None, [], evaluate=False)
+                           for _ in range(20)]:
+                future.result(timeout=10)
+            manager.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_and_write) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    rows = conn.execute("SELECT COUNT(*), SUM(faithfulness) FROM analysis_history").fetchone()
+    total = conn.execute("SELECT count, faith_sum FROM history_rollups WHERE bucket = 'total'").fetchone()
+    days = conn.execute("SELECT SUM(count) FROM history_rollups WHERE bucket = 'day'").fetchone()
+    assert rows == (420, 270.0)
+    assert total == rows and days[0] == 420
@@ -0,0 +1,91 @@
+import os
+
+from langchain_core.documents import Document
+
+from src.ingest import IncrementalIndexer, assign_chunk_ids
+from src.keyword_index import KeywordIndex
+from fakes import FakeVectorStore, ThreadedLoader, write_log
+
+
+def make_indexer(tmp_path, log_dir, vectorstore):
+    return IncrementalIndexer(vectorstore, loader=ThreadedLoader(log_dir),
+                              manifest_path=str(tmp_path / "manifest.json"),
+                              keyword_index=KeywordIndex(str(tmp_path / "keyword_index.db")))
+
+
+def record(i):
+    return f"request {i} failed with ORA-{i:05d} after retrying the connection pool " + "x" * 300
+
+
+def test_chunk_ids_are_deterministic():
+    chunks = [Document(page_content=text) for text in ("a", "b", "a")]
+
+    ids = assign_chunk_ids("app.log", chunks)
+
+    assert ids == assign_chunk_ids("app.log", [Document(page_content=t) for t in ("a", "b", "a")])
+    assert ids[2] == f"{ids[0]}-1"  # Repeated text in one source gets an occurrence suffix
+    assert ids[0] not in assign_chunk_ids("other.log", [Document(page_content="a")])
+
+
+def test_unchanged_files_are_not_reindexed(tmp_path, log_dir):
+    write_log(log_dir, "a.log", [record(i) for i in range(20)])
+    vectorstore = FakeVectorStore()
+    first = make_indexer(tmp_path, log_dir, vectorstore).sync()
+    written = vectorstore.written
+
+    report = make_indexer(tmp_path, log_dir, vectorstore).sync()
+
+    assert first["added"] and first["chunks_added"] == vectorstore._collection.count()
+    assert report["added"] == report["updated"] == report["removed"] == []
+    assert report["unchanged"] == 1 and report["chunks_added"] == report["chunks_removed"] == 0
+    assert vectorstore.written == written
+
+
+def test_touched_file_with_same_content_is_not_reindexed(tmp_path, log_dir):
+    path = write_log(log_dir, "a.log", [record(i) for i in range(5)])
+    vectorstore = FakeVectorStore()
+    make_indexer(tmp_path, log_dir, vectorstore).sync()
+    written = vectorstore.written
+    os.utime(path, (1, 1))
+
+    report = make_indexer(tmp_path, log_dir, vectorstore).sync()
+
+    assert report["unchanged"] == 1 and report["chunks_added"] == 0
+    assert vectorstore.written == written
+
+
+def test_changed_file_replaces_only_its_own_chunks(tmp_path, log_dir):
+    write_log(log_dir, "a.log", [record(i) for i in range(20)])
+    b_path = write_log(log_dir, "b.log", [record(100 + i) for i in range(20)])
+    vectorstore = FakeVectorStore()
+    indexer = make_indexer(tmp_path, log_dir, vectorstore)
+    indexer.sync()
+    before = {source: set(entry["chunk_ids"]) for source, entry in indexer.manifest.sources.items()}
+
+    # The log grew: only its last chunk changes
+    write_log(log_dir, "b.log", [record(100 + i) for i in range(21)])
+    indexer = make_indexer(tmp_path, log_dir, vectorstore)
+    report = indexer.sync()
+    after = {source: set(entry["chunk_ids"]) for source, entry in indexer.manifest.sources.items()}
+
+    a_path = str(log_dir / "a.log")
+    assert report["updated"] == [b_path] and report["unchanged"] == 1
+    assert after[a_path] == before[a_path]
+    assert len(before[b_path] - after[b_path]) == report["chunks_removed"] <= 1
+    assert len(after[b_path] - before[b_path]) == report["chunks_added"] <= 2
+    assert set(vectorstore._collection.rows) == after[a_path] | after[b_path]
+    assert indexer.keyword_index.count() == len(after[a_path] | after[b_path])
+
+
+def test_deleted_file_removes_its_chunks(tmp_path, log_dir):
+    write_log(log_dir, "a.log", [record(i) for i in range(5)])
+    b_path = write_log(log_dir, "b.log", [record(100 + i) for i in range(5)])
+    vectorstore = FakeVectorStore()
+    make_indexer(tmp_path, log_dir, vectorstore).sync()
+    os.remove(b_path)
+
+    indexer = make_indexer(tmp_path, log_dir, vectorstore)
+    report = indexer.sync()
+
+    assert report["removed"] == [b_path]
+    assert set(vectorstore._collection.rows) == set(indexer.manifest.sources[str(log_dir / "a.log")]["chunk_ids"])
@@ -0,0 +1,26 @@
+from src.reasoning import ReasoningSplitter, join_output, split_output
+
+
+def stream(tokens):
+    splitter = ReasoningSplitter()
+    events = [event for token in tokens for event in splitter.feed(token)] + splitter.flush()
+    parts = {"reasoning": "", "answer": ""}
+    for event, text in events:
+        parts[event] += text
+    return parts
+
+
+def test_tags_split_across_tokens():
+    parts = stream(["<th", "ink>the driver ", "is stale</", "think>\n\nRestart ", "the session"])
+
+    assert parts == {"reasoning": "the driver is stale", "answer": "Restart the session"}
+
+
+def test_output_without_reasoning_is_all_answer():
+    assert stream(["Restart ", "the session"]) == {"reasoning": "", "answer": "Restart the session"}
+
+
+def test_split_output_reverses_join_output():
+    assert split_output(join_output("the driver is stale", "Restart the session")) == \
+        ("the driver is stale", "Restart the session")
+    assert split_output("Restart the session") == ("", "Restart the session")
@@ -0,0 +1,168 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import src.sync as sync
+from src.vector_store import VectorStoreManager
+from fakes import FakeVectorStore, ThreadedLoader, write_log
+
+
+class FakeAnalyzer:
+    def __init__(self, vectorstore, keyword_index=None, cache=None):
+        self.vectorstore = vectorstore
+        self.keyword_index = keyword_index
+
+
+@pytest.fixture
+def collections(tmp_path, log_dir, monkeypatch):
+    """Generations live in in-memory collections; keyword indexes, manifests and the signal are real files."""
+    stores = {}
+
+    class Manager:
+        copy_collection = staticmethod(VectorStoreManager.copy_collection)
+
+        def open_collection(self, name):
+            if name not in stores:
+                stores[name] = FakeVectorStore(on_delete=lambda _: stores.pop(name, None))
+            return stores[name]
+
+    monkeypatch.setattr(sync, "VectorStoreManager", Manager)
+    monkeypatch.setattr(sync, "KEYWORD_INDEX_PATH", str(tmp_path / "keyword_index.db"))
+    monkeypatch.setattr(sync, "MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(sync, "LogLoader", lambda: ThreadedLoader(log_dir))
+    monkeypatch.setattr(sync, "BugAnalyzer", FakeAnalyzer)
+    monkeypatch.setattr(sync, "DatabaseInspector", lambda **kwargs: None)
+    monkeypatch.setattr(sync, "ACK_POLL_INTERVAL", 0.01)
+    return stores
+
+
+@pytest.fixture
+def signal(tmp_path):
+    return sync.GenerationSignal(str(tmp_path / "index_generation.json"))
+
+
+def chunk_count(generation):
+    return generation.files.vectorstore._collection.count()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_first_sync_builds_and_publishes_a_generation(collections, log_dir, signal):
+    write_log(log_dir, "a.log", ["ORA-00942 table or view does not exist"])
+    syncer = sync.IndexSyncManager(signal=signal)
+
+    syncer.run()
+
+    assert syncer.current.number == 1
+    assert chunk_count(syncer.current) == syncer.current.files.keyword_index.count() == 1
+    assert signal.read()["number"] == 1
+    assert signal.read()["artifacts"] == syncer.current.files.artifacts
+
+
+def test_sync_without_changes_keeps_the_generation(collections, log_dir, signal):
+    write_log(log_dir, "a.log", ["ORA-00942 table or view does not exist"])
+    syncer = sync.IndexSyncManager(signal=signal)
+    syncer.run()
+    first = syncer.current
+
+    syncer.run()
+
+    assert syncer.current is first
+    assert signal.read()["number"] == 1
+    assert set(collections) == {"error_logs_g1"}
+
+
+def test_swap_while_a_reader_holds_the_old_generation(collections, log_dir, signal):
+    write_log(log_dir, "a.log", ["ORA-00942 table or view does not exist"])
+    syncer = sync.IndexSyncManager(signal=signal, drain_timeout=10)
+    syncer.run()
+    old = syncer.current
+    old_index = old.files.artifacts["keyword_index"]
+
+    write_log(log_dir, "b.log", ["HTTP 503 Service Unavailable from the gateway"])
+    with old.use():
+        worker = threading.Thread(target=syncer.run)
+        worker.start()
+        wait_for(lambda: syncer.current is not old)
+        # New requests get the new generation while the reader finishes on the old one, untouched
+        assert syncer.current.number == 2 and chunk_count(syncer.current) == 2
+        assert worker.is_alive()
+        assert chunk_count(old) == 1 and "error_logs_g1" in collections and os.path.exists(old_index)
+    worker.join(5)
+
+    assert not worker.is_alive()
+    assert set(collections) == {"error_logs_g2"}
+    assert not os.path.exists(old_index)
+    assert syncer.current.files.keyword_index.count() == 2
+
+
+def test_follower_serves_the_published_generation(collections, log_dir, signal):
+    write_log(log_dir, "a.log", ["ORA-00942 table or view does not exist"])
+    publisher = sync.IndexSyncManager(signal=signal)
+    publisher.run()
+    follower = sync.IndexSyncManager(signal=signal)
+
+    assert follower.reload()
+
+    assert follower.current.number == 1 and chunk_count(follower.current) == 1
+    assert not follower.reload()  # Already serving the latest one
+
+
+def test_old_generation_waits_for_other_processes_to_acknowledge(collections, log_dir, signal):
+    write_log(log_dir, "a.log", ["ORA-00942 table or view does not exist"])
+    syncer = sync.IndexSyncManager(signal=signal, drain_timeout=10)
+    syncer.run()
+    reader = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        ack_path = f"{signal.path}.{reader.pid}.ack"
+        with open(ack_path, "w", encoding="utf-8") as f:
+            f.write(f'{{"pid": {reader.pid}, "oldest": 1}}')
+
+        write_log(log_dir, "b.log", ["HTTP 503 Service Unavailable from the gateway"])
+        worker = threading.Thread(target=syncer.run)
+        worker.start()
+        wait_for(lambda: syncer.current.number == 2)
+        time.sleep(0.1)
+        assert worker.is_alive() and "error_logs_g1" in collections
+
+        # The other worker switched to generation 2
+        with open(ack_path, "w", encoding="utf-8") as f:
+            f.write(f'{{"pid": {reader.pid}, "oldest": 2}}')
+        worker.join(5)
+        assert not worker.is_alive()
+        assert set(collections) == {"error_logs_g2"}
+    finally:
+        reader.kill()
+        reader.wait()
+
+
+def test_acknowledgements_of_dead_processes_are_ignored(signal):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    ack_path = f"{signal.path}.{dead.pid}.ack"
+    with open(ack_path, "w", encoding="utf-8") as f:
+        f.write(f'{{"pid": {dead.pid}, "oldest": 1}}')
+    signal.ack(1)  # Our own acknowledgement never blocks us
+
+    assert signal.readers(1) == []
+    assert not os.path.exists(ack_path)
+
+
+@pytest.mark.skipif(sync.fcntl is None, reason="no file locks on this platform")
+def test_only_one_process_syncs_at_a_time(signal):
+    with signal.lock() as locked:
+        assert locked
+        # flock conflicts between separate opens of the file, as between processes
+        with signal.lock(blocking=False) as other:
+            assert other is False
+    with signal.lock(blocking=False) as locked:
+        assert locked
@@ -1,11 +1,14 @@
 import streamlit as st
 import os
-from src.loader import LogLoader
-from src.vector_store import VectorStoreManager
-from src.model import BugAnalyzer
-from src.inspector import DatabaseInspector
-from src.evaluator import RAGASEvaluator
+import time
+from collections import OrderedDict
+from src.sync import IndexSyncManager
+from src.evaluator import EvaluationWorker
 from src.history import HistoryManager
+from src.analysis_cache import AnalysisCache
+from src.registry import get_embeddings, get_feedback_prior
+from src.fingerprint import fingerprint
+from src.config import UI_RETRIEVAL_CACHE_SIZE, UI_RETRIEVAL_MIN_CHARS
 import pandas as pd
 
 # Page configuration
@@ -27,25 +30,87 @@ st.markdown("""
 # Helper function to initialize components
 @st.cache_resource
 def get_components():
-    loader = LogLoader()
-    chunks = loader.load()
-    vs_manager = VectorStoreManager()
-    vectorstore = vs_manager.get_vectorstore(chunks if chunks else None)
-    analyzer = BugAnalyzer(vectorstore, chunks=chunks)
-    inspector = DatabaseInspector()
-    evaluator = RAGASEvaluator()
+    # Indexes new/changed sources into a new index generation (the analysis cache is
+    # invalidated when the index changed) and follows the ones an API publishes
+    syncer = IndexSyncManager(cache=AnalysisCache(embed_fn=get_embeddings().embed_query))
+    syncer.run()
+    syncer.watch()
     history = HistoryManager()
-    return analyzer, inspector, evaluator, vs_manager, history
+    # Quality scoring runs in the background, the user never waits for the judge model
+    evaluator = EvaluationWorker(history).start()
+    return syncer, evaluator, history
+
+class RetrievalMemo:
+    """
+    Per-session LRU of retrieval results keyed by (index generation, error fingerprint),
+    shared by the "Analizar" button and the evidence column: Streamlit reruns the whole
+    script on every click, and each retrieval runs BM25, Chroma and the cross-encoder.
+    """
+    def __init__(self, max_entries=UI_RETRIEVAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, generation, error_input):
+        return generation, fingerprint(error_input)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, analyzer, generation, error_input):
+        """Returns (docs, hit)."""
+        key = self.key(generation, error_input)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key], True
+        docs = analyzer.retrieve(error_input)
+        self.entries[key] = docs
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.misses += 1
+        return docs, False
+
+def retrieval_memo():
+    if "retrieval_memo" not in st.session_state:
+        st.session_state["retrieval_memo"] = RetrievalMemo()
+    return st.session_state["retrieval_memo"]
+
+def rate_analysis(history, analysis_id, rating):
+    """Feedback button callback: credits the rating to the chunks the analysis was built on."""
+    history.save_feedback(analysis_id, rating)
+    get_feedback_prior().invalidate()
+    st.session_state["rated_analysis"] = (analysis_id, rating)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def index_stats(_inspector):
+    """Per-source stats of the index; every tab runs on each rerun, so they are refreshed once a minute."""
+    return _inspector.source_stats()
+
+def fmt_score(value):
+    """Formats a quality score, which is empty until the evaluation worker has scored the analysis."""
+    return f"{value*100:.1f}%" if value is not None else "⏳ pendiente"
 
 def main():
     st.title("🚀 Smart Error Debugger")
     st.subheader("QA AI Engineer Assistant - Advanced RAG & Evaluation")
 
     try:
-        analyzer, inspector, evaluator, vs_manager, history = get_components()
+        syncer, evaluator, history = get_components()
     except Exception as e:
         st.error(f"Error al inicializar el sistema: {e}")
         return
+    # The index generation is pinned for this run of the script, so a sync never drops it
+    # mid-analysis (Streamlit stops an outdated run by raising, the release always happens)
+    with syncer.current.use() as current:
+        render(syncer, current, evaluator, history)
+
+def render(syncer, current, evaluator, history):
+    analyzer, inspector = current.analyzer, current.inspector
+    # Session retrieval memos are keyed by the index generation
+    generation = current.number
+    memo = retrieval_memo()
 
     # Sidebar
     with st.sidebar:
@@ -63,12 +128,13 @@ def main():
 
         # DB Metrics
         st.divider()
-        data = inspector.vectorstore.get()
-        st.metric("Vectores en Memoria", len(data.get('ids', [])))
+        st.metric("Vectores en Memoria", inspector.count())
         
         if st.button("🔄 Sincronizar Todo"):
-            st.cache_resource.clear()
-            st.rerun()
+            # In the background: this run pins the generation the sync will drain
+            syncer.start()
+        if syncer.status()["state"] == "running":
+            st.caption("⏳ Sincronización en curso; la nueva versión del índice se usará al terminar.")
 
     # Main Interface
     # Tabs for different views
@@ -88,80 +154,116 @@ def main():
 
             if st.button("🚀 Analizar"):
                 if error_input.strip():
-                    with st.spinner("DeepSeek está analizando e inspeccionando el historial..."):
-                        # 1. Retrieval
-                        docs = analyzer.qa_chain.retriever.invoke(error_input)
-                        context_text = [d.page_content for d in docs]
-                        
-                        # 2. Generation
+                    started = time.perf_counter()
+                    cached = analyzer.cache.get(error_input)
+                    st.markdown("---")
+                    st.markdown("### 📝 REPORTE DE ANÁLISIS")
+                    reasoning_box = st.expander("🤔 Ver Razonamiento Interno")
+                    reasoning_placeholder = reasoning_box.empty()
+                    answer_placeholder = st.empty()
+
+                    if cached:
+                        # Recurring error: served from the analysis cache (no retrieval, no LLM)
+                        st.caption(f"⚡ Resultado en caché ({'idéntico' if cached['match'] == 'exact' else 'similar'})")
+                        result, context_text, chunk_ids = cached["result"], cached["context"], cached["chunk_ids"]
+                        reasoning, answer = analyzer.split_output(result)
+                        if reasoning:
+                            reasoning_placeholder.write(reasoning)
+                        answer_placeholder.info(answer)
+                    else:
+                        with st.spinner("DeepSeek está inspeccionando el historial..."):
+                            # 1. Retrieval (reused if the evidence column already ran it for this input)
+                            docs, memo_hit = memo.get(analyzer, generation, error_input)
+                            context_text = [d.page_content for d in docs]
+                        if memo_hit:
+                            st.caption("♻️ Evidencias reutilizadas de esta sesión")
+
+                        # 2. Generation (streamed)
                         # Optimization: Use already retrieved docs to avoid re-running Reranker
-                        with st.spinner("Generando solución..."):
-                            raw_response = analyzer.qa_chain.combine_documents_chain.invoke({
-                                "input_documents": docs,
-                                "question": error_input
-                            })
-                            # Handle different output formats
-                            result = raw_response.get("output_text", raw_response) if isinstance(raw_response, dict) else raw_response
-                            response = {"result": result}
-                        
-                        # 3. Evaluation (RAGAS)
-                        metrics = evaluator.evaluate_response(error_input, result, context_text)
-                        
-                        # 4. Save to History
-                        history.save_analysis(
-                            error_input, 
-                            result, 
-                            metrics['faithfulness'], 
-                            metrics['relevancy'], 
-                            context_text
-                        )
-                        
-                        st.markdown("---")
-                        
-                        # Dashboard de Calidad (QA de la IA)
-                        q_col1, q_col2, q_col3 = st.columns(3)
-                        with q_col1:
-                            st.metric("Faithfulness", f"{metrics['faithfulness']*100:.1f}%", help="¿La IA se inventa cosas o usa los logs?")
-                        with q_col2:
-                            st.metric("Relevancy", f"{metrics['relevancy']*100:.1f}%", help="¿La respuesta es útil para el error?")
-                        with q_col3:
-                            st.success("Analizado con DeepSeek-R1")
-
-                        st.markdown("### 📝 REPORTE DE ANÁLISIS")
-                        if "</thought>" in result:
-                            parts = result.split("</thought>")
-                            st.info(parts[1].strip())
-                            with st.expander("🤔 Ver Razonamiento Interno"):
-                                st.write(parts[0].replace("<thought>", "").strip())
-                        else:
-                            st.success(result)
-                        
-                        # 5. Feedback Loop
-                        st.divider()
-                        st.write("¿Fue útil esta solución?")
-                        f_col1, f_col2 = st.columns([1, 5])
-                        with f_col1:
-                            if st.button("👍 Sí"):
-                                st.toast("¡Gracias! Feedback registrado para mejorar el ranking.")
-                        with f_col2:
-                             if st.button("👎 No"):
-                                 st.toast("Entendido, ajustaremos el contexto.")
+                        answer_placeholder.info("Generando solución...")
+                        reasoning, answer = "", ""
+                        chunk_ids = [d.metadata["chunk_id"] for d in docs if d.metadata.get("chunk_id")]
+                        for event, data in analyzer.stream(error_input, docs):
+                            if event == "reasoning":
+                                reasoning += data
+                                reasoning_placeholder.write(reasoning)
+                            elif event == "answer":
+                                answer += data
+                                answer_placeholder.info(answer)
+                            elif event == "prompt":
+                                reasoning_box.caption(f"Prompt: ~{data['prompt_tokens']} tokens "
+                                                      f"({data['merged']} fragmentos fusionados, "
+                                                      f"{data['duplicates']} duplicados, {data['dropped']} descartados)")
+                        result = analyzer.join_output(reasoning, answer)
+
+                    # 3. Evaluation (RAGAS): queued for the background worker
+                    metrics = cached["metrics"] if cached and cached["metrics"] else \
+                        {"faithfulness": None, "relevancy": None}
+                    if not cached:
+                        analyzer.cache.put(error_input, result, context_text, {}, chunk_ids)
+
+                    # 4. Save to History
+                    st.session_state["last_analysis_id"] = history.save_analysis(
+                        error_input, 
+                        result, 
+                        metrics['faithfulness'], 
+                        metrics['relevancy'], 
+                        context_text,
+                        latency_ms=(time.perf_counter() - started) * 1000,
+                        cached=bool(cached),
+                        evaluate=not cached,
+                        chunk_ids=chunk_ids
+                    )
+                    evaluator.notify()
+
+                    # Dashboard de Calidad (QA de la IA)
+                    q_col1, q_col2, q_col3 = st.columns(3)
+                    with q_col1:
+                        st.metric("Faithfulness", fmt_score(metrics['faithfulness']), help="¿La IA se inventa cosas o usa los logs?")
+                    with q_col2:
+                        st.metric("Relevancy", fmt_score(metrics['relevancy']), help="¿La respuesta es útil para el error?")
+                    with q_col3:
+                        st.success("Analizado con DeepSeek-R1")
+
+            # 5. Feedback Loop (outside the button branch: voting reruns the script)
+            analysis_id = st.session_state.get("last_analysis_id")
+            if analysis_id:
+                st.divider()
+                rated = st.session_state.pop("rated_analysis", None)
+                if rated and rated[0] == analysis_id:
+                    st.toast("¡Gracias! Feedback registrado para mejorar el ranking." if rated[1] > 0 else
+                             "Entendido, ajustaremos el contexto.")
+                st.write("¿Fue útil esta solución?")
+                f_col1, f_col2 = st.columns([1, 5])
+                with f_col1:
+                    st.button("👍 Sí", on_click=rate_analysis, args=(history, analysis_id, 1))
+                with f_col2:
+                    st.button("👎 No", on_click=rate_analysis, args=(history, analysis_id, -1))
 
         with col2:
             st.markdown("### 📚 Contexto & Evidencias")
-            if error_input.strip():
-                docs = analyzer.qa_chain.retriever.invoke(error_input)
+            last_input = st.session_state.get("evidence_input")
+            st.session_state["evidence_input"] = error_input
+            if len(error_input.strip()) < UI_RETRIEVAL_MIN_CHARS:
+                st.info("Escribe algo para ver los documentos relacionados.")
+            else:
+                status = st.empty()
+                if error_input != last_input and memo.key(generation, error_input) not in memo:
+                    status.caption("🔎 Buscando evidencias...")
+                started = time.perf_counter()
+                docs, memo_hit = memo.get(analyzer, generation, error_input)
+                status.caption("⚡ Evidencias en caché de sesión" if memo_hit else
+                               f"🔎 Evidencias recuperadas en {(time.perf_counter() - started) * 1000:.0f} ms")
                 for i, doc in enumerate(docs):
                     source_name = os.path.basename(doc.metadata.get('source', 'External API'))
-                    rating = doc.metadata.get('rating', 0)
-                    with st.expander(f"📖 {source_name} (⭐ {rating})"):
+                    up, down = get_feedback_prior().votes(doc.metadata.get('chunk_id'))
+                    with st.expander(f"📖 {source_name} (👍 {up} · 👎 {down})"):
                         st.write(doc.page_content)
                         st.caption(f"Tipo: {doc.metadata.get('type', 'external')}")
-            else:
-                st.info("Escribe algo para ver los documentos relacionados.")
+                st.caption(f"Caché de sesión: {memo.hits} aciertos · {memo.misses} búsquedas")
 
     with tab_history:
-        hist_data = history.get_history()
+        hist_data = history.get_history(include_details=True)
         st.markdown("### 📊 Métricas de Rendimiento")
         stats = history.get_stats()
         
@@ -170,15 +272,19 @@ def main():
         m_col2.metric("Fidelidad Media", f"{stats['avg_faithfulness']*100:.1f}%")
         m_col3.metric("Relevancia Media", f"{stats['avg_relevancy']*100:.1f}%")
 
-        # Trend Chart
-        if hist_data:
-            df = pd.DataFrame(hist_data)
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df = df.sort_values('timestamp')
+        # Trend Chart (pre-aggregated rollups: constant cost whatever the history size)
+        bucket = st.radio("Agrupar por", ["day", "hour"], horizontal=True,
+                          format_func=lambda b: "Día" if b == "day" else "Hora")
+        series = history.get_timeseries(bucket=bucket)
+        if series:
+            df = pd.DataFrame(series)
+            df['start'] = pd.to_datetime(df['start'])
             
             st.markdown("#### Evolución de la Calidad")
-            chart_data = df.set_index('timestamp')[['faithfulness', 'relevancy']]
-            st.line_chart(chart_data)
+            chart_data = df.set_index('start')[['avg_faithfulness', 'avg_relevancy']]
+            st.line_chart(chart_data.rename(columns={'avg_faithfulness': 'faithfulness', 'avg_relevancy': 'relevancy'}))
+            st.markdown("#### Volumen y Caché")
+            st.bar_chart(df.set_index('start')[['count', 'cached']])
 
         st.divider()
         st.markdown("### 📜 Historial Reciente")
@@ -196,8 +302,8 @@ def main():
                     
                     st.markdown("---")
                     col_ev1, col_ev2, col_ev3 = st.columns(3)
-                    col_ev1.write(f"**Faithfulness:** {item['faithfulness']*100:.1f}%")
-                    col_ev2.write(f"**Relevancy:** {item['relevancy']*100:.1f}%")
+                    col_ev1.write(f"**Faithfulness:** {fmt_score(item['faithfulness'])}")
+                    col_ev2.write(f"**Relevancy:** {fmt_score(item['relevancy'])}")
                     
                     # Markdown Export
                     md_report = f"""# Reporte de Error - {item['timestamp']}
@@ -209,8 +315,8 @@ def main():
 
 ---
 **Métricas de Calidad:**
-- Faithfulness: {item['faithfulness']*100:.1f}%
-- Relevancy: {item['relevancy']*100:.1f}%
+- Faithfulness: {fmt_score(item['faithfulness'])}
+- Relevancy: {fmt_score(item['relevancy'])}
 """
                     st.download_button(
                         label="📥 Descargar Reporte (MD)",
@@ -257,6 +363,26 @@ def main():
             - `.json`: Casos de éxito (formato específico).
             """)
 
+        st.divider()
+        st.markdown("### 🗂️ Contenido del Índice")
+        stats = index_stats(inspector)
+        if not stats:
+            st.info("El índice está vacío.")
+        else:
+            st.dataframe(pd.DataFrame(stats).assign(mb=lambda df: (df["bytes"] / 2**20).round(2)).drop(columns="bytes"),
+                         use_container_width=True, hide_index=True)
+            b_col1, b_col2, b_col3 = st.columns([2, 1, 1])
+            sources = sorted({s["source"] for s in stats if s["source"]})
+            types = sorted({s["type"] for s in stats if s["type"]})
+            browse_source = b_col1.selectbox("Fuente", [None] + sources, format_func=lambda s: s or "Todas")
+            browse_type = b_col2.selectbox("Tipo", [None] + types, format_func=lambda t: t or "Todos")
+            browse_page = b_col3.number_input("Página", min_value=1, value=1)
+            page_size = 20
+            for chunk in inspector.browse(offset=(browse_page - 1) * page_size, limit=page_size,
+                                          source=browse_source, doc_type=browse_type):
+                with st.expander(f"🔹 {os.path.basename(chunk['source'] or 'N/A')} · {chunk['id'][:12]} · {chunk['chars']} car."):
+                    st.text(chunk["content"])
+
         st.divider()
         st.markdown("### 🔌 Configuración de Fuentes Externas")
         